@@ -0,0 +1,219 @@
+from collections import deque
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+from kubernetes.stream import ws_client
+from kubernetes.stream.stream import _websocket_request
+from k8s.exec_io import BinaryWSClient
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from utils.environment import env
+import asyncio
+import socket
+import threading
+import time
+import weakref
+
+# Every exec session of AsyncPod keeps its websocket open for the whole command,
+# so the async clients need far more connections than aiohttp default of 100.
+ASYNC_CONNECTION_POOL_MAXSIZE: int = 1000
+# Number of pods expected to talk to the API server at once, unless told otherwise.
+API_EXPECTED_CONCURRENCY: int = 16
+# A pod may hold a watch while other requests of it (or of other threads) are sent.
+API_CONNECTIONS_PER_POD: int = 2
+# (connect, read) seconds of regular requests, streamed ones (watches) set their own timeouts.
+API_REQUEST_TIMEOUT: tuple = (10, 60)
+API_RETRIES: int = 3
+API_RETRY_BACKOFF: float = 0.2
+API_RETRY_STATUSES: tuple = (429, 500, 502, 503, 504)
+# Latencies of this many most recent requests are kept for percentiles.
+API_LATENCY_SAMPLES: int = 10000
+
+_local = threading.local()
+_async_apis = weakref.WeakKeyDictionary()
+
+class ApiMetrics:
+    """
+    Request latencies and connection usage of a MeteredApiClient, safe to update from many threads.
+    """
+
+    def __init__(self):
+        self.requests: int = 0
+        self.errors: int = 0
+        self.in_flight: int = 0
+        self.peak_in_flight: int = 0
+        self.latencies: deque = deque(maxlen=API_LATENCY_SAMPLES)
+        self._lock: threading.Lock = threading.Lock()
+
+    def started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += int(failed)
+            self.latencies.append(seconds)
+
+    def latency(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {"p50_seconds": 0.0, "p95_seconds": 0.0, "max_seconds": 0.0}
+        return {"p50_seconds": latencies[len(latencies) // 2], "p95_seconds": latencies[int(len(latencies) * 0.95)],
+                "max_seconds": latencies[-1]}
+
+
+class MeteredApiClient(client.ApiClient):
+    """
+    ApiClient applying default timeout to regular requests and recording their latency
+    in `metrics`. Like ApiClient it can be shared by threads, except for exec streams
+    (see get_stream_api).
+    """
+
+    def __init__(self, configuration: client.Configuration = None, request_timeout: tuple = API_REQUEST_TIMEOUT):
+        super().__init__(configuration=configuration)
+        self.request_timeout: tuple = request_timeout
+        self.metrics: ApiMetrics = ApiMetrics()
+
+    def request(self, method, url, query_params=None, headers=None, post_params=None, body=None,
+                _preload_content=True, _request_timeout=None):
+        if _request_timeout is None and _preload_content:
+            _request_timeout = self.request_timeout
+        self.metrics.started()
+        start = time.monotonic()
+        failed = True
+        try:
+            response = super().request(method, url, query_params, headers, post_params, body,
+                                       _preload_content, _request_timeout)
+            failed = False
+            return response
+        finally:
+            self.metrics.finished(time.monotonic() - start, failed)
+
+    def pool_usage(self) -> dict:
+        """
+        Returns connection pool usage summed over hosts: `maxsize` of the pools, connections
+        `opened` so far (more than `maxsize` means connections were discarded as the pool
+        was full) and `idle` ones kept alive for reuse.
+        """
+        pool_manager = self.rest_client.pool_manager
+        usage = {"pools": 0, "maxsize": 0, "opened": 0, "idle": 0}
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            usage["pools"] += 1
+            usage["maxsize"] += pool.pool.maxsize if pool.pool is not None else 0
+            usage["opened"] += pool.num_connections
+            usage["idle"] += sum(1 for connection in list(pool.pool.queue) if connection is not None) \
+                if pool.pool is not None else 0
+        return usage
+
+    def metrics_snapshot(self) -> dict:
+        return {"requests": self.metrics.requests, "errors": self.metrics.errors,
+                "peak_in_flight": self.metrics.peak_in_flight, "latency": self.metrics.latency(),
+                "pool": self.pool_usage()}
+
+
+def create_api(expected_concurrency: int = API_EXPECTED_CONCURRENCY, configuration: client.Configuration = None,
+               request_timeout: tuple = API_REQUEST_TIMEOUT, retries: int = API_RETRIES) -> client.CoreV1Api:
+    """
+    Creates CoreV1Api to be shared as `env["kubernetes"]["api"]` by pods working concurrently.
+    Its connection pool is sized for `expected_concurrency` pods, so requests don't wait for
+    a free connection nor open throwaway ones, and connections are kept alive with TCP
+    keepalive. Idempotent requests failing on connection or with API_RETRY_STATUSES are
+    retried `retries` times with backoff. `configuration` defaults to the loaded kube config.
+    Metrics are available through api_metrics.
+    """
+    configuration = configuration if configuration is not None else client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize or 0,
+                                                 expected_concurrency * API_CONNECTIONS_PER_POD)
+    configuration.retries = Retry(total=retries, backoff_factor=API_RETRY_BACKOFF, status_forcelist=API_RETRY_STATUSES,
+                                  raise_on_status=False)
+    api_client = MeteredApiClient(configuration, request_timeout)
+    api_client.rest_client.pool_manager.connection_pool_kw["socket_options"] = \
+        HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    return client.CoreV1Api(api_client)
+
+
+def api_metrics() -> dict:
+    """
+    Returns request count, errors, latency percentiles and pool usage of `env["kubernetes"]["api"]`,
+    empty dict when it wasn't created with create_api.
+    """
+    api_client = env["kubernetes"]["api"].api_client
+    return api_client.metrics_snapshot() if isinstance(api_client, MeteredApiClient) else {}
+
+
+def get_stream_api() -> client.CoreV1Api:
+    """
+    `kubernetes.stream.stream` temporarily replaces `request` method of the ApiClient
+    it is called with. Sharing one client between threads would make regular calls
+    from other threads go through the websocket (and the other way around), so every
+    thread gets its own client for exec streams, built from configuration of the
+    shared `env["kubernetes"]["api"]`.
+    """
+    api_instance: client.CoreV1Api = env["kubernetes"]["api"]
+    if getattr(_local, "owner", None) is not api_instance:
+        api_client = client.ApiClient(configuration=api_instance.api_client.configuration)
+        _local.stream_api = client.CoreV1Api(api_client=api_client)
+        _local.owner = api_instance
+    return _local.stream_api
+
+def _websocket_call(configuration, _method, url, **kwargs) -> BinaryWSClient:
+    """
+    Replacement of `kubernetes.stream.ws_client.websocket_call`, creating BinaryWSClient
+    which doesn't keep its own copy of all received output.
+    """
+    url = ws_client.get_websocket_url(url, kwargs.get("query_params"))
+    try:
+        return BinaryWSClient(configuration, url, kwargs.get("headers"), capture_all=False)
+    except Exception as e:
+        raise ApiException(status=0, reason=str(e))
+
+def stream_exec(name: str, namespace: str, command: list, stdin: bool = False, container: str = None) -> BinaryWSClient:
+    """
+    Opens exec websocket to `container` of the pod (required when it has more than
+    one), like `kubernetes.stream.stream` with `_preload_content=False`, but returning BinaryWSClient.
+    """
+    return _websocket_request(_websocket_call, None, get_stream_api().connect_get_namespaced_pod_exec,
+                              name, namespace,
+                              command=command, container=container,
+                              stderr=True, stdin=stdin,
+                              stdout=True, tty=False, _preload_content=False)
+
+def _get_async_configuration():
+    # kubernetes_asyncio (with aiohttp) takes longer to import than the rest of
+    # pipelines together, so it is imported only when AsyncPod is used.
+    from kubernetes_asyncio import client as async_client
+    sync_configuration: client.Configuration = env["kubernetes"]["api"].api_client.configuration
+    configuration = async_client.Configuration()
+    for attribute in ["host", "api_key", "api_key_prefix", "ssl_ca_cert", "cert_file", "key_file",
+                      "verify_ssl", "proxy", "proxy_headers"]:
+        setattr(configuration, attribute, getattr(sync_configuration, attribute))
+    configuration.connection_pool_maxsize = ASYNC_CONNECTION_POOL_MAXSIZE
+    return configuration
+
+def get_async_apis() -> tuple:
+    """
+    Returns pair of kubernetes_asyncio CoreV1Api instances for the running event loop,
+    one for regular requests and one for websocket exec sessions. Both are configured
+    like the shared `env["kubernetes"]["api"]` and reused by every AsyncPod on the loop.
+    """
+    from kubernetes_asyncio import client as async_client
+    from kubernetes_asyncio.stream import WsApiClient
+    loop = asyncio.get_running_loop()
+    if loop not in _async_apis:
+        configuration = _get_async_configuration()
+        _async_apis[loop] = (async_client.CoreV1Api(async_client.ApiClient(configuration)),
+                             async_client.CoreV1Api(WsApiClient(configuration)))
+    return _async_apis[loop]
+
+async def close_async_apis() -> None:
+    """
+    Closes connections of clients returned by get_async_apis for the running event loop.
+    """
+    for api_instance in _async_apis.pop(asyncio.get_running_loop(), ()):
+        await api_instance.api_client.close()
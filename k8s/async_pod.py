@@ -0,0 +1,391 @@
+from kubernetes_asyncio import watch
+from kubernetes_asyncio.client.exceptions import ApiException
+from k8s.api import get_async_apis
+from k8s import teardown
+from k8s.exec_io import STDIN_END_MARKER, STDIN_CHUNK_SIZE, STDIN_CHANNEL, STDOUT_CHANNEL, STDERR_CHANNEL, ERROR_CHANNEL, \
+    OutputCapture, OutputSink, LineSplitter, stdin_command, parse_returncode
+from k8s.pod import PodBase, PodException, PodStartupException, PodStartupTimeoutException, ArtifactNotExistsException, \
+    pods_lock, RETRYABLE_API_STATUSES, WATCH_BACKOFF_INITIAL, WATCH_BACKOFF_MAX, COPY_FAILED_MARKER
+from utils.logger import Logger
+from utils.environment import env
+from utils import parallel
+import aiohttp
+import asyncio
+import base64
+import io
+import os
+import shlex
+import tarfile
+import time
+
+# Number of decoded frames or STDIN_CHUNK_SIZE blocks buffered between the event loop and
+# the worker thread creating or extracting an archive, so the slower side holds back the other.
+COPY_QUEUE_SIZE: int = 16
+
+
+class QueueReader(io.RawIOBase):
+    """
+    Read-only file object used from a worker thread, returning data put into its
+    bounded queue by the event loop until None is put. Lets `tarfile` in stream mode
+    extract an archive while it is being received.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(COPY_QUEUE_SIZE)
+        self._buffer: bytearray = bytearray()
+        self._eof: bool = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            self._fill()
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        return size
+
+    def drain(self) -> None:
+        """
+        Discards the rest of the data, so the event loop putting it is not blocked.
+        """
+        while not self._eof:
+            self._fill()
+            self._buffer.clear()
+
+    def _fill(self) -> None:
+        data = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop).result()
+        if data is None:
+            self._eof = True
+        else:
+            self._buffer += data
+
+
+class QueueWriter(io.RawIOBase):
+    """
+    Write-only file object used from a worker thread, putting written data into its
+    bounded queue in STDIN_CHUNK_SIZE blocks, followed by None once it is closed.
+    The event loop takes the blocks with `get` until it gets None, or gives up with
+    `abort`, after which writing raises BrokenPipeError.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(COPY_QUEUE_SIZE)
+        self._buffer: bytearray = bytearray()
+        self._aborted: bool = False
+        self._finished: bool = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._aborted:
+            raise BrokenPipeError("Exec session closed before all data was sent")
+        self._buffer += data
+        while len(self._buffer) >= STDIN_CHUNK_SIZE:
+            self._put(bytes(self._buffer[:STDIN_CHUNK_SIZE]))
+            del self._buffer[:STDIN_CHUNK_SIZE]
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer and not self._aborted:
+                self._put(bytes(self._buffer))
+            self._put(None)
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    async def get(self):
+        data = await self.queue.get()
+        self._finished = data is None
+        return data
+
+    async def abort(self) -> None:
+        self._aborted = True
+        while not self._finished:
+            await self.get()
+
+    def _put(self, data) -> None:
+        asyncio.run_coroutine_threadsafe(self.queue.put(data), self.loop).result()
+
+
+class AsyncPod(PodBase):
+    """
+    asyncio counterpart of Pod, so one event loop can drive many pod sessions
+    without a thread per pod:
+
+        async with AsyncPod("busybox") as pod:
+            result = await pod.exec("ls /etc", useLegacyShell=True)
+
+    Output and return values of its methods are the same as of Pod.
+    """
+
+    async def __aenter__(self):
+        await self.spawn()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.delete()
+
+    async def wait_for_running_status(self) -> None:
+        """
+        Same as Pod.wait_for_running_status, but not blocking the event loop.
+        """
+        if self._running:
+            return
+        api_instance, _ = get_async_apis()
+        deadline = time.monotonic() + self.startup_timeout
+        backoff = WATCH_BACKOFF_INITIAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PodStartupTimeoutException(
+                    f"{self.name} ({self.image}) didn't reach Running phase within {self.startup_timeout} seconds")
+            try:
+                pod_details = await api_instance.read_namespaced_pod_status(self.name, self.namespace)
+                if self._check_pod_state(pod_details):
+                    return
+                async with watch.Watch() as pod_watch:
+                    async for event in pod_watch.stream(api_instance.list_namespaced_pod, self.namespace,
+                                                        field_selector=f"metadata.name={self.name}",
+                                                        resource_version=pod_details.metadata.resource_version,
+                                                        timeout_seconds=max(1, int(remaining))):
+                        if event["type"] == "DELETED":
+                            raise PodStartupException(f"{self.name} ({self.image}) was deleted while waiting for it to start")
+                        if self._check_pod_state(event["object"]):
+                            return
+                backoff = WATCH_BACKOFF_INITIAL
+            except ApiException as e:
+                if e.status not in RETRYABLE_API_STATUSES:
+                    raise
+                await asyncio.sleep(min(backoff, max(0, deadline - time.monotonic())))
+                backoff = min(backoff * 2, WATCH_BACKOFF_MAX)
+
+    async def spawn(self) -> None:
+        api_instance, _ = get_async_apis()
+        await api_instance.create_namespaced_pod(namespace=self.namespace, body=self._pod)
+        teardown.register_namespace(self.namespace)
+        with pods_lock:
+            env["kubernetes"]["pods"].append(self.name)
+        try:
+            await self.wait_for_running_status()
+        except Exception:
+            # __aexit__ isn't called when __aenter__ fails, so nothing else would delete the pod
+            try:
+                await self.delete()
+            except ApiException as e:
+                Logger.warning(f"Deleting {self.name} which failed to start failed: {e.reason}")
+            raise
+
+        Logger.info(f"{self.name} spawned.")
+        self.print_pod_details()
+
+    async def delete(self) -> None:
+        api_instance, _ = get_async_apis()
+        if teardown.fast_teardown():
+            await api_instance.delete_namespaced_pod(self.name, self.namespace, grace_period_seconds=0)
+        else:
+            await api_instance.delete_namespaced_pod(self.name, self.namespace)
+        self._running = False
+        with pods_lock:
+            env["kubernetes"]["pods"].remove(self.name)
+        Logger.info(f"{self.name} deleted")
+
+    async def _open_exec(self, command: list, stdin: bool = False, container: str = None) -> aiohttp.ClientWebSocketResponse:
+        _, ws_api_instance = get_async_apis()
+        return await ws_api_instance.connect_get_namespaced_pod_exec(self.name, self.namespace,
+                                                                     command=command,
+                                                                     container=self._container_name(container),
+                                                                     stderr=True, stdin=stdin,
+                                                                     stdout=True, tty=False,
+                                                                     _preload_content=False)
+
+    async def _read_until_closed(self, ws: aiohttp.ClientWebSocketResponse, on_output) -> int:
+        """
+        Passes every stdout and stderr frame to `on_output(channel, data)` (awaited when
+        it is a coroutine function) until the remote command finishes, then returns its
+        return code.
+        """
+        error = ""
+        async with ws:
+            async for message in ws:
+                if message.type not in [aiohttp.WSMsgType.BINARY, aiohttp.WSMsgType.TEXT]:
+                    continue
+                data = message.data if isinstance(message.data, bytes) else message.data.encode("utf-8")
+                if len(data) < 2:
+                    continue
+                channel, data = data[0], data[1:]
+                if channel in [STDOUT_CHANNEL, STDERR_CHANNEL]:
+                    if asyncio.iscoroutinefunction(on_output):
+                        await on_output(channel, data)
+                    else:
+                        on_output(channel, data)
+                elif channel == ERROR_CHANNEL:
+                    error += data.decode("utf-8")
+        return parse_returncode(error)
+
+    async def _write_stdin(self, ws: aiohttp.ClientWebSocketResponse, archive: QueueWriter,
+                           archiving: asyncio.Future) -> None:
+        """
+        Sends blocks taken from `archive` base64 encoded as they arrive. Once `archiving`
+        writing them has succeeded, they are terminated with STDIN_END_MARKER line, so
+        remote side is expected to be wrapped with `stdin_command`.
+        """
+        while (chunk := await archive.get()) is not None:
+            await ws.send_bytes(bytes([STDIN_CHANNEL]) + base64.encodebytes(chunk))
+        await archiving
+        await ws.send_bytes(bytes([STDIN_CHANNEL]) + f"{STDIN_END_MARKER}\n".encode("utf-8"))
+
+    async def exec(self, command: str, silent: bool = False, useLegacyShell: bool = False, maxOutputCharacters: int = 10000,
+                   retention: str = "head", binary: bool = False, sink=None, container: str = None) -> dict:
+        """
+        Same as Pod.exec.
+        """
+        def _append_output(channel, data):
+            capture.append(channel, data)
+            if output_sink:
+                output_sink.write(channel, data)
+            if not silent:
+                self._log_lines(lines[channel].feed(data))
+
+        parallel.raise_if_cancelled()
+        await self.wait_for_running_status()
+        capture = OutputCapture(maxOutputCharacters, retention)
+        output_sink = OutputSink(sink) if sink is not None else None
+        lines = {STDOUT_CHANNEL: LineSplitter(), STDERR_CHANNEL: LineSplitter()}
+        final_command = ["sh" if useLegacyShell else "bash", "-c", command]
+        ws = await self._open_exec(final_command, container=container)
+        ret_val = await self._read_until_closed(ws, _append_output)
+        if output_sink:
+            output_sink.close()
+        if not silent:
+            for splitter in lines.values():
+                self._log_lines(splitter.flush())
+        return capture.result(ret_val, binary)
+
+    async def copy_file_from(self, source: str, destination: str, container: str = None) -> None:
+        """
+        Same as Pod.copy_file_from. Decoded frames are passed through a bounded queue to
+        `tarfile` extracting them in a worker thread while they are being received, so
+        memory usage doesn't depend on the size of the archive.
+        """
+        await self.wait_for_running_status()
+        quoted = shlex.quote(source)
+        ws = await self._open_exec(["sh", "-c", f'{{ cd "$(dirname {quoted})" && tar cf - "$(basename {quoted})" || '
+                                                f"echo {COPY_FAILED_MARKER} >&2; }} | gzip -c | base64"],
+                                   container=container)
+        archive = QueueReader(asyncio.get_running_loop())
+        errors = []
+        encoded = b""
+
+        def _extract() -> None:
+            try:
+                with tarfile.open(fileobj=archive, mode='r|*') as tar:
+                    tar.extractall(path=destination)
+            except tarfile.TarError as e:
+                errors.append(str(e).encode("utf-8"))
+            finally:
+                archive.drain()
+
+        async def _receive(channel, data) -> None:
+            nonlocal encoded
+            if channel != STDOUT_CHANNEL:
+                errors.append(data)
+                return
+            encoded += b"".join(data.split())
+            decodable_length = len(encoded) - len(encoded) % 4
+            if decodable_length:
+                await archive.queue.put(base64.b64decode(encoded[:decodable_length]))
+                encoded = encoded[decodable_length:]
+
+        extraction = asyncio.ensure_future(asyncio.to_thread(_extract))
+        try:
+            ret_val = await self._read_until_closed(ws, _receive)
+            if encoded:
+                await archive.queue.put(base64.b64decode(encoded))
+        finally:
+            await archive.queue.put(None)
+            await extraction
+        stderr = b''.join(errors).decode('utf-8', 'replace')
+        if ret_val != 0 or COPY_FAILED_MARKER in stderr:
+            raise PodException(f"Copying {source} from {self.name} failed: {stderr.replace(COPY_FAILED_MARKER, '').strip()}")
+
+    async def copy_file_to(self, source: str, destination: str, container: str = None) -> None:
+        """
+        Same as Pod.copy_file_to. Gzipped archive is created in a worker thread and its
+        blocks are sent as they are written, so memory usage doesn't depend on the size
+        of copied files.
+        """
+        def _archive() -> None:
+            try:
+                with tarfile.open(fileobj=archive, mode='w|gz') as tar:
+                    tar.add(source, arcname=os.path.basename(source))
+            finally:
+                archive.close()
+
+        await self.wait_for_running_status()
+        quoted = shlex.quote(destination)
+        ws = await self._open_exec(["sh", "-c", f"mkdir -p {quoted} && " +
+                                    stdin_command(f"tar zxf - --directory {quoted}")], stdin=True,
+                                   container=container)
+        archive = QueueWriter(asyncio.get_running_loop())
+        archiving = asyncio.ensure_future(asyncio.to_thread(_archive))
+        try:
+            await self._write_stdin(ws, archive, archiving)
+        except BaseException:
+            # remote tar must not extract a truncated archive, so it doesn't get the end marker
+            await archive.abort()
+            await asyncio.gather(archiving, return_exceptions=True)
+            await ws.close()
+            raise
+        errors = []
+        ret_val = await self._read_until_closed(ws, lambda channel, data: errors.append(data))
+        if ret_val != 0:
+            raise PodException(f"Copying {source} to {self.name} failed: {b''.join(errors).decode('utf-8', 'replace')}")
+
+    async def archive_artifact(self, path, container: str = None) -> None:
+        """
+        Same as Pod.archive_artifact.
+        """
+        artifacts_dir_path: str = env["general"]["artifacts_path"]
+        paths: list = [path] if isinstance(path, str) else list(path)
+
+        stats = await self.stat_many(paths, container)
+        for path in paths:
+            if not stats[path]["exists"]:
+                raise ArtifactNotExistsException(
+                    f"Attempted to create an artifact from {path} in {self.name} ({self.image}) which doesn't exist")
+        if not os.path.exists(artifacts_dir_path):
+            os.mkdir(artifacts_dir_path)
+
+        for path in paths:
+            await self.copy_file_from(path, artifacts_dir_path, container)
+
+    async def stat_many(self, paths: list, container: str = None) -> dict:
+        """
+        Same as Pod.stat_many.
+        """
+        stats = {}
+        for batch in self._path_batches(paths):
+            result = await self.exec(self._stat_command(batch), silent=True, useLegacyShell=True,
+                                     maxOutputCharacters=64 * len(batch), container=container)
+            stats.update(self._parse_stat_output(batch, result))
+        return stats
+
+    async def check_is_file(self, path: str, container: str = None) -> bool:
+        return (await self.stat_many([path], container))[path]["type"] == "file"
+
+    async def check_exists(self, path: str, container: str = None) -> bool:
+        return (await self.stat_many([path], container))[path]["exists"]
+
+    async def check_is_dir(self, path: str, container: str = None) -> bool:
+        return (await self.stat_many([path], container))[path]["type"] == "dir"
+
+    async def create_temp_file(self, container: str = None) -> str:
+        return (await self.exec("mktemp", silent=True, useLegacyShell=True, container=container))["output"]
@@ -0,0 +1,163 @@
+from k8s.pod import Pod, PodException
+from utils.logger import Logger
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import tempfile
+import time
+
+DEPENDENCY_CACHE_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python-pipelines", "dependencies")
+# Number of dependency layers kept in the local cache, older ones are removed.
+DEPENDENCY_CACHE_MAX_LAYERS: int = 5
+DEPENDENCIES_DIR_NAME = ".dependencies"
+MARKER_FILE_PREFIX = ".requirements-"
+INSTALL_TIMES_FILE = "install_times.json"
+
+
+def requirements_hash(requirements_path: str, image: str) -> str:
+    """
+    Key of installed dependencies: sha256 of requirements file and image they are installed for.
+    """
+    with open(requirements_path, "rb") as requirements:
+        content = requirements.read()
+    return hashlib.sha256(json.dumps({"image": image, "requirements": content.decode("utf-8")}).encode("utf-8")).hexdigest()
+
+
+class DependencyBootstrap:
+    """
+    Makes dependencies from local `requirements_path` (already sent to the pod as
+    `remote_requirements_path`) importable in pod for relocated pipelines, installing
+    them with `pip3 install --target` into `DEPENDENCIES_DIR_NAME` dir of `target_dir`
+    only when there is nothing to reuse. In order of preference:
+
+    - "marker": dependencies dir already holds marker of the same requirements hash,
+      e.g. as it is baked into the image or on a mounted volume,
+    - "layer": archive of dependencies dir installed by an earlier run is kept in local
+      `cache_dir` and just extracted in pod,
+    - "bundle": prebuilt `bundle` (zip or zipapp with dependencies at its root) is sent
+      to the pod and put on PYTHONPATH,
+    - "wheelhouse": wheels from local `wheelhouse` dir are installed without index,
+    - "install": pip downloads and installs requirements.
+
+    After "wheelhouse" and "install" the dependencies dir is archived into `cache_dir`.
+    Duration of the last full install is remembered, so saved time can be reported.
+    """
+
+    def __init__(self, pod: Pod, requirements_path: str, remote_requirements_path: str, target_dir: str,
+                 cache_dir: str = DEPENDENCY_CACHE_DEFAULT_PATH, wheelhouse: str = None, bundle: str = None,
+                 use_cache: bool = True):
+        self.pod: Pod = pod
+        self.requirements_path: str = requirements_path
+        self.remote_requirements_path: str = remote_requirements_path
+        self.target_dir: str = target_dir
+        self.cache_dir: str = cache_dir
+        self.wheelhouse: str = wheelhouse
+        self.bundle: str = bundle
+        self.use_cache: bool = use_cache
+        self.dependencies_dir: str = f"{target_dir.rstrip('/')}/{DEPENDENCIES_DIR_NAME}"
+        self.key: str = requirements_hash(requirements_path, pod.image)
+        self.pythonpath: list = [self.dependencies_dir]
+
+    @property
+    def layer_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.key}.tar.gz")
+
+    @property
+    def marker_path(self) -> str:
+        return f"{self.dependencies_dir}/{MARKER_FILE_PREFIX}{self.key}"
+
+    def environment(self) -> str:
+        """
+        Returns shell assignment to prefix commands with, so they see the dependencies.
+        """
+        return f"PYTHONPATH={shlex.quote(':'.join(self.pythonpath))}"
+
+    def run(self) -> dict:
+        """
+        Prepares dependencies in pod, returns {"method", "seconds", "saved_seconds"}, where
+        `saved_seconds` compares with the last full install (None when it is unknown).
+        """
+        start = time.monotonic()
+        if self.use_cache and self.pod.check_is_file(self.marker_path):
+            method = "marker"
+        elif self.use_cache and os.path.isfile(self.layer_path):
+            method = "layer"
+            os.utime(self.layer_path)
+            with open(self.layer_path, "rb") as layer:
+                self.pod._upload_archive(self.dependencies_dir, lambda stdin: shutil.copyfileobj(layer, stdin))
+        elif self.bundle is not None:
+            method = "bundle"
+            self.pod.copy_file_to(self.bundle, self.target_dir)
+            self.pythonpath.append(f"{self.target_dir.rstrip('/')}/{os.path.basename(self.bundle)}")
+        else:
+            method = self._install()
+        seconds = time.monotonic() - start
+
+        install_times = self._read_install_times()
+        if method in ["wheelhouse", "install"]:
+            install_times[method] = seconds
+            self._write_install_times(install_times)
+        full_install = install_times.get("install")
+        saved_seconds = full_install - seconds if full_install is not None and method != "install" else None
+        message = f"Dependencies ready ({method}) in {seconds:.1f}s"
+        if saved_seconds is not None:
+            message += f", {saved_seconds:.1f}s faster than installing them"
+        Logger.info(message)
+        return {"method": method, "seconds": seconds, "saved_seconds": saved_seconds}
+
+    def _install(self) -> str:
+        install = f"pip3 install --disable-pip-version-check -q --target {shlex.quote(self.dependencies_dir)} " \
+                  f"-r {shlex.quote(self.remote_requirements_path)}"
+        if self.wheelhouse is not None:
+            method = "wheelhouse"
+            self.pod.copy_file_to(self.wheelhouse, self.target_dir)
+            wheelhouse = f"{self.target_dir.rstrip('/')}/{os.path.basename(os.path.normpath(self.wheelhouse))}"
+            install += f" --no-index --find-links {shlex.quote(wheelhouse)}"
+        else:
+            method = "install"
+        result = self.pod.exec(f"rm -rf {shlex.quote(self.dependencies_dir)} && {install} && touch {shlex.quote(self.marker_path)}",
+                               silent=True)
+        if result["ret_val"] != 0:
+            raise PodException(f"Installing {self.requirements_path} in {self.pod.name} failed: {result['output']}")
+        if self.use_cache:
+            self._store_layer()
+        return method
+
+    def _store_layer(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging_fd, staging_path = tempfile.mkstemp(prefix=f".{self.key}-", dir=self.cache_dir)
+        try:
+            with os.fdopen(staging_fd, "wb") as layer:
+                self.pod._download_archive(f"cd {shlex.quote(self.dependencies_dir)} && tar cf - .",
+                                           lambda stdout: shutil.copyfileobj(stdout, layer),
+                                           f"Caching dependencies from {self.pod.name}")
+            os.replace(staging_path, self.layer_path)
+        except PodException as e:
+            Logger.warning(f"{e}, dependencies are not cached")
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+        self._evict_layers()
+
+    def _evict_layers(self) -> None:
+        layers = sorted((entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".tar.gz")),
+                        key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in layers[DEPENDENCY_CACHE_MAX_LAYERS:]:
+            os.remove(entry.path)
+
+    def _read_install_times(self) -> dict:
+        try:
+            with open(os.path.join(self.cache_dir, INSTALL_TIMES_FILE), "r") as install_times:
+                return json.load(install_times)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_install_times(self, install_times: dict) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, INSTALL_TIMES_FILE), "w") as install_times_file:
+                json.dump(install_times, install_times_file)
+        except OSError:
+            pass
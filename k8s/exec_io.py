@@ -0,0 +1,404 @@
+from kubernetes.stream.ws_client import WSClient
+from websocket import ABNF
+import base64
+import codecs
+import collections
+import io
+import json
+import select
+import zlib
+from utils.common import PipelinesException
+
+STDIN_CHANNEL = 0
+STDOUT_CHANNEL = 1
+STDERR_CHANNEL = 2
+ERROR_CHANNEL = 3
+
+# Exec websocket (v4.channel.k8s.io) can't close stdin on its own, so data sent
+# to remote commands is base64 encoded and terminated with this line.
+STDIN_END_MARKER = "PYTHON-PIPELINES-EOF"
+# Multiple of 57 bytes, so every chunk is encoded into full 76 character base64 lines.
+STDIN_CHUNK_SIZE: int = 57 * 1024
+OUTPUT_RETENTIONS = ["head", "tail", "head+tail"]
+
+def parse_returncode(error: str) -> int:
+    """
+    Translates status sent on the error channel of exec websocket into return code.
+    """
+    status: dict = json.loads(error)
+    if status["status"] == "Success":
+        return 0
+    for cause in (status.get("details") or {}).get("causes", []):
+        if cause.get("reason") == "ExitCode":
+            return int(cause["message"])
+    raise ExecException(f"Exec failed: {status.get('message')}")
+
+def iter_output(resp: "BinaryWSClient"):
+    """
+    Yields (channel, data) pairs of stdout and stderr data received in the exec
+    session until the remote command finishes.
+    """
+    while resp.is_open():
+        resp.update(timeout=1)
+        for channel in [STDOUT_CHANNEL, STDERR_CHANNEL]:
+            data = resp.pop_channel(channel)
+            if data:
+                yield channel, data
+
+def stdin_command(command: str) -> str:
+    """
+    Wraps remote shell command, so it reads stdin sent by ExecStdinWriter and sees
+    end of file once STDIN_END_MARKER line arrives.
+    """
+    return f"sed -n '/^{STDIN_END_MARKER}$/q;p' | base64 -d | {command}"
+
+
+class BinaryWSClient(WSClient):
+    """
+    WSClient keeping received data as bytes. Original one decodes every frame
+    separately as UTF-8, which breaks binary output and characters split
+    between frames.
+    """
+
+    def update(self, timeout=0):
+        """Update channel buffers with at most one complete frame of input."""
+        if not self.is_open():
+            return
+        if not self.sock.connected:
+            self._connected = False
+            return
+        # frames already decrypted by SSL layer aren't visible to poll on the socket
+        pending = getattr(self.sock.sock, "pending", None)
+        if not (pending and pending()):
+            poll = select.poll()
+            poll.register(self.sock.sock, select.POLLIN)
+            ready = poll.poll(timeout * 1000 if timeout is not None else None)
+            poll.unregister(self.sock.sock)
+            if not ready:
+                return
+        op_code, frame = self.sock.recv_data_frame(True)
+        if op_code == ABNF.OPCODE_CLOSE:
+            self._connected = False
+        elif op_code in [ABNF.OPCODE_BINARY, ABNF.OPCODE_TEXT] and len(frame.data) > 1:
+            channel, data = frame.data[0], frame.data[1:]
+            self._channels[channel] = self._channels.get(channel, b"") + data
+
+    def pop_channel(self, channel: int) -> bytes:
+        """
+        Returns and removes data buffered for the channel, without reading new frames.
+        """
+        return self._channels.pop(channel, b"")
+
+    @property
+    def returncode(self):
+        if self.is_open():
+            return None
+        if self._returncode is None:
+            self._returncode = parse_returncode(self.pop_channel(ERROR_CHANNEL).decode("utf-8"))
+        return self._returncode
+
+
+class OutputBuffer:
+    """
+    Captures at most `limit` bytes of a stream in linear time. `retention` selects
+    which part of longer output is kept: "head", "tail" or "head+tail" (half each).
+    """
+
+    def __init__(self, limit: int, retention: str = "head"):
+        if retention not in OUTPUT_RETENTIONS:
+            raise ValueError(f"Unknown output retention {retention}, expected one of {OUTPUT_RETENTIONS}")
+        self.size: int = 0
+        self._head_limit: int = {"head": limit, "tail": 0, "head+tail": limit // 2}[retention]
+        self._tail_limit: int = limit - self._head_limit
+        self._head: bytearray = bytearray()
+        self._tail: collections.deque = collections.deque()
+        self._tail_size: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self._head_limit + self._tail_limit
+
+    def append(self, data: bytes) -> None:
+        self.size += len(data)
+        if len(self._head) < self._head_limit:
+            taken = self._head_limit - len(self._head)
+            self._head += data[:taken]
+            data = data[taken:]
+        if data and self._tail_limit:
+            self._tail.append(data)
+            self._tail_size += len(data)
+            while self._tail_size - len(self._tail[0]) >= self._tail_limit:
+                self._tail_size -= len(self._tail.popleft())
+
+    def getvalue(self) -> bytes:
+        tail = b"".join(self._tail)
+        return bytes(self._head) + tail[max(0, len(tail) - self._tail_limit):]
+
+
+class OutputCapture:
+    """
+    Captures output of exec: stdout and stderr separately plus both of them in
+    order of arrival, each bounded with OutputBuffer.
+    """
+
+    def __init__(self, limit: int, retention: str = "head"):
+        self.output: OutputBuffer = OutputBuffer(limit, retention)
+        self.stdout: OutputBuffer = OutputBuffer(limit, retention)
+        self.stderr: OutputBuffer = OutputBuffer(limit, retention)
+
+    def append(self, channel: int, data: bytes) -> None:
+        self.output.append(data)
+        (self.stdout if channel == STDOUT_CHANNEL else self.stderr).append(data)
+
+    def result(self, ret_val: int, binary: bool = False) -> dict:
+        """
+        Returns exec result. `stdout` and `stderr` are exactly what was received,
+        `output` (both of them) has surrounding whitespace stripped. Values are
+        bytes with `binary`, otherwise they are decoded as UTF-8.
+        """
+        result = {"ret_val": ret_val,
+                  "output": self.output.getvalue().strip(),
+                  "stdout": self.stdout.getvalue(),
+                  "stderr": self.stderr.getvalue()}
+        if not binary:
+            for key in ["output", "stdout", "stderr"]:
+                result[key] = result[key].decode("utf-8", "replace")
+        return result
+
+
+class LineSplitter:
+    """
+    Splits stream of bytes into lines, keeping incomplete line until the rest of
+    it arrives. Lines are returned without line endings, as str unless `binary`.
+    """
+
+    def __init__(self, binary: bool = False):
+        self._decoder = None if binary else codecs.getincrementaldecoder("utf-8")("replace")
+        self._empty = b"" if binary else ""
+        self._newline = b"\n" if binary else "\n"
+        self._partial: list = []
+
+    def feed(self, data: bytes) -> list:
+        if self._decoder:
+            data = self._decoder.decode(data)
+        if self._newline not in data:
+            if data:
+                self._partial.append(data)
+            return []
+        lines = data.split(self._newline)
+        self._partial.append(lines[0])
+        lines[0] = self._empty.join(self._partial)
+        last = lines.pop()
+        self._partial = [last] if last else []
+        return lines
+
+    def flush(self) -> list:
+        """
+        Returns the last line when the stream didn't end with a line ending.
+        """
+        if self._decoder:
+            rest = self._decoder.decode(b"", final=True)
+            if rest:
+                self._partial.append(rest)
+        line = self._empty.join(self._partial)
+        self._partial = []
+        return [line] if line else []
+
+
+class OutputSink:
+    """
+    Forwards exec output to `sink` as it arrives: a file object gets the data
+    unchanged (decoded for text files), a callable is called with every line and
+    a queue gets every line followed by None once the command finishes.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        if hasattr(sink, "write"):
+            self._decoders = {channel: codecs.getincrementaldecoder("utf-8")("replace")
+                              for channel in [STDOUT_CHANNEL, STDERR_CHANNEL]} if isinstance(sink, io.TextIOBase) else None
+            self._emit = None
+        elif hasattr(sink, "put"):
+            self._emit = sink.put
+        elif callable(sink):
+            self._emit = sink
+        else:
+            raise TypeError(f"Unsupported output sink {sink!r}, expected file, callable or queue")
+        self._lines = {channel: LineSplitter() for channel in [STDOUT_CHANNEL, STDERR_CHANNEL]}
+
+    def write(self, channel: int, data: bytes) -> None:
+        if self._emit is None:
+            self.sink.write(self._decoders[channel].decode(data) if self._decoders else data)
+            return
+        for line in self._lines[channel].feed(data):
+            self._emit(line)
+
+    def close(self) -> None:
+        if self._emit is None:
+            if self._decoders:
+                for decoder in self._decoders.values():
+                    self.sink.write(decoder.decode(b"", final=True))
+            self.sink.flush()
+            return
+        for splitter in self._lines.values():
+            for line in splitter.flush():
+                self._emit(line)
+        if hasattr(self.sink, "put"):
+            self.sink.put(None)
+
+
+class ExecStream:
+    """
+    Iterator over output lines of a command running in pod, yielding them as soon
+    as they are complete, so output doesn't have to fit in memory:
+
+        with pod.exec_stream("make") as lines:
+            for line in lines:
+                ...
+        print(lines.ret_val)
+
+    `ret_val` is set once the iterator is exhausted. Leaving the `with` block
+    early closes the exec session.
+    """
+
+    def __init__(self, resp: BinaryWSClient, stderr: bool = True, binary: bool = False):
+        self.resp: BinaryWSClient = resp
+        self.ret_val: int = None
+        self._channels: list = [STDOUT_CHANNEL, STDERR_CHANNEL] if stderr else [STDOUT_CHANNEL]
+        self._lines: dict = {channel: LineSplitter(binary) for channel in self._channels}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        try:
+            for channel, data in iter_output(self.resp):
+                if channel in self._channels:
+                    yield from self._lines[channel].feed(data)
+            for splitter in self._lines.values():
+                yield from splitter.flush()
+            self.ret_val = self.resp.returncode
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self.resp.close()
+
+
+class ExecStdinWriter(io.RawIOBase):
+    """
+    Write-only file object streaming everything written to it into stdin of the
+    exec session (which has to be started with `stdin_command`). Data is sent in
+    STDIN_CHUNK_SIZE pieces, so memory usage doesn't depend on the amount of data,
+    and sending blocks on the websocket when the remote side doesn't keep up.
+    With `compresslevel` the stream is gzip compressed on the fly.
+    """
+
+    def __init__(self, resp: BinaryWSClient, compresslevel: int = None):
+        self.resp: BinaryWSClient = resp
+        self.bytes_written: int = 0
+        self._buffer: bytearray = bytearray()
+        self._compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS) \
+            if compresslevel is not None else None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # the data sent is incomplete, so remote side must not get the end marker
+            self.abort()
+        else:
+            self.close()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.bytes_written += len(data)
+        self._buffer += self._compressor.compress(data) if self._compressor else data
+        while len(self._buffer) >= STDIN_CHUNK_SIZE:
+            self._send(base64.encodebytes(self._buffer[:STDIN_CHUNK_SIZE]))
+            del self._buffer[:STDIN_CHUNK_SIZE]
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._compressor:
+                self._buffer += self._compressor.flush()
+            if self._buffer:
+                self._send(base64.encodebytes(self._buffer))
+            self._send(f"{STDIN_END_MARKER}\n".encode("utf-8"))
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def abort(self) -> None:
+        """
+        Closes the writer without sending buffered data and the end marker.
+        """
+        self._buffer = bytearray()
+        super().close()
+
+    def _send(self, data: bytes) -> None:
+        if not self.resp.is_open():
+            raise BrokenPipeError("Exec session closed before all data was sent")
+        self.resp.write_stdin(data)
+        # drain frames sent back by remote side, so they don't pile up in the socket
+        self.resp.update(timeout=0)
+
+
+class ExecStdoutReader(io.RawIOBase):
+    """
+    Read-only file object returning base64 decoded stdout of the exec session as
+    it arrives, so it can be consumed by `tarfile` in stream mode without keeping
+    whole output in memory. Stderr is collected separately in `stderr`.
+    """
+
+    def __init__(self, resp: BinaryWSClient):
+        self.resp: BinaryWSClient = resp
+        self.bytes_read: int = 0
+        self.stderr: str = ""
+        self._encoded: bytes = b""
+        self._buffer: bytearray = bytearray()
+        self._eof: bool = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            self._fill()
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        self.bytes_read += size
+        return size
+
+    def drain(self) -> None:
+        """
+        Discards rest of the output until the remote command finishes.
+        """
+        while not self._eof:
+            self._fill()
+            self.bytes_read += len(self._buffer)
+            self._buffer.clear()
+
+    def _fill(self) -> None:
+        if self.resp.is_open():
+            self.resp.update(timeout=1)
+        self.stderr += self.resp.pop_channel(STDERR_CHANNEL).decode("utf-8", "replace")
+        self._encoded += b"".join(self.resp.pop_channel(STDOUT_CHANNEL).split())
+        if not self.resp.is_open():
+            self._eof = True
+            decodable_length = len(self._encoded)
+        else:
+            decodable_length = len(self._encoded) - len(self._encoded) % 4
+        self._buffer += base64.b64decode(self._encoded[:decodable_length])
+        self._encoded = self._encoded[decodable_length:]
+
+
+class ExecException(PipelinesException):
+    pass
@@ -1,21 +1,99 @@
-from kubernetes import client
-from kubernetes.stream import stream
-from kubernetes.stream.ws_client import WSClient
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
+from websocket import WebSocketException
+from k8s.api import stream_exec
+from k8s.session import ShellSession
+from k8s.step_cache import StepCache, default_step_cache, step_key
+from k8s import teardown
+from k8s.exec_io import BinaryWSClient, ExecStdinWriter, ExecStdoutReader, ExecStream, OutputCapture, OutputSink, \
+    LineSplitter, ExecException, STDOUT_CHANNEL, STDERR_CHANNEL, STDIN_END_MARKER, iter_output, stdin_command
 from utils.common import generate_random_string, PipelinesException
+from utils.sync import SyncFilter, local_manifest, parse_sha256sum_output, diff_manifests, parent_dirs
+from utils.artifacts import ArtifactStore, artifact_entry, update_manifest
 from utils.logger import Logger
 from utils.environment import env
+from utils import parallel
+from utils.tracing import traced, span, current_span, tracer
+import json
 import os
-import base64
-import yaml
+import posixpath
+import shlex
+import shutil
+import sys
 import tarfile
-import io
-
-pod_templates = None
-with open(f"{os.path.dirname(os.path.realpath(__file__))}/pod_config.yaml", 'r') as config:
-    pod_templates = yaml.safe_load(config)
+import time
+import threading
+
+pods_lock = threading.Lock()
+
+POD_CONFIG_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "pod_config.yaml")
+# Validated pod_config.yaml is cached as JSON, which loads faster than YAML is parsed.
+POD_CONFIG_CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "__pycache__", "pod_config.json")
+
+_pod_templates = None
+_pod_templates_lock = threading.Lock()
+
+def _validate_container(name: str, container_details) -> None:
+    if not isinstance(container_details, dict) or "image" not in container_details:
+        raise PodException(f"{name} in {POD_CONFIG_PATH} has no image")
+    if "resources" in container_details:
+        for section in ["limits", "requests"]:
+            for resource in ["memory", "cpu"]:
+                if resource not in (container_details["resources"].get(section) or {}):
+                    raise PodException(f"{name} in {POD_CONFIG_PATH} has no {section} {resource}")
+
+def _validate_pod_templates(templates: dict) -> None:
+    for name, pod_details in (templates or {}).items():
+        _validate_container(f"Pod template {name}", pod_details)
+        for container_name, container_details in (pod_details.get("containers") or {}).items():
+            _validate_container(f"Container {container_name} of pod template {name}", container_details)
+        for volume_name, volume in (pod_details.get("volumes") or {}).items():
+            if not isinstance(volume, dict) or "mount_path" not in volume:
+                raise PodException(f"Volume {volume_name} of pod template {name} in {POD_CONFIG_PATH} has no mount_path")
+            if volume.get("medium") not in [None, "", "Memory"]:
+                raise PodException(f"Volume {volume_name} of pod template {name} in {POD_CONFIG_PATH} "
+                                   f"has unknown medium {volume['medium']}, expected Memory or none")
+
+def _load_pod_templates() -> dict:
+    stat = os.stat(POD_CONFIG_PATH)
+    source = [stat.st_mtime_ns, stat.st_size]
+    try:
+        with open(POD_CONFIG_CACHE_PATH, 'r') as cache:
+            cached = json.load(cache)
+        if cached["source"] == source:
+            return cached["templates"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    import yaml
+    with open(POD_CONFIG_PATH, 'r') as config:
+        templates = yaml.safe_load(config) or {}
+    _validate_pod_templates(templates)
+    try:
+        os.makedirs(os.path.dirname(POD_CONFIG_CACHE_PATH), exist_ok=True)
+        temp_path = f"{POD_CONFIG_CACHE_PATH}.{os.getpid()}"
+        with open(temp_path, 'w') as cache:
+            json.dump({"source": source, "templates": templates}, cache)
+        os.replace(temp_path, POD_CONFIG_CACHE_PATH)
+    except OSError:
+        pass
+    return templates
+
+def get_pod_templates() -> dict:
+    """
+    Returns pod templates from pod_config.yaml, read on first use instead of at import.
+    """
+    global _pod_templates
+    with _pod_templates_lock:
+        if _pod_templates is None:
+            _pod_templates = _load_pod_templates()
+        return _pod_templates
 
 def get_pod_details(pod_template_name: str):
-    pod_details: dict = pod_templates[pod_template_name]
+    pod_templates = get_pod_templates()
+    if pod_template_name not in pod_templates:
+        raise PodException(f"Unknown pod template {pod_template_name}, expected one of {list(pod_templates)}")
+    pod_details: dict = dict(pod_templates[pod_template_name])
     if "restart_policy" not in pod_details:
         pod_details["restart_policy"] = "Never"
     if "image_pull_policy" not in pod_details:
@@ -24,13 +102,61 @@ def get_pod_details(pod_template_name: str):
         pod_details["namespace"] = env["kubernetes"]["default_namespace"]
     return pod_details
 
-class Pod:
+# Container waiting reasons after which the pod will never reach `Running`
+# phase on its own, so there is no point in waiting for the startup deadline.
+FAILED_WAITING_REASONS = ["ErrImagePull", "ImagePullBackOff", "InvalidImageName",
+                          "CreateContainerConfigError", "CreateContainerError", "CrashLoopBackOff"]
+# API statuses on which watching the pod is retried instead of being failed.
+RETRYABLE_API_STATUSES = [410, 429, 500, 502, 503, 504]
+WATCH_BACKOFF_INITIAL: float = 0.5
+WATCH_BACKOFF_MAX: float = 5.0
+# zlib level used for archives sent to pods, cheaper than tarfile's default 9
+# while compressing source trees nearly as well.
+COPY_COMPRESS_LEVEL: int = 6
+# Printed to stderr by copy_file_from when tar fails, as plain sh has no pipefail.
+COPY_FAILED_MARKER = "PYTHON-PIPELINES-TAR-FAILED"
+# gzip level of transfer_to, which compresses inside the source pod where CPU limits
+# are usually small, so higher levels quickly become slower than the transfer itself.
+TRANSFER_COMPRESS_LEVEL: int = 1
+TRANSFER_PROGRESS_INTERVAL: float = 10.0
+# Commands compressing archives in pod for each compression of archive_artifacts.
+ARCHIVE_COMPRESSIONS = {"none": "cat", "gzip": "gzip -{level} -c", "xz": "xz -{level} -c"}
+# Printed to stderr by archive_artifacts for every path or glob matching nothing.
+ARTIFACT_MISSING_MARKER = "PYTHON-PIPELINES-ARTIFACT-MISSING:"
+# Expands globs into absolute paths (sorted, without duplicates) and sends a tar with
+# just their list followed by a tar of all of them, both made relative to `/`.
+ARCHIVE_ARTIFACTS_COMMAND = (
+    '( IFS="\n"; list=$(mktemp) || exit 1; missing=0; '
+    'for p in {patterns}; do found=0; for m in $p; do if [ -e "$m" ]; then found=1; '
+    'd=$(cd "$(dirname "$m")" && pwd -P) && echo "${{d%/}}/$(basename "$m")" >> "$list"; fi; done; '
+    'if [ $found = 0 ]; then echo "{missing}$p" >&2; missing=1; fi; done; '
+    'if [ $missing = 0 ]; then sed "s|^/||" "$list" | sort -u > "$list.rel" && '
+    'tar cf - -C / "${{list#/}}.rel" && tar cf - -C / -T "$list.rel"; fi; '
+    'rc=$?; [ $missing = 0 ] || rc=3; rm -f "$list" "$list.rel"; exit $rc )')
+# Paths probed by stat_many are split into commands of at most this length,
+# well below the kernel limit for a single `sh -c` argument.
+STAT_COMMAND_MAX_LENGTH: int = 65536
+STAT_COMMAND = ('for p in {paths}; do '
+                'if [ -d "$p" ]; then t=dir; elif [ -f "$p" ]; then t=file; elif [ -e "$p" ]; then t=other; '
+                'else echo missing; continue; fi; '
+                'echo "$t $(stat -L -c \'%s %Y\' -- "$p" 2>/dev/null || echo \'0 0\')"; done')
+
+class PodBase:
+    """
+    Pod definition built from pod_config.yaml template, shared by blocking Pod
+    and asyncio based AsyncPod which only differ in the way they talk to the API server.
+    Besides the main container (named as the pod) template can declare more `containers`
+    and `volumes`, emptyDir volumes mounted in all of them (in memory with `medium: Memory`),
+    through which containers hand files to each other without copying them through the host.
+    Methods running in the pod take `container` name, the main container is used by default.
+    """
     labels: dict = {
         "python-pipelines": "True"
     }
 
-    def __init__(self, pod_template_name: str, name: str = None, pod_timeout: int = 3600):
+    def __init__(self, pod_template_name: str, name: str = None, pod_timeout: int = 3600, startup_timeout: int = 300):
         pod_details = get_pod_details(pod_template_name)
+        self.pod_template_name: str = pod_template_name
         self.image: str = pod_details["image"]
         self.name: str = f'{pod_template_name}-{generate_random_string(10)}'
         self.namespace: str = pod_details["namespace"]
@@ -38,11 +164,168 @@ class Pod:
         self.restart_policy: str = pod_details["restart_policy"]
         self.image_pull_policy: str = pod_details["image_pull_policy"]
         self.resources: dict = pod_details["resources"] if "resources" in pod_details else {}
+        self.containers: dict = dict(pod_details.get("containers") or {})
+        self.volumes: dict = dict(pod_details.get("volumes") or {})
         self.pod_timeout: int = pod_timeout
-        self.api_instance: client.CoreV1Api = env["kubernetes"]["api"]
+        self.startup_timeout: int = startup_timeout
         self._pod: client.V1Pod = client.V1Pod()
+        self._running: bool = False
         self._prepare_kubernetes_pod()
 
+    def _prepare_container(self, name: str, image: str, image_pull_policy: str, resources: dict) -> client.V1Container:
+        if resources:
+            resource_requirements: client.V1ResourceRequirements = client.V1ResourceRequirements(limits=resources["limits"], requests=resources["requests"])
+            container = client.V1Container(name=name, image=image, image_pull_policy=image_pull_policy, resources=resource_requirements)
+        else:
+            container = client.V1Container(name=name, image=image, image_pull_policy=image_pull_policy)
+        container.args = ["sleep", f"{self.pod_timeout}"]
+        if self.volumes:
+            container.volume_mounts = [client.V1VolumeMount(name=volume_name, mount_path=volume["mount_path"])
+                                       for volume_name, volume in self.volumes.items()]
+        return container
+
+    def _prepare_kubernetes_pod(self) -> None:
+        self._pod.metadata = client.V1ObjectMeta(name=self.name, labels={**self.labels, teardown.RUN_ID_LABEL: teardown.run_id()},
+                                                 annotations={teardown.POD_TIMEOUT_ANNOTATION: str(self.pod_timeout)})
+        containers = [self._prepare_container(self.name, self.image, self.image_pull_policy, self.resources)]
+        for container_name, container_details in self.containers.items():
+            containers.append(self._prepare_container(container_name, container_details["image"],
+                                                      container_details.get("image_pull_policy", self.image_pull_policy),
+                                                      container_details.get("resources", {})))
+        spec = client.V1PodSpec(containers=containers, restart_policy=self.restart_policy, service_account_name=self.serviceaccount)
+        if self.volumes:
+            spec.volumes = [client.V1Volume(name=volume_name,
+                                            empty_dir=client.V1EmptyDirVolumeSource(medium=volume.get("medium") or None,
+                                                                                    size_limit=volume.get("size_limit")))
+                            for volume_name, volume in self.volumes.items()]
+        self._pod.spec = spec
+
+    def _container_name(self, container: str = None) -> str:
+        """
+        Returns name of the container in pod spec for `container` argument of pod methods.
+        """
+        if container is None or container == self.name:
+            return self.name
+        if container not in self.containers:
+            raise PodException(f"{self.name} ({self.pod_template_name}) has no container {container}, "
+                               f"expected one of {list(self.containers)}")
+        return container
+
+    def _container_image(self, container: str = None) -> str:
+        container_name = self._container_name(container)
+        return self.image if container_name == self.name else self.containers[container_name]["image"]
+
+    def _check_pod_state(self, pod_details: client.V1Pod) -> bool:
+        """
+        Updates cached running state from given pod object. Raises PodStartupException
+        when pod is in a state from which it won't reach `Running` phase.
+        """
+        pod_status: client.V1PodStatus = pod_details.status
+        if pod_status is None:
+            return False
+        if pod_status.phase == "Running":
+            self._running = True
+            if tracer.enabled:
+                self._trace_startup_phases(pod_details)
+            return True
+        if pod_status.phase in ["Failed", "Succeeded"]:
+            raise PodStartupException(
+                f"{self.name} ({self.image}) finished with phase {pod_status.phase} before becoming ready: {pod_status.reason} {pod_status.message}")
+        for condition in pod_status.conditions or []:
+            if condition.type == "PodScheduled" and condition.status == "False" and condition.reason == "Unschedulable":
+                raise PodStartupException(f"{self.name} ({self.image}) can't be scheduled: {condition.message}")
+        for container_status in pod_status.container_statuses or []:
+            waiting: client.V1ContainerStateWaiting = container_status.state.waiting if container_status.state else None
+            if waiting is not None and waiting.reason in FAILED_WAITING_REASONS:
+                raise PodStartupException(f"{self.name} ({self.image}) failed to start: {waiting.reason} {waiting.message}")
+        return False
+
+    def _trace_startup_phases(self, pod_details: client.V1Pod) -> None:
+        """
+        Adds spans of scheduling and image pull with container start, timed by the API server.
+        """
+        created = pod_details.metadata.creation_timestamp if pod_details.metadata else None
+        scheduled = next((condition.last_transition_time for condition in pod_details.status.conditions or []
+                          if condition.type == "PodScheduled" and condition.status == "True"), None)
+        started = next((container_status.state.running.started_at
+                        for container_status in pod_details.status.container_statuses or []
+                        if container_status.state and container_status.state.running), None)
+        attributes = {"pod": self.name, "template": self.pod_template_name, "image": self.image}
+        if created and scheduled:
+            tracer.add_event("pod.scheduling", created.timestamp(), scheduled.timestamp(), attributes)
+        if scheduled and started:
+            tracer.add_event("pod.image_pull_and_start", scheduled.timestamp(), started.timestamp(), attributes)
+
+    @staticmethod
+    def _path_batches(paths: list) -> list:
+        """
+        Splits paths into batches short enough to be passed quoted to a single command.
+        """
+        batches, batch, length = [], [], 0
+        for path in paths:
+            quoted = shlex.quote(path)
+            if batch and length + len(quoted) + 1 > STAT_COMMAND_MAX_LENGTH:
+                batches.append(batch)
+                batch, length = [], 0
+            batch.append(path)
+            length += len(quoted) + 1
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _stat_command(paths: list) -> str:
+        return STAT_COMMAND.format(paths=" ".join(shlex.quote(path) for path in paths))
+
+    def _parse_stat_output(self, paths: list, result: dict) -> dict:
+        lines = result["stdout"].splitlines()
+        if result["ret_val"] != 0 or len(lines) != len(paths):
+            raise PodException(f"Probing paths in {self.name} ({self.image}) failed: {result['output']}")
+        stats = {}
+        for path, line in zip(paths, lines):
+            if line == "missing":
+                stats[path] = {"exists": False, "type": None, "size": None, "mtime": None}
+                continue
+            path_type, size, mtime = line.split(" ")
+            stats[path] = {"exists": True, "type": path_type, "size": int(size), "mtime": int(mtime)}
+        return stats
+
+    @staticmethod
+    def _log_lines(lines: list) -> None:
+        if lines:
+            Logger.info("\n".join(lines))
+
+    def print_pod_details(self) -> None:
+        resources_details = ""
+        if self.resources:
+            resources_details = f"  resources:\n" + \
+                                f"    limits:\n" + \
+                                f"      memory:{self.resources['limits']['memory']}\n" + \
+                                f"      cpu:{self.resources['limits']['cpu']}\n" + \
+                                f"    requests:\n" + \
+                                f"      memory:{self.resources['requests']['memory']}\n" + \
+                                f"      cpu:{self.resources['requests']['cpu']}\n"
+        containers_details = "".join(f"  container {name}: {details['image']}\n" for name, details in self.containers.items())
+        volumes_details = "".join(f"  volume {name}: {volume['mount_path']}{' (memory)' if volume.get('medium') else ''}\n"
+                                  for name, volume in self.volumes.items())
+        Logger.info(f"\n{self.name} details:\n" +
+                    f"  image: {self.image}\n" +
+                    f"  namespace: {self.namespace}\n" +
+                    f"{'' if not resources_details else resources_details}" +
+                    containers_details + volumes_details)
+
+
+class Pod(PodBase):
+
+    def __init__(self, pod_template_name: str, name: str = None, pod_timeout: int = 3600, startup_timeout: int = 300,
+                 persistent_session: bool = False, persist_state: bool = True):
+        super().__init__(pod_template_name, name, pod_timeout, startup_timeout)
+        self.api_instance: client.CoreV1Api = env["kubernetes"]["api"]
+        self.persistent_session: bool = persistent_session
+        self.persist_state: bool = persist_state
+        self._sessions: dict = {}
+        self._sessions_lock: threading.Lock = threading.Lock()
+
     def __enter__(self):
         self.spawn()
         return self
@@ -50,181 +333,654 @@ class Pod:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.delete()
 
-    def _prepare_kubernetes_pod(self) -> None:
-        self._pod.metadata = client.V1ObjectMeta(name=self.name, labels=self.labels)
-        if self.resources:
-            resource_requirements: client.V1ResourceRequirements = client.V1ResourceRequirements(limits=self.resources["limits"], requests=self.resources["requests"])
-            container = client.V1Container(name=self.name, image=self.image, image_pull_policy=self.image_pull_policy, resources=resource_requirements)
-        else:
-            container = client.V1Container(name=self.name, image=self.image, image_pull_policy=self.image_pull_policy)
-        container.args = ["sleep", f"{self.pod_timeout}"]
-        spec = client.V1PodSpec(containers=[container], restart_policy=self.restart_policy, service_account_name=self.serviceaccount)
-        self._pod.spec = spec
-
     @property
-    def is_running(self):
+    def is_running(self) -> bool:
         """
         Possible statuses available in V1PodStatus.phase are:
         ["Failed", "Pending", "Running", "Succeeded", "Unknown"]
+        Once the pod has been seen running the state is cached, so no further
+        requests are sent to the API server.
         """
-        pod_details: client.V1Pod = self.api_instance.read_namespaced_pod_status(self.name, self.namespace, async_req=False)
-        pod_status: client.V1PodStatus = pod_details.status
-        pod_phase: str = pod_status.phase
-        return pod_phase == "Running"
-
-    def wait_for_running_status(self):
-        while not self.is_running:
-            import time
-            time.sleep(0.1)
+        if not self._running:
+            pod_details: client.V1Pod = self.api_instance.read_namespaced_pod_status(self.name, self.namespace, async_req=False)
+            self._check_pod_state(pod_details)
+        return self._running
 
+    @traced("pod.wait_for_running_status")
+    def wait_for_running_status(self) -> None:
+        """
+        Waits until pod reaches `Running` phase. Instead of polling the status
+        the pod is watched starting from the resourceVersion of its last read, so
+        the API server pushes every change. Watch errors are retried with bounded
+        backoff until `startup_timeout` seconds pass.
+        """
+        if self._running:
+            return
+        deadline = time.monotonic() + self.startup_timeout
+        backoff = WATCH_BACKOFF_INITIAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PodStartupTimeoutException(
+                    f"{self.name} ({self.image}) didn't reach Running phase within {self.startup_timeout} seconds")
+            try:
+                pod_details: client.V1Pod = self.api_instance.read_namespaced_pod_status(self.name, self.namespace, async_req=False)
+                if self._check_pod_state(pod_details):
+                    return
+                pod_watch = watch.Watch()
+                for event in pod_watch.stream(self.api_instance.list_namespaced_pod, self.namespace,
+                                              field_selector=f"metadata.name={self.name}",
+                                              resource_version=pod_details.metadata.resource_version,
+                                              timeout_seconds=max(1, int(remaining))):
+                    if event["type"] == "DELETED":
+                        raise PodStartupException(f"{self.name} ({self.image}) was deleted while waiting for it to start")
+                    if self._check_pod_state(event["object"]):
+                        pod_watch.stop()
+                        return
+                backoff = WATCH_BACKOFF_INITIAL
+            except ApiException as e:
+                if e.status not in RETRYABLE_API_STATUSES:
+                    raise
+                time.sleep(min(backoff, max(0, deadline - time.monotonic())))
+                backoff = min(backoff * 2, WATCH_BACKOFF_MAX)
+
+    @traced("pod.spawn")
     def spawn(self):
-        self.api_instance.create_namespaced_pod(namespace=self.namespace, body=self._pod, async_req=False)
-        env["kubernetes"]["pods"].append(self.name)
-        self.wait_for_running_status()
+        with span("pod.create"):
+            self.api_instance.create_namespaced_pod(namespace=self.namespace, body=self._pod, async_req=False)
+        teardown.register_namespace(self.namespace)
+        with pods_lock:
+            env["kubernetes"]["pods"].append(self.name)
+        try:
+            self.wait_for_running_status()
+        except Exception:
+            # __exit__ isn't called when __enter__ fails, so nothing else would delete the pod
+            try:
+                self.delete()
+            except ApiException as e:
+                Logger.warning(f"Deleting {self.name} which failed to start failed: {e.reason}")
+            raise
 
         Logger.info(f"{self.name} spawned.")
         self.print_pod_details()
 
 
+    @traced("pod.delete")
     def delete(self):
-        self.api_instance.delete_namespaced_pod(self.name, self.namespace)
-        env["kubernetes"]["pods"].remove(self.name)
+        """
+        Deletes the pod, with env["kubernetes"]["fast_teardown"] immediately and without
+        waiting for the API server (see k8s.teardown).
+        """
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+        teardown.delete_pod(self.api_instance, self.name, self.namespace)
+        self._running = False
+        with pods_lock:
+            env["kubernetes"]["pods"].remove(self.name)
         Logger.info(f"{self.name} deleted")
 
-    def exec(self, command: str, silent: bool = False, useLegacyShell: bool = False, maxOutputCharacters: int = 10000) -> dict:
-        def _append_output(content):
-            nonlocal output
-            nonlocal lock_output_buffer
-            if len(output) + len(content) > maxOutputCharacters:
-                lock_output_buffer = True
-            if not lock_output_buffer:
-                output = output + content
-
+    @traced("pod.exec")
+    def exec(self, command: str, silent: bool = False, useLegacyShell: bool = False, maxOutputCharacters: int = 10000,
+             retention: str = "head", binary: bool = False, sink=None, container: str = None) -> dict:
+        """
+        Executes command in pod (its `container`) and returns dict with `ret_val`, `stdout` and `stderr`
+        exactly as received and `output` holding both of them in order of arrival
+        with surrounding whitespace stripped. At most `maxOutputCharacters` bytes of
+        each are kept, `retention` selects which part of longer output it is: "head",
+        "tail" or "head+tail". With `binary` returned output is bytes instead of str.
+        Whole output can be passed to `sink` while command runs, see OutputSink.
+        With `persistent_session` pod commands are run through ShellSession.
+        """
+        def _append_output(channel, data):
+            capture.append(channel, data)
+            if output_sink:
+                output_sink.write(channel, data)
+            if not silent:
+                self._log_lines(lines[channel].feed(data))
+
+        parallel.raise_if_cancelled()
+        container_name = self._container_name(container)
+        self.wait_for_running_status()
+        capture = OutputCapture(maxOutputCharacters, retention)
+        output_sink = OutputSink(sink) if sink is not None else None
+        lines = {STDOUT_CHANNEL: LineSplitter(), STDERR_CHANNEL: LineSplitter()}
+        shell = "sh" if useLegacyShell else "bash"
+
+        exec_span = current_span()
+        if tracer.enabled:
+            # masking runs regex of all secrets, so it is done only when the span is recorded
+            exec_span.set("command", Logger.mask_secret_text(command)[:200])
+            exec_span.set("container", container_name)
+        if self.persistent_session:
+            with self._sessions_lock:
+                if (shell, container_name) not in self._sessions:
+                    self._sessions[(shell, container_name)] = ShellSession(self.name, self.namespace, shell,
+                                                                           self.persist_state, container_name)
+                session: ShellSession = self._sessions[(shell, container_name)]
+            with span("exec.run"):
+                ret_val = session.run(command, _append_output)
+        else:
+            with span("exec.connect"):
+                resp: BinaryWSClient = stream_exec(self.name, self.namespace, [shell, "-c", command],
+                                                   container=container_name)
+            with span("exec.run"):
+                for channel, data in iter_output(resp):
+                    _append_output(channel, data)
+                resp.close()
+            ret_val = resp.returncode
+        if tracer.enabled:
+            exec_span.set("bytes", capture.output.size)
+            exec_span.set("ret_val", ret_val)
+
+        if output_sink:
+            output_sink.close()
+        if not silent:
+            for splitter in lines.values():
+                self._log_lines(splitter.flush())
+        return capture.result(ret_val, binary)
+
+    def exec_stream(self, command: str, useLegacyShell: bool = False, stderr: bool = True, binary: bool = False,
+                    container: str = None) -> ExecStream:
+        """
+        Executes command in pod returning iterator over lines of its output, see ExecStream.
+        """
+        parallel.raise_if_cancelled()
+        container_name = self._container_name(container)
         self.wait_for_running_status()
-        lock_output_buffer = False
-        output = ""
         final_command = ["sh" if useLegacyShell else "bash", "-c", command]
-        resp: WSClient = stream(self.api_instance.connect_get_namespaced_pod_exec,
-                    self.name,
-                    self.namespace,
-                    command=final_command,
-                    stderr=True, stdin=False,
-                    stdout=True, tty=False, _preload_content=False)
-
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                content = resp.read_stdout().strip()
-                if not silent:
-                    Logger.info(content)
-                _append_output(content)
-            if resp.peek_stderr():
-                content = resp.read_stderr().strip()
-                if not silent:
-                    Logger.info(content)
-                _append_output(content)
-
-        resp.close()
-        return {"ret_val": resp.returncode, "output": output}
-
-    def copy_file_from(self, source: str, destination: str) -> None:
+        return ExecStream(stream_exec(self.name, self.namespace, final_command, container=container_name), stderr, binary)
+
+    def cached_exec(self, command: str, inputs: list = None, outputs: list = None, environment: dict = None,
+                    silent: bool = False, useLegacyShell: bool = False, refresh: bool = False,
+                    cache: StepCache = None, container: str = None) -> dict:
+        """
+        Runs command like exec, unless the same command with the same `environment`
+        already succeeded in a pod of the same image with the same content of `inputs`.
+        Then `outputs` are restored from the step cache (default_step_cache() unless
+        `cache` is given) and stored exec result is returned without running the command.
+        `inputs` and `outputs` are files or dirs in pod, relative ones are resolved against
+        working dir of exec. With `refresh` the command is run and its result stored again.
+        """
+        cache = cache or default_step_cache()
+        shell = "sh" if useLegacyShell else "bash"
+        quoted_inputs = " ".join(shlex.quote(path) for path in inputs or [])
+        probe = self.exec(f'pwd; for p in {quoted_inputs}; do if [ -e "$p" ]; then find "$p" -type f -exec sha256sum {{}} +; '
+                          f'else echo "missing  $p"; fi; done', silent=True, useLegacyShell=True,
+                          maxOutputCharacters=sys.maxsize, container=container)
+        if probe["ret_val"] != 0:
+            raise PodException(f"Hashing inputs of '{command}' in {self.name} ({self.image}) failed: {probe['output']}")
+        cwd, *input_hashes = probe["stdout"].splitlines()
+        output_paths = [posixpath.normpath(posixpath.join(cwd, path)).lstrip("/") for path in outputs or []]
+        key = step_key(self._container_image(container), shell, command, environment, input_hashes, output_paths)
+
+        cached = None if refresh else cache.lookup(key)
+        if cached is not None:
+            result, archive_path = cached
+            if output_paths:
+                with open(archive_path, "rb") as archive:
+                    self._upload_archive("/", lambda stdin: shutil.copyfileobj(archive, stdin), container=container)
+            Logger.info(f"Restored cached result of '{command}' in {self.name}")
+            if not silent:
+                self._log_lines(result["output"].splitlines())
+            return result
+
+        if environment:
+            exports = " ".join(f"export {name}={shlex.quote(str(value))};" for name, value in environment.items())
+            result = self.exec(f"( {exports} {command}\n)", silent=silent, useLegacyShell=useLegacyShell, container=container)
+        else:
+            result = self.exec(command, silent=silent, useLegacyShell=useLegacyShell, container=container)
+        if result["ret_val"] != 0:
+            return result
+
+        def _write_outputs(archive) -> None:
+            if output_paths:
+                self._download_archive(f"cd / && tar cf - -- {' '.join(shlex.quote(path) for path in output_paths)}",
+                                       lambda stdout: shutil.copyfileobj(stdout, archive),
+                                       f"Caching outputs of '{command}' from {self.name}", container=container)
+        try:
+            cache.store(key, result, _write_outputs)
+        except PodException as e:
+            Logger.warning(f"{e}, result of '{command}' is not cached")
+        return result
+
+    @traced("pod.copy_file_from")
+    def copy_file_from(self, source: str, destination: str, compresslevel: int = COPY_COMPRESS_LEVEL,
+                       container: str = None) -> dict:
         """
         This method provides an interface to copy file or whole dirs from pod
         to host filesystem (typically where pipelines script is running).
         `destination` parameter points to directory where the copied files
         will be written, so if we want to copy /etc directory from pod to
         local path /tmp/localpath the destination paramter needs to contain that path.
+        Archive created in pod is extracted while it is being received, so memory
+        usage doesn't depend on its size. Returns transfer statistics.
         """
-        temp_file: str = self.create_temp_file()
-        self.exec(f'cd $(dirname {source}) && tar -czvf {temp_file} $(basename {source})', silent=True, useLegacyShell=True)
-
-        resp: WSClient = stream(self.api_instance.connect_get_namespaced_pod_exec,
-                    self.name,
-                    self.namespace,
-                    command=["sh", "-c" ,f"base64 {temp_file}"],
-                    stderr=True, stdin=False,
-                    stdout=True, tty=False)
-        tar_content = base64.b64decode(resp)
-        io_bytes = io.BytesIO(tar_content)
-        tar = tarfile.open(fileobj=io_bytes, mode='r')
-        tar.extractall(path=destination)
-        tar.close()
-        self.exec(f'rm {temp_file}', silent=True, useLegacyShell=True)
-
-    def copy_file_to(self, source: str, destination: str) -> None:
-        in_memory_tar = io.BytesIO()
-        with tarfile.open(fileobj=in_memory_tar, mode='w:gz') as tar:
-            tar.add(source, arcname=os.path.basename(source))
-
-        temp_file: str = self.create_temp_file()
-
-        resp: WSClient = stream(self.api_instance.connect_get_namespaced_pod_exec, self.name, self.namespace,
-                    command=["sh"],
-                    stderr=True, stdin=True,
-                    stdout=True, tty=False,
-                    _preload_content=False)
-
-        commands = []
-        commands.append(f"cat <<'EOF' > {temp_file}\n")
-        commands.append(base64.b64encode(in_memory_tar.getvalue()) + b'\n')
-        commands.append("EOF\n")
-
-        while resp.is_open():
-            resp.update(timeout=1)
-            if commands:
-                c = commands.pop(0)
-                resp.write_stdin(c)
-            else:
-                break
-        resp.close()
+        def _extract(archive) -> None:
+            with tarfile.open(fileobj=archive, mode='r|*') as tar:
+                tar.extractall(path=destination)
 
-        self.exec(f"mkdir -p {destination}", silent=True, useLegacyShell=True)
-        self.exec(f"base64 -d {temp_file} | tar zxf - --directory {destination}", silent=True, useLegacyShell=True)
-        self.exec(f"rm -f {temp_file}", silent=True, useLegacyShell=True)
+        self.wait_for_running_status()
+        start = time.monotonic()
+        quoted = shlex.quote(source)
+        stdout = self._download_archive(f'cd "$(dirname {quoted})" && tar cf - "$(basename {quoted})"', _extract,
+                                        f"Copying {source} from {self.name}", compresslevel, container)
+
+        seconds = time.monotonic() - start
+        stats = {"bytes": stdout.bytes_read, "seconds": seconds,
+                 "bytes_per_second": stdout.bytes_read / seconds if seconds else 0.0}
+        Logger.info(f"Copied {source} from {self.name}: {stats['bytes']} bytes in {seconds:.2f}s "
+                    f"({stats['bytes_per_second'] / 2**20:.2f} MiB/s)")
+        return stats
+
+    def _download_archive(self, tar_command: str, read_archive, description: str,
+                          compresslevel: int = COPY_COMPRESS_LEVEL, container: str = None,
+                          compression: str = "gzip") -> ExecStdoutReader:
+        """
+        Runs `tar_command` writing tar archive to its stdout in pod and passes the archive
+        (compressed with `compression` of ARCHIVE_COMPRESSIONS at `compresslevel`) to
+        `read_archive(file)` while it is being received. Returns the reader, which holds
+        transfer statistics.
+        """
+        compress = (ARCHIVE_COMPRESSIONS[compression] if compresslevel is not None else "cat").format(level=compresslevel)
+        with span("transfer.connect"):
+            resp: BinaryWSClient = stream_exec(self.name, self.namespace,
+                                         ["sh", "-c", f"{{ {tar_command} || echo {COPY_FAILED_MARKER} >&2; }} | {compress} | base64"],
+                                         container=self._container_name(container))
+        stdout = ExecStdoutReader(resp)
+        # receiving, base64 decoding and extraction are interleaved, so they are timed together
+        with span("transfer.receive") as receive_span:
+            try:
+                try:
+                    read_archive(stdout)
+                except tarfile.TarError as e:
+                    stdout.stderr += str(e)
+                stdout.drain()
+            finally:
+                resp.close()
+            receive_span.set("bytes", stdout.bytes_read)
+        if resp.returncode != 0 or COPY_FAILED_MARKER in stdout.stderr:
+            raise PodException(f"{description} failed: {stdout.stderr.replace(COPY_FAILED_MARKER, '').strip()}")
+        return stdout
+
+    def _upload_tar(self, destination: str, add_members, compresslevel: int = COPY_COMPRESS_LEVEL,
+                    container: str = None) -> None:
+        """
+        Streams tar archive written by `add_members(tar)` into `tar` extracting it in
+        `destination` dir in pod, so memory usage doesn't depend on the size of sent files.
+        """
+        def _write_tar(stdin) -> None:
+            with tarfile.open(fileobj=stdin, mode='w|') as tar:
+                add_members(tar)
+
+        self._upload_archive(destination, _write_tar, compresslevel, container)
 
-    def archive_artifact(self, path) -> None:
+    def _upload_archive(self, destination: str, write_archive, compresslevel: int = None, container: str = None) -> None:
+        """
+        Streams gzipped tar archive written by `write_archive(file)` into `tar` extracting
+        it in `destination` dir in pod. Without `compresslevel` the archive written has
+        to be compressed already.
+        """
+        quoted = shlex.quote(destination)
+        with span("transfer.connect"):
+            resp: BinaryWSClient = stream_exec(self.name, self.namespace,
+                                         ["sh", "-c", f"mkdir -p {quoted} && " +
+                                          stdin_command(f"tar zxf - --directory {quoted}")],
+                                         stdin=True, container=self._container_name(container))
+        try:
+            with span("transfer.send") as send_span:
+                try:
+                    with ExecStdinWriter(resp, compresslevel) as stdin:
+                        write_archive(stdin)
+                except BrokenPipeError:
+                    pass
+                send_span.set("bytes", stdin.bytes_written)
+            with span("transfer.remote_extract"):
+                while resp.is_open():
+                    resp.update(timeout=1)
+        finally:
+            resp.close()
+        if resp.returncode != 0:
+            raise PodException(f"Uploading to {destination} in {self.name} failed: {resp.pop_channel(STDERR_CHANNEL).decode('utf-8', 'replace')}")
+
+    @traced("pod.copy_file_to")
+    def copy_file_to(self, source: str, destination: str, compresslevel: int = COPY_COMPRESS_LEVEL,
+                     container: str = None) -> None:
+        """
+        Copies file or whole dir from host filesystem into `destination` dir in pod.
+        Archive is streamed straight into `tar` running in the pod while it is being
+        created, so memory usage doesn't depend on the size of copied files.
+        """
+        self.wait_for_running_status()
+        self._upload_tar(destination, lambda tar: tar.add(source, arcname=os.path.basename(source)), compresslevel,
+                         container)
+
+    @traced("pod.transfer_to")
+    def transfer_to(self, other: "Pod", source: str, destination: str, compresslevel: int = TRANSFER_COMPRESS_LEVEL,
+                    container: str = None, other_container: str = None,
+                    progress_interval: float = TRANSFER_PROGRESS_INTERVAL) -> dict:
+        """
+        Copies file or whole dir `source` from this pod into `destination` dir in `other`
+        pod. Base64 encoded archive written by `tar` here is forwarded frame by frame into
+        stdin of `tar` extracting it there, without being decoded, written to local disk
+        or kept in memory as a whole, and the source is read only as fast as the target
+        accepts it. With `compresslevel` the archive is gzip compressed in this pod.
+        Progress is logged every `progress_interval` seconds, returns transfer statistics
+        with `bytes` of the (compressed) archive.
+        """
+        parallel.raise_if_cancelled()
+        self.wait_for_running_status()
+        other.wait_for_running_status()
+        compress = f"gzip -{compresslevel} -c" if compresslevel is not None else "cat"
+        quoted_source, quoted_destination = shlex.quote(source), shlex.quote(destination)
+        extract = f"tar {'z' if compresslevel is not None else ''}xf - --directory {quoted_destination}"
+        description = f"Transferring {source} from {self.name} to {destination} in {other.name}"
+        start = time.monotonic()
+        with span("transfer.connect"):
+            source_resp: BinaryWSClient = stream_exec(
+                self.name, self.namespace,
+                ["sh", "-c", f'{{ cd "$(dirname {quoted_source})" && tar cf - "$(basename {quoted_source})" || '
+                             f"echo {COPY_FAILED_MARKER} >&2; }} | {compress} | base64"],
+                container=self._container_name(container))
+            target_resp: BinaryWSClient = stream_exec(
+                other.name, other.namespace, ["sh", "-c", f"mkdir -p {quoted_destination} && " + stdin_command(extract)],
+                stdin=True, container=other._container_name(other_container))
+        encoded, source_errors = 0, ""
+        source_finished = False
+        next_progress = start + progress_interval
+        try:
+            with span("transfer.pipe") as pipe_span:
+                try:
+                    while True:
+                        source_resp.update(timeout=1)
+                        source_errors += source_resp.pop_channel(STDERR_CHANNEL).decode("utf-8", "replace")
+                        data = source_resp.pop_channel(STDOUT_CHANNEL)
+                        if data:
+                            if not target_resp.is_open():
+                                break
+                            target_resp.write_stdin(data)
+                            encoded += len(data) - data.count(b"\n")
+                            # drain frames sent back by target, so they don't pile up in the socket
+                            target_resp.update(timeout=0)
+                        elif not source_resp.is_open():
+                            source_finished = True
+                            break
+                        if time.monotonic() >= next_progress:
+                            elapsed = time.monotonic() - start
+                            Logger.info(f"{description}: {encoded * 3 // 4 / 2**20:.1f} MiB sent "
+                                        f"({encoded * 3 // 4 / elapsed / 2**20:.2f} MiB/s)")
+                            next_progress += progress_interval
+                    if target_resp.is_open():
+                        # leading newline ends the last line even when nothing was sent
+                        target_resp.write_stdin(f"\n{STDIN_END_MARKER}\n".encode("utf-8"))
+                except BrokenPipeError:
+                    # target stopped reading, its status tells why
+                    pass
+                try:
+                    while target_resp.is_open():
+                        target_resp.update(timeout=1)
+                except (OSError, WebSocketException):
+                    pass
+                pipe_span.set("bytes", encoded * 3 // 4)
+        finally:
+            source_resp.close()
+            target_resp.close()
+        try:
+            target_returncode = target_resp.returncode
+        except (ValueError, ExecException):
+            target_returncode = None
+        if target_returncode != 0:
+            target_errors = target_resp.pop_channel(STDERR_CHANNEL).decode("utf-8", "replace").strip()
+            raise PodException(f"{description} failed: {target_errors or f'{other.name} closed the connection'}")
+        if not source_finished:
+            raise PodException(f"{description} failed: {other.name} stopped receiving the archive before its end")
+        if source_resp.returncode != 0 or COPY_FAILED_MARKER in source_errors:
+            raise PodException(f"{description} failed: {source_errors.replace(COPY_FAILED_MARKER, '').strip()}")
+
+        seconds = time.monotonic() - start
+        stats = {"bytes": encoded * 3 // 4, "seconds": seconds,
+                 "bytes_per_second": encoded * 3 // 4 / seconds if seconds else 0.0}
+        Logger.info(f"Transferred {source} from {self.name} to {other.name}: {stats['bytes']} bytes in {seconds:.2f}s "
+                    f"({stats['bytes_per_second'] / 2**20:.2f} MiB/s)")
+        return stats
+
+    def sync_to(self, source: str, destination: str, include: list = None, exclude: list = None, gitignore: bool = True,
+                delete: bool = True, compresslevel: int = COPY_COMPRESS_LEVEL, container: str = None) -> dict:
+        """
+        Incremental counterpart of copy_file_to for directories: compares sha256 manifest
+        of local `source` with the one of its copy in `destination` dir in pod and sends
+        only new or changed files. With `delete` files removed locally are removed in pod
+        too. Files taking part are selected with SyncFilter (.gitignore aware, see
+        utils.sync), remote files which it excludes are left untouched. Returns sync statistics.
+        """
+        if not os.path.isdir(source):
+            self.copy_file_to(source, destination, compresslevel, container)
+            return {"files": 1, "uploaded": 1, "deleted": 0, "bytes": os.path.getsize(source), "seconds": 0.0}
+        self.wait_for_running_status()
+        start = time.monotonic()
+        name = os.path.basename(os.path.normpath(source))
+        target = shlex.quote(f"{destination.rstrip('/')}/{name}")
+        sync_filter = SyncFilter(source, include, exclude, gitignore)
+        local = local_manifest(sync_filter)
+        result = self.exec(f"cd {target} 2>/dev/null && find . -type f -exec sha256sum {{}} + 2>/dev/null; true",
+                           silent=True, useLegacyShell=True, maxOutputCharacters=sys.maxsize, container=container)
+        remote = {path: digest for path, digest in parse_sha256sum_output(result["stdout"]).items()
+                  if not sync_filter.excluded_path(path)}
+        changed, deleted = diff_manifests(local, remote)
+
+        if delete:
+            for batch in self._path_batches(deleted):
+                # parents left empty are removed too, deepest first, so their own parents can become empty
+                prune = " ".join(shlex.quote(f"./{parent}") for parent in parent_dirs(batch))
+                command = f"cd {target} && rm -f -- {' '.join(shlex.quote(path) for path in batch)}"
+                if prune:
+                    command += f" && find {prune} -maxdepth 0 -type d -empty -delete"
+                result = self.exec(command, silent=True, useLegacyShell=True, container=container)
+                if result["ret_val"] != 0:
+                    raise PodException(f"Deleting files removed from {source} in {self.name} failed: {result['output']}")
+        if changed:
+            def _add_changed(tar: tarfile.TarFile) -> None:
+                for path in changed:
+                    tar.add(os.path.join(source, path), arcname=f"{name}/{path}", recursive=False)
+            self._upload_tar(destination, _add_changed, compresslevel, container)
+
+        stats = {"files": len(local), "uploaded": len(changed), "deleted": len(deleted) if delete else 0,
+                 "bytes": sum(os.path.getsize(os.path.join(source, path)) for path in changed),
+                 "seconds": time.monotonic() - start}
+        Logger.info(f"Synced {source} to {self.name}: {stats['uploaded']} of {stats['files']} files sent "
+                    f"({stats['bytes']} bytes), {stats['deleted']} deleted in {stats['seconds']:.2f}s")
+        return stats
+
+    @traced("pod.fetch_artifacts")
+    def fetch_artifacts(self, source: str, destination: str, store: ArtifactStore = None,
+                        compresslevel: int = COPY_COMPRESS_LEVEL, container: str = None) -> dict:
+        """
+        Replaces local `destination` dir with the content of `source` dir in pod (typically
+        the artifacts directory of relocated pipelines). sha256 manifest of `source` is
+        compared with `store` (ArtifactStore with default settings when not given): files
+        whose content is already stored are hardlinked from it, only the others are
+        downloaded and then added to the store, which is finally evicted down to its limits.
+        Returns stats with numbers of `files`, `downloaded` and `reused` ones, transferred
+        `bytes` and `seconds`. Files with a newline or backslash in name are not fetched.
+        """
+        store = store if store is not None else ArtifactStore()
+        self.wait_for_running_status()
+        start = time.monotonic()
+        result = self.exec(f"cd {shlex.quote(source)} 2>/dev/null && find . -type f -exec sha256sum {{}} + 2>/dev/null; true",
+                           silent=True, useLegacyShell=True, maxOutputCharacters=sys.maxsize, container=container)
+        remote = parse_sha256sum_output(result["stdout"])
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        os.makedirs(destination)
+
+        missing, missing_digests = {}, set()
+        duplicates = []
+        for path, digest in remote.items():
+            if store.has(digest):
+                store.materialize(digest, os.path.join(destination, path))
+            elif digest in missing_digests:
+                duplicates.append(path)
+            else:
+                missing[path] = digest
+                missing_digests.add(digest)
+        def _extract(archive) -> None:
+            with tarfile.open(fileobj=archive, mode="r|*") as tar:
+                tar.extractall(path=destination)
+
+        transferred = 0
+        for batch in self._path_batches(missing):
+            stdout = self._download_archive(f"cd {shlex.quote(source)} && tar cf - -- {' '.join(shlex.quote(path) for path in batch)}",
+                                            _extract, f"Fetching artifacts from {self.name}", compresslevel, container)
+            transferred += stdout.bytes_read
+        for path, digest in missing.items():
+            store.add(os.path.join(destination, path), digest)
+        # content present more than once is downloaded just once
+        for path in duplicates:
+            store.materialize(remote[path], os.path.join(destination, path))
+        evicted = store.evict()
+
+        stats = {"files": len(remote), "downloaded": len(missing), "reused": len(remote) - len(missing),
+                 "bytes": transferred, "seconds": time.monotonic() - start}
+        Logger.info(f"Fetched {source} from {self.name}: {stats['downloaded']} of {stats['files']} files downloaded "
+                    f"({stats['bytes']} bytes), {stats['reused']} reused from artifact store in {stats['seconds']:.2f}s; "
+                    f"store holds {evicted['blobs']} blobs ({evicted['bytes']} bytes), {evicted['evicted']} evicted")
+        return stats
+
+    @traced("pod.archive_artifact")
+    def archive_artifact(self, path, container: str = None) -> None:
         """
         This method is responsible for copying pointed artifact to configured artifacts directory
         inside of main pipelines pod. Path given as argument will accept files and dirs. In case if
         path to dir is passed, whole dir will be archived. It is worth to note that if artifact of
         same name has been already archived it will be overrided.
+        A list of paths can be passed as well, their existence is then checked with a single probe.
         """
         artifacts_dir_path: str = env["general"]["artifacts_path"]
+        paths: list = [path] if isinstance(path, str) else list(path)
 
-        if not self.check_exists(path):
-            raise ArtifactNotExistsException(
-                f"Attempted to create an artifact from {path} in {self.name} ({self.image}) which doesn't exist")
+        stats = self.stat_many(paths, container)
+        for path in paths:
+            if not stats[path]["exists"]:
+                raise ArtifactNotExistsException(
+                    f"Attempted to create an artifact from {path} in {self.name} ({self.image}) which doesn't exist")
         if not os.path.exists(artifacts_dir_path):
             os.mkdir(artifacts_dir_path)
 
-        self.copy_file_from(path, artifacts_dir_path)
+        for path in paths:
+            self.copy_file_from(path, artifacts_dir_path, container=container)
 
-    def print_pod_details(self) -> None:
-        resources_details = ""
-        if self.resources:
-            resources_details = f"  resources:\n" + \
-                                f"    limits:\n" + \
-                                f"      memory:{self.resources['limits']['memory']}\n" + \
-                                f"      cpu:{self.resources['limits']['cpu']}\n" + \
-                                f"    requests:\n" + \
-                                f"      memory:{self.resources['requests']['memory']}\n" + \
-                                f"      cpu:{self.resources['requests']['cpu']}\n"
-        Logger.info(f"\n{self.name} details:\n" +
-                    f"  image: {self.image}\n" +
-                    f"  namespace: {self.namespace}\n" +
-                    f"{'' if not resources_details else resources_details}")
+    @traced("pod.archive_artifacts")
+    def archive_artifacts(self, paths: list, compression: str = "gzip", compresslevel: int = COPY_COMPRESS_LEVEL,
+                          container: str = None) -> dict:
+        """
+        Copies files or dirs matching given paths or globs (relative ones are resolved
+        against working dir of exec) into the artifacts directory, like archive_artifact,
+        but all of them in a single tar stream, so hundreds of small files cost one exec.
+        `compression` is one of ARCHIVE_COMPRESSIONS ("none", "gzip" or "xz", which the
+        image has to provide) used at `compresslevel`. Size and sha256 of every archived
+        file are written into the artifacts manifest (see utils.artifacts). Returns stats
+        with numbers of `artifacts` and `files`, their `size`, transferred `bytes` and `seconds`.
+        """
+        if compression not in ARCHIVE_COMPRESSIONS:
+            raise PodException(f"Unknown compression {compression}, expected one of {list(ARCHIVE_COMPRESSIONS)}")
+        artifacts_dir_path: str = env["general"]["artifacts_path"]
+        os.makedirs(artifacts_dir_path, exist_ok=True)
+        roots: list = []
+
+        def _target_name(name: str, seen: dict) -> str:
+            # nearest listed root first, a path listed twice (also inside listed dir) comes twice
+            candidates = []
+            path = name.rstrip("/")
+            while path:
+                if path in roots:
+                    candidates.append(path)
+                path = posixpath.dirname(path)
+            if not candidates:
+                return None
+            root = candidates[min(seen.get(name, 0), len(candidates) - 1)]
+            seen[name] = seen.get(name, 0) + 1
+            return posixpath.basename(root) + name.rstrip("/")[len(root):]
+
+        def _extract(archive) -> None:
+            seen: dict = {}
+            # hardlinks point to the first extracted copy of their target
+            extracted: dict = {}
+            with tarfile.open(fileobj=archive, mode="r|*", ignore_zeros=True) as tar:
+                list_member = tar.next()
+                roots.extend(tar.extractfile(list_member).read().decode("utf-8").splitlines())
+                for member in tar:
+                    target_name = _target_name(member.name, seen)
+                    if target_name is None:
+                        continue
+                    extracted.setdefault(member.name, target_name)
+                    member.name = target_name
+                    if member.islnk():
+                        member.linkname = extracted.get(member.linkname, member.linkname)
+                    tar.extract(member, path=artifacts_dir_path)
 
-    def check_is_file(self, path: str) -> bool:
-        return self.exec(f"test -f {path}", silent=True, useLegacyShell=True)["ret_val"] == 0
+        self.wait_for_running_status()
+        start = time.monotonic()
+        patterns = " ".join(shlex.quote(path) for path in paths)
+        try:
+            stdout = self._download_archive(ARCHIVE_ARTIFACTS_COMMAND.format(patterns=patterns, missing=ARTIFACT_MISSING_MARKER),
+                                            _extract, f"Archiving artifacts from {self.name}", compresslevel, container,
+                                            compression)
+        except PodException as e:
+            if ARTIFACT_MISSING_MARKER not in str(e):
+                raise
+            missing = [line.split(ARTIFACT_MISSING_MARKER, 1)[1] for line in str(e).splitlines()
+                       if ARTIFACT_MISSING_MARKER in line]
+            raise ArtifactNotExistsException(
+                f"Attempted to create an artifact from {', '.join(missing)} in {self.name} ({self.image}) which doesn't exist")
+
+        artifacts = {}
+        for root in roots:
+            name = posixpath.basename(root)
+            artifacts[name] = artifact_entry(artifacts_dir_path, name, f"/{root}", self.name)
+        update_manifest(artifacts_dir_path, artifacts)
+        stats = {"artifacts": len(artifacts), "files": sum(len(artifact["files"]) for artifact in artifacts.values()),
+                 "size": sum(artifact["size"] for artifact in artifacts.values()), "bytes": stdout.bytes_read,
+                 "seconds": time.monotonic() - start}
+        Logger.info(f"Archived {stats['artifacts']} artifacts ({stats['files']} files, {stats['size']} bytes) "
+                    f"from {self.name}: {stats['bytes']} bytes transferred in {stats['seconds']:.2f}s")
+        return stats
+
+    def stat_many(self, paths: list, container: str = None) -> dict:
+        """
+        Returns {path: {"exists", "type", "size", "mtime"}} for all given paths, probed
+        with one exec (or a few for very long lists). `type` is "file", "dir" or "other",
+        symlinks are followed. Paths are quoted, so they are not subject to shell expansion.
+        """
+        stats = {}
+        for batch in self._path_batches(paths):
+            result = self.exec(self._stat_command(batch), silent=True, useLegacyShell=True,
+                               maxOutputCharacters=64 * len(batch), container=container)
+            stats.update(self._parse_stat_output(batch, result))
+        return stats
+
+    def check_is_file(self, path: str, container: str = None) -> bool:
+        return self.stat_many([path], container)[path]["type"] == "file"
+
+    def check_exists(self, path: str, container: str = None) -> bool:
+        return self.stat_many([path], container)[path]["exists"]
+
+    def check_is_dir(self, path: str, container: str = None) -> bool:
+        return self.stat_many([path], container)[path]["type"] == "dir"
 
-    def check_exists(self, path: str) -> bool:
-        return self.exec(f"test -e {path}", silent=True, useLegacyShell=True)["ret_val"] == 0
+    def create_temp_file(self, container: str = None) -> str:
+        return self.exec("mktemp", silent=True, useLegacyShell=True, container=container)["output"]
 
-    def check_is_dir(self, path: str) -> bool:
-        return self.exec(f"test -d {path}", silent=True, useLegacyShell=True)["ret_val"] == 0
 
-    def create_temp_file(self) -> str:
-        return self.exec("mktemp", silent=True, useLegacyShell=True)["output"]
+def archive_artifacts_from_pods(pod_paths: dict, compression: str = "gzip", compresslevel: int = COPY_COMPRESS_LEVEL,
+                                max_workers: int = 8) -> dict:
+    """
+    Runs Pod.archive_artifacts of several pods at once, `pod_paths` maps pods to their
+    paths. Returns dict of pod names and their stats, raises ParallelException when
+    archiving from any pod failed.
+    """
+    return parallel.parallel({pod.name: (lambda pod=pod, paths=paths: pod.archive_artifacts(paths, compression, compresslevel))
+                              for pod, paths in pod_paths.items()}, fail_fast=False, max_workers=max_workers)
 
 
 class PodException(PipelinesException):
@@ -232,4 +988,12 @@ class PodException(PipelinesException):
 
 
 class ArtifactNotExistsException(PodException):
-    pass
\ No newline at end of file
+    pass
+
+
+class PodStartupException(PodException):
+    pass
+
+
+class PodStartupTimeoutException(PodStartupException):
+    pass
@@ -0,0 +1,232 @@
+from k8s.pod import Pod, PodException
+from utils.logger import Logger
+from utils.environment import env
+import atexit
+import threading
+import time
+
+
+class PooledPod:
+    """
+    Context manager handed out by PodPool. Entering it acquires a pod from the
+    pool (spawning one if no idle pod is available) and exiting it gives the
+    pod back to the pool instead of deleting it.
+    """
+
+    def __init__(self, pool: "PodPool", pod_template_name: str):
+        self.pool: PodPool = pool
+        self.pod_template_name: str = pod_template_name
+        self.pod: Pod = None
+
+    def __enter__(self) -> Pod:
+        self.pod = self.pool.acquire(self.pod_template_name)
+        return self.pod
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.pool.release(self.pod, reusable=exc_type is None)
+        self.pod = None
+
+
+class _IdlePod:
+
+    def __init__(self, pod: Pod, spawned_at: float):
+        self.pod: Pod = pod
+        self.spawned_at: float = spawned_at
+        self.idle_since: float = time.monotonic()
+
+
+class PodPool:
+    """
+    Keeps pre-spawned, idle pods per template from pod_config.yaml so that
+    pipeline steps don't wait for scheduling and image start.
+
+        pool = PodPool(size={"ubuntu2204": 2})
+        pool.prewarm("ubuntu2204")
+        with pool.pod("ubuntu2204") as ubuntu:
+            ubuntu.exec("make")
+
+    `size` is the number of pods owned by the pool per template (int for every
+    template or dict per template name), all of them are kept warm while idle; `max_idle` and `max_age` are in seconds.
+    `max_age` has to stay below `pod_timeout` as pods are killed after it.
+    On release `reset_command` is executed in the pod to clean its workspace;
+    if it is not set or fails, the pod is deleted and a fresh one is spawned
+    in the background instead.
+    """
+
+    def __init__(self, size=1, max_idle: int = 600, max_age: int = 3000, reset_command: str = None,
+                 pod_timeout: int = 3600, startup_timeout: int = 300):
+        if max_age >= pod_timeout:
+            raise PodException(f"Pool max_age ({max_age}) has to be lower than pod_timeout ({pod_timeout})")
+        self.size = size
+        self.max_idle: int = max_idle
+        self.max_age: int = max_age
+        self.reset_command: str = reset_command
+        self.pod_timeout: int = pod_timeout
+        self.startup_timeout: int = startup_timeout
+        self._idle: dict = {}
+        self._spawned_at: dict = {}
+        self._pending: dict = {}
+        self._in_use: dict = {}
+        self._threads: list = []
+        self._lock: threading.Lock = threading.Lock()
+        self._closed: bool = False
+        self.hits: int = 0
+        self.misses: int = 0
+        self._spawns: int = 0
+        self._spawn_seconds: float = 0.0
+        atexit.register(self.drain)
+
+    def size_for(self, pod_template_name: str) -> int:
+        if isinstance(self.size, dict):
+            return self.size.get(pod_template_name, 0)
+        return self.size
+
+    def pod(self, pod_template_name: str) -> PooledPod:
+        return PooledPod(self, pod_template_name)
+
+    def prewarm(self, pod_template_name: str) -> None:
+        """
+        Spawns in background as many pods as needed to fill the pool for given template.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size_for(pod_template_name) - len(self._idle.get(pod_template_name, [])) \
+                - self._pending.get(pod_template_name, 0) - self._in_use.get(pod_template_name, 0)
+            self._pending[pod_template_name] = self._pending.get(pod_template_name, 0) + max(0, missing)
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for _ in range(missing):
+                thread = threading.Thread(target=self._spawn_idle, args=(pod_template_name,), daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def acquire(self, pod_template_name: str) -> Pod:
+        self.reap()
+        with self._lock:
+            idle_pods: list = self._idle.get(pod_template_name, [])
+            idle_pod: _IdlePod = idle_pods.pop() if idle_pods else None
+            self._in_use[pod_template_name] = self._in_use.get(pod_template_name, 0) + 1
+            if idle_pod is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if idle_pod is not None:
+            pod = idle_pod.pod
+            Logger.info(f"{pod.name} taken from pool.")
+        else:
+            try:
+                pod = self._spawn(pod_template_name)
+            except Exception:
+                with self._lock:
+                    self._in_use[pod_template_name] -= 1
+                raise
+        self.prewarm(pod_template_name)
+        return pod
+
+    def release(self, pod: Pod, reusable: bool = True) -> None:
+        """
+        Gives pod back to the pool. Pods which can't be reused (reset failed, too old,
+        pool for template already full) are deleted and replaced in background.
+        """
+        pod_template_name: str = pod.pod_template_name
+        with self._lock:
+            spawned_at: float = self._spawned_at.get(pod.name, 0)
+            self._in_use[pod_template_name] -= 1
+        reusable = reusable and not self._closed and self.reset_command is not None \
+            and time.monotonic() - spawned_at < self.max_age
+        if reusable:
+            try:
+                reusable = pod.exec(self.reset_command, silent=True)["ret_val"] == 0
+            except Exception as e:
+                Logger.warning(f"Resetting pooled pod {pod.name} failed: {e}")
+                reusable = False
+        if reusable:
+            with self._lock:
+                idle_pods: list = self._idle.setdefault(pod_template_name, [])
+                reusable = len(idle_pods) + self._in_use[pod_template_name] < self.size_for(pod_template_name)
+                if reusable:
+                    idle_pods.append(_IdlePod(pod, spawned_at))
+        if not reusable:
+            self._delete(pod)
+            self.prewarm(pod_template_name)
+
+    def reap(self) -> None:
+        """
+        Deletes idle pods which exceeded `max_idle` or `max_age`.
+        """
+        now = time.monotonic()
+        expired: list = []
+        with self._lock:
+            for pod_template_name, idle_pods in self._idle.items():
+                keep = [idle_pod for idle_pod in idle_pods
+                        if now - idle_pod.idle_since < self.max_idle and now - idle_pod.spawned_at < self.max_age]
+                expired.extend(idle_pod.pod for idle_pod in idle_pods if idle_pod not in keep)
+                self._idle[pod_template_name] = keep
+        for pod in expired:
+            self._delete(pod)
+
+    def drain(self) -> None:
+        """
+        Deletes all idle pods and stops further prewarming. Registered to run at process exit.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            idle_pods = [idle_pod for pods in self._idle.values() for idle_pod in pods]
+            self._idle = {}
+        for idle_pod in idle_pods:
+            self._delete(idle_pod.pod)
+        stats = self.stats
+        Logger.info(f"Pod pool drained. hits: {stats['hits']}, misses: {stats['misses']}, "
+                    f"spawn latency saved: {stats['saved_seconds']:.1f}s")
+
+    @property
+    def stats(self) -> dict:
+        average_spawn_seconds = self._spawn_seconds / self._spawns if self._spawns else 0.0
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "average_spawn_seconds": average_spawn_seconds,
+                "saved_seconds": self.hits * average_spawn_seconds}
+
+    def _spawn(self, pod_template_name: str) -> Pod:
+        pod = Pod(pod_template_name, pod_timeout=self.pod_timeout, startup_timeout=self.startup_timeout)
+        start = time.monotonic()
+        try:
+            pod.spawn()
+        except Exception:
+            # spawn deletes pods failing to start, unless deleting them failed as well
+            if pod.name in env["kubernetes"]["pods"]:
+                self._delete(pod)
+            raise
+        with self._lock:
+            self._spawns += 1
+            self._spawn_seconds += time.monotonic() - start
+            self._spawned_at[pod.name] = start
+        return pod
+
+    def _spawn_idle(self, pod_template_name: str) -> None:
+        try:
+            pod = self._spawn(pod_template_name)
+        except Exception as e:
+            Logger.warning(f"Failed to prewarm {pod_template_name} pod: {e}")
+            return
+        finally:
+            with self._lock:
+                self._pending[pod_template_name] -= 1
+        with self._lock:
+            if not self._closed:
+                self._idle.setdefault(pod_template_name, []).append(_IdlePod(pod, self._spawned_at[pod.name]))
+                return
+        self._delete(pod)
+
+    def _delete(self, pod: Pod) -> None:
+        with self._lock:
+            self._spawned_at.pop(pod.name, None)
+        try:
+            pod.delete()
+        except Exception as e:
+            Logger.warning(f"Failed to delete pooled pod {pod.name}: {e}")
@@ -1,11 +1,131 @@
 from utils.environment import env
 from utils.logger import Logger
 from utils.common import decode_base64_to_str
-from kubernetes import client
+from kubernetes import client, watch
 from kubernetes.client.models import v1_secret
-import base64
+import threading
+import time
 from abc import ABC, abstractmethod
 
+# Seconds for which secrets read from the API server are served from SecretStore.
+SECRET_CACHE_TTL: int = 300
+
+_secret_store_lock = threading.Lock()
+
+
+class _CachedSecret:
+
+    def __init__(self, k8s_secret: v1_secret.V1Secret):
+        self.k8s_secret: v1_secret.V1Secret = k8s_secret
+        self.values: dict = {key: decode_base64_to_str(value) for key, value in (k8s_secret.data or {}).items()}
+        self.fetched_at: float = time.monotonic()
+
+
+class SecretStore:
+    """
+    Cache of secrets read from the API server, shared by all Secret objects so that
+    opening the same credentials in parallel branches or loops doesn't read them each
+    time. Secrets can be fetched upfront with a single list call with `prefetch` and
+    kept up to date on rotation with `watch_rotation`; without a watch cached secrets are
+    read again after `ttl` seconds.
+    """
+
+    def __init__(self, api_instance: client.CoreV1Api, ttl: int = SECRET_CACHE_TTL):
+        self.api_instance: client.CoreV1Api = api_instance
+        self.ttl: int = ttl
+        self._secrets: dict = {}
+        self._watched_namespaces: set = set()
+        self._watches: list = []
+        self._lock: threading.Lock = threading.Lock()
+
+    def _put(self, k8s_secret: v1_secret.V1Secret) -> _CachedSecret:
+        cached_secret = _CachedSecret(k8s_secret)
+        with self._lock:
+            self._secrets[(k8s_secret.metadata.namespace, k8s_secret.metadata.name)] = cached_secret
+        return cached_secret
+
+    def get(self, name: str, namespace: str) -> _CachedSecret:
+        with self._lock:
+            cached_secret: _CachedSecret = self._secrets.get((namespace, name))
+            fresh = cached_secret is not None and \
+                (namespace in self._watched_namespaces or time.monotonic() - cached_secret.fetched_at < self.ttl)
+        if fresh:
+            return cached_secret
+        k8s_secret: v1_secret.V1Secret = self.api_instance.read_namespaced_secret(name, namespace)
+        k8s_secret.metadata.namespace = k8s_secret.metadata.namespace or namespace
+        return self._put(k8s_secret)
+
+    def prefetch(self, namespace: str = None, label_selector: str = None, field_selector: str = None) -> int:
+        """
+        Reads all secrets matching selectors with one list call, returns their number.
+        """
+        namespace = namespace or env["kubernetes"]["default_namespace"]
+        secrets: client.V1SecretList = self.api_instance.list_namespaced_secret(
+            namespace, label_selector=label_selector, field_selector=field_selector)
+        for k8s_secret in secrets.items:
+            k8s_secret.metadata.namespace = k8s_secret.metadata.namespace or namespace
+            self._put(k8s_secret)
+        return len(secrets.items)
+
+    def watch_rotation(self, namespace: str = None, label_selector: str = None) -> None:
+        """
+        Keeps secrets of namespace (matching `label_selector`) up to date in a background
+        thread, so they are not read again when `ttl` passes.
+        """
+        namespace = namespace or env["kubernetes"]["default_namespace"]
+        secrets: client.V1SecretList = self.api_instance.list_namespaced_secret(namespace, label_selector=label_selector)
+        for k8s_secret in secrets.items:
+            k8s_secret.metadata.namespace = k8s_secret.metadata.namespace or namespace
+            self._put(k8s_secret)
+        secret_watch = watch.Watch()
+        thread = threading.Thread(target=self._watch, daemon=True,
+                                  args=(secret_watch, namespace, label_selector, secrets.metadata.resource_version))
+        with self._lock:
+            self._watched_namespaces.add(namespace)
+            self._watches.append(secret_watch)
+        thread.start()
+
+    def _watch(self, secret_watch: watch.Watch, namespace: str, label_selector: str, resource_version: str) -> None:
+        try:
+            for event in secret_watch.stream(self.api_instance.list_namespaced_secret, namespace,
+                                             label_selector=label_selector, resource_version=resource_version):
+                k8s_secret: v1_secret.V1Secret = event["object"]
+                k8s_secret.metadata.namespace = k8s_secret.metadata.namespace or namespace
+                if event["type"] == "DELETED":
+                    with self._lock:
+                        self._secrets.pop((namespace, k8s_secret.metadata.name), None)
+                else:
+                    self._put(k8s_secret)
+        except Exception as e:
+            Logger.warning(f"Watching secrets in {namespace} stopped: {e}")
+        with self._lock:
+            # without the watch cached secrets are valid only until ttl passes
+            self._watched_namespaces.discard(namespace)
+
+    def stop(self) -> None:
+        with self._lock:
+            watches, self._watches = self._watches, []
+        for secret_watch in watches:
+            secret_watch.stop()
+
+    def invalidate(self, name: str = None, namespace: str = None) -> None:
+        """
+        Drops given secret, or all of them, from the cache.
+        """
+        with self._lock:
+            if name is None:
+                self._secrets = {}
+            else:
+                self._secrets.pop((namespace or env["kubernetes"]["default_namespace"], name), None)
+
+
+def get_secret_store() -> SecretStore:
+    with _secret_store_lock:
+        if "secret_store" not in env["kubernetes"]:
+            env["kubernetes"]["secret_store"] = SecretStore(env["kubernetes"]["api"])
+        return env["kubernetes"]["secret_store"]
+
+
 class Secret(ABC):
 
     @abstractmethod
@@ -13,12 +133,13 @@ class Secret(ABC):
         if namespace is None:
             namespace = env["kubernetes"]["default_namespace"]
         self.api_instance : client.CoreV1Api = env["kubernetes"]["api"]
-        self.k8s_secret : v1_secret.V1Secret = self.api_instance.read_namespaced_secret(name, namespace)
+        cached_secret: _CachedSecret = get_secret_store().get(name, namespace)
+        self.k8s_secret : v1_secret.V1Secret = cached_secret.k8s_secret
         self._data : dict = self.k8s_secret.data
-        for value in self._data.values():
-            decoded_value = decode_base64_to_str(value)
-            if decoded_value not in env["general"]["secrets"]:
-                env["general"]["secrets"].append(decoded_value)
+        self._decoded_data : dict = cached_secret.values
+        self._values : list = list(self._decoded_data.values())
+        for value in self._values:
+            env["general"]["secrets"].add(value)
 
     def __enter__(self):
         return self
@@ -27,14 +148,13 @@ class Secret(ABC):
         self.remove_secrets_from_env()
 
     def remove_secrets_from_env(self):
-        for value in self._data.values():
-            value_decoded = decode_base64_to_str(value)
-            if value_decoded in env["general"]["secrets"]:
-                env["general"]["secrets"].remove(value_decoded)
+        values, self._values = self._values, []
+        for value in values:
+            env["general"]["secrets"].remove(value)
 
 class SecretUserPassword(Secret):
-    
+
     def __init__(self, name: str, namespace: str=None):
         super().__init__(name, namespace)
-        self.username = decode_base64_to_str(self._data["username"])
-        self.password = decode_base64_to_str(self._data["password"])
+        self.username = self._decoded_data["username"]
+        self.password = self._decoded_data["password"]
@@ -0,0 +1,123 @@
+from k8s.api import stream_exec
+from k8s.exec_io import BinaryWSClient, ExecException, STDOUT_CHANNEL, STDERR_CHANNEL
+from utils.common import generate_random_string, PipelinesException
+from utils.logger import Logger
+import base64
+import shlex
+import threading
+
+
+class _SentinelScanner:
+    """
+    Passes through data of a stream until given sentinel shows up, holding back
+    only as many bytes as could be the beginning of a sentinel split between frames.
+    """
+
+    def __init__(self, sentinel: bytes):
+        self.sentinel: bytes = sentinel
+        self.found: bool = False
+        self.rest: bytes = b""
+        self._held: bytes = b""
+
+    def feed(self, data: bytes) -> bytes:
+        if self.found:
+            self.rest += data
+            return b""
+        data = self._held + data
+        index = data.find(self.sentinel)
+        if index >= 0:
+            self.found = True
+            self.rest = data[index + len(self.sentinel):]
+            self._held = b""
+            return data[:index]
+        keep = min(len(data), len(self.sentinel) - 1)
+        self._held = data[len(data) - keep:]
+        return data[:len(data) - keep]
+
+
+class ShellSession:
+    """
+    One long-lived shell in pod, running commands sent over stdin of a single exec
+    websocket, so they don't pay for setting up new connection each. Every command
+    is followed by a random sentinel carrying its return code and working directory,
+    which delimits its output. With `persist_state` commands run in the session
+    shell itself, so `cd` and exported variables are kept between them, otherwise
+    each one runs in a subshell. When the connection drops (or command exits the
+    shell) the session is reopened with the next command, restoring working
+    directory and, with `persist_state`, exported variables (non-exported ones are lost).
+    """
+
+    def __init__(self, pod_name: str, namespace: str, shell: str = "sh", persist_state: bool = True,
+                 container: str = None):
+        self.pod_name: str = pod_name
+        self.namespace: str = namespace
+        self.container: str = container
+        self.shell: str = shell
+        self.persist_state: bool = persist_state
+        self.cwd: str = None
+        # `export -p` output after the last command, base64 encoded
+        self.exports: str = None
+        self._resp: BinaryWSClient = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def _open(self) -> None:
+        self._resp = stream_exec(self.pod_name, self.namespace, [self.shell], stdin=True, container=self.container)
+        if self.cwd is not None:
+            self._resp.write_stdin(f"cd {shlex.quote(self.cwd)}\n")
+        if self.persist_state and self.exports:
+            # readonly variables can't be set again, which is fine
+            self._resp.write_stdin(f'eval "$(echo {self.exports} | base64 -d)" >/dev/null 2>&1\n')
+
+    def close(self) -> None:
+        if self._resp is not None:
+            self._resp.close()
+            self._resp = None
+
+    def run(self, command: str, on_output) -> int:
+        """
+        Runs command passing its stdout and stderr data to `on_output(channel, data)`
+        and returns its return code.
+        """
+        with self._lock:
+            if self._resp is None or not self._resp.is_open():
+                if self._resp is not None:
+                    Logger.warning(f"Shell session in {self.pod_name} was closed, reconnecting.")
+                self._open()
+            sentinel = f"PYTHON-PIPELINES-{generate_random_string(20)}"
+            encoded_command = base64.b64encode(command.encode("utf-8")).decode("ascii")
+            run = 'eval "$__pipelines_command" </dev/null' if self.persist_state \
+                else '( eval "$__pipelines_command" ) </dev/null'
+            exports = '"$(export -p | base64 | tr -d \'\\n\')"' if self.persist_state else "-"
+            self._resp.write_stdin(f'__pipelines_command="$(echo {encoded_command} | base64 -d)"; {run}; '
+                                   f'__pipelines_ret_val=$?; '
+                                   f'printf "{sentinel}%s %s %s\\n" "$__pipelines_ret_val" {exports} "$PWD"; '
+                                   f'printf "{sentinel}\\n" >&2\n')
+            return self._read_output(sentinel.encode("utf-8"), on_output)
+
+    def _read_output(self, sentinel: bytes, on_output) -> int:
+        scanners = {STDOUT_CHANNEL: _SentinelScanner(sentinel), STDERR_CHANNEL: _SentinelScanner(sentinel)}
+        stdout_scanner: _SentinelScanner = scanners[STDOUT_CHANNEL]
+        while not (stdout_scanner.found and b"\n" in stdout_scanner.rest and scanners[STDERR_CHANNEL].found):
+            if not self._resp.is_open():
+                # command exited the shell, so its exit status is the one of the command
+                try:
+                    ret_val = self._resp.returncode
+                except (ValueError, ExecException):
+                    raise ShellSessionException(f"Shell session in {self.pod_name} dropped while running command")
+                finally:
+                    self.close()
+                return ret_val
+            self._resp.update(timeout=1)
+            for channel, scanner in scanners.items():
+                data = scanner.feed(self._resp.pop_channel(channel))
+                if data:
+                    on_output(channel, data)
+        ret_val, exports, cwd = stdout_scanner.rest.split(b"\n", 1)[0].decode("utf-8").split(" ", 2)
+        self.cwd = cwd
+        if self.persist_state:
+            self.exports = exports
+        return int(ret_val)
+
+
+class ShellSessionException(PipelinesException):
+    pass
@@ -0,0 +1,127 @@
+from utils.environment import env
+from utils.logger import Logger
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+STEP_CACHE_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python-pipelines", "steps")
+STEP_CACHE_DEFAULT_MAX_BYTES: int = 10 * 2**30
+ARCHIVE_FILE = "outputs.tar.gz"
+RESULT_FILE = "result.json"
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def step_key(image: str, shell: str, command: str, environment: dict, inputs: list, outputs: list = ()) -> str:
+    """
+    Key of a cached step: sha256 of everything which may change its outcome, including
+    absolute `outputs` paths, which are restored where they were stored from.
+    """
+    description = json.dumps({"image": image, "shell": shell, "command": command, "environment": environment or {},
+                              "inputs": sorted(inputs), "outputs": sorted(outputs)}, sort_keys=True)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+class StepCache:
+    """
+    Local store of results of Pod.cached_exec steps, one directory per step key
+    holding exec result and gzipped tar of step outputs. `path` can be a mounted
+    PVC to share cache between runs in cluster. When total size exceeds `max_bytes`
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = STEP_CACHE_DEFAULT_PATH, max_bytes: int = STEP_CACHE_DEFAULT_MAX_BYTES):
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def lookup(self, key: str) -> tuple:
+        """
+        Returns (exec result, path of outputs archive) for given key or None,
+        marking the entry as recently used.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(os.path.join(entry_path, RESULT_FILE), "r") as result_file:
+                result = json.load(result_file)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result, os.path.join(entry_path, ARCHIVE_FILE)
+
+    def store(self, key: str, result: dict, write_archive) -> None:
+        """
+        Stores exec result together with outputs archive written by `write_archive(file)`.
+        Entry is prepared aside and renamed into place, so readers never see a partial one.
+        """
+        staging_path = tempfile.mkdtemp(prefix=f".{key}-", dir=self.path)
+        try:
+            with open(os.path.join(staging_path, ARCHIVE_FILE), "wb") as archive:
+                write_archive(archive)
+            with open(os.path.join(staging_path, RESULT_FILE), "w") as result_file:
+                json.dump(result, result_file)
+            self.invalidate(key)
+            try:
+                os.rename(staging_path, self._entry_path(key))
+            except OSError:
+                # stored concurrently by another run
+                shutil.rmtree(staging_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        self.evict()
+
+    def invalidate(self, key: str = None) -> None:
+        """
+        Removes entry of given key, or whole cache content when key isn't given.
+        """
+        keys = [key] if key is not None else [name for name in os.listdir(self.path) if not name.startswith(".")]
+        for name in keys:
+            shutil.rmtree(self._entry_path(name), ignore_errors=True)
+
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.path):
+            entry_path = self._entry_path(name)
+            if name.startswith(".") or not os.path.isdir(entry_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_path, file_name)) for file_name in os.listdir(entry_path))
+            entries.append((os.path.getmtime(entry_path), size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            Logger.info(f"Evicting cached step {name} ({size} bytes)")
+            shutil.rmtree(self._entry_path(name), ignore_errors=True)
+            total -= size
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def default_step_cache() -> StepCache:
+    """
+    Cache shared by all pods, configured with `step_cache_path` and
+    `step_cache_max_bytes` from env["general"] when they are set.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = StepCache(env["general"].get("step_cache_path", STEP_CACHE_DEFAULT_PATH),
+                                       env["general"].get("step_cache_max_bytes", STEP_CACHE_DEFAULT_MAX_BYTES))
+        return _default_cache
@@ -0,0 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timezone
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+from utils.common import generate_random_string
+from utils.environment import env
+from utils.logger import Logger
+import atexit
+import signal
+import threading
+
+# Label with ID of the run which spawned the pod, used to delete all its pods at once.
+RUN_ID_LABEL = "python-pipelines-run"
+# Annotation with pod_timeout of the pod, after which the reaper considers it stale.
+POD_TIMEOUT_ANNOTATION = "python-pipelines/pod-timeout"
+DEFAULT_POD_TIMEOUT: int = 3600
+TEARDOWN_WORKERS: int = 4
+
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor = None
+_pending: list = []
+_namespaces: set = set()
+_cleanup_installed: bool = False
+
+
+def run_id() -> str:
+    """
+    Returns ID of this run, generated on first use unless set as env["kubernetes"]["run_id"].
+    """
+    with _lock:
+        if "run_id" not in env["kubernetes"]:
+            env["kubernetes"]["run_id"] = generate_random_string(12)
+        return env["kubernetes"]["run_id"]
+
+
+def register_namespace(namespace: str) -> None:
+    """
+    Remembers namespace in which a pod of this run has been spawned, for cleanup_run.
+    """
+    with _lock:
+        _namespaces.add(namespace)
+
+
+def fast_teardown() -> bool:
+    return env["kubernetes"].get("fast_teardown", False)
+
+
+def delete_pod(api_instance: client.CoreV1Api, name: str, namespace: str) -> None:
+    """
+    Deletes pod, with fast teardown immediately (grace period 0, pods only sleep so there
+    is nothing to shut down gracefully) and in background, so the caller doesn't wait for
+    the API server. Pods already gone are ignored then.
+    """
+    if not fast_teardown():
+        api_instance.delete_namespaced_pod(name, namespace)
+        return
+
+    def _delete() -> None:
+        try:
+            api_instance.delete_namespaced_pod(name, namespace, grace_period_seconds=0)
+        except ApiException as e:
+            if e.status != 404:
+                Logger.warning(f"Deleting {name} failed: {e.reason}, it is left to cleanup")
+        except Exception as e:
+            Logger.warning(f"Deleting {name} failed: {e}, it is left to cleanup")
+
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TEARDOWN_WORKERS, thread_name_prefix="teardown")
+        _pending[:] = [future for future in _pending if not future.done()]
+        _pending.append(_executor.submit(_delete))
+
+
+def wait_for_deletes() -> None:
+    """
+    Waits until pod deletions requested in background are sent.
+    """
+    with _lock:
+        pending = list(_pending)
+        _pending.clear()
+    for future in pending:
+        future: Future
+        future.result()
+
+
+def cleanup_run(api_instance: client.CoreV1Api = None) -> None:
+    """
+    Deletes all pods labelled with ID of this run which are still there, with a single
+    delete_collection_namespaced_pod request per namespace. Failures (also connection
+    errors) are only logged, so the remaining namespaces are still cleaned up.
+    """
+    wait_for_deletes()
+    api_instance = api_instance if api_instance is not None else env["kubernetes"]["api"]
+    with _lock:
+        namespaces = sorted(_namespaces)
+    for namespace in namespaces:
+        try:
+            api_instance.delete_collection_namespaced_pod(namespace, label_selector=f"{RUN_ID_LABEL}={run_id()}",
+                                                          grace_period_seconds=0)
+        except ApiException as e:
+            Logger.warning(f"Cleaning up pods of run {run_id()} in {namespace} failed: {e.reason}")
+        except Exception as e:
+            Logger.warning(f"Cleaning up pods of run {run_id()} in {namespace} failed: {e}")
+
+
+def _terminate(signum, frame) -> None:
+    # unwinds like Ctrl+C does, so `with Pod(...)` blocks and atexit handlers run
+    raise SystemExit(128 + signum)
+
+
+def install_cleanup() -> None:
+    """
+    Makes sure pods of this run are deleted at exit, also when it is terminated with SIGTERM
+    (e.g. by Jenkins aborting the build). Pods of a killed process are left to the reaper.
+    """
+    global _cleanup_installed
+    if _cleanup_installed:
+        return
+    _cleanup_installed = True
+    atexit.register(cleanup_run)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _terminate)
+
+
+def reap(namespace: str, api_instance: client.CoreV1Api = None, now: datetime = None) -> list:
+    """
+    Deletes pipelines pods (of any run) in `namespace` which are older than their pod_timeout,
+    so they would have already finished sleeping. Returns names of deleted pods.
+    """
+    api_instance = api_instance if api_instance is not None else env["kubernetes"]["api"]
+    now = now if now is not None else datetime.now(timezone.utc)
+    reaped = []
+    for pod in api_instance.list_namespaced_pod(namespace, label_selector="python-pipelines=True").items:
+        pod: client.V1Pod
+        annotations = pod.metadata.annotations or {}
+        try:
+            pod_timeout = int(annotations.get(POD_TIMEOUT_ANNOTATION, DEFAULT_POD_TIMEOUT))
+        except ValueError:
+            pod_timeout = DEFAULT_POD_TIMEOUT
+        created = pod.metadata.creation_timestamp
+        if created is None or (now - created).total_seconds() <= pod_timeout:
+            continue
+        try:
+            api_instance.delete_namespaced_pod(pod.metadata.name, namespace, grace_period_seconds=0)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        reaped.append(pod.metadata.name)
+        Logger.info(f"Reaped {pod.metadata.name}, created {created.isoformat()} with pod_timeout {pod_timeout}s")
+    return reaped
@@ -0,0 +1,297 @@
+"""
+Local stand-in for the Kubernetes API server, implementing just enough of the pod
+API for Pod to work against it: create, read status, watch, delete and exec over
+websocket (v4.channel.k8s.io). Pods are only records; their exec commands run as
+local subprocesses in a per-pod temporary directory.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import base64
+import hashlib
+import json
+import re
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+READ_SIZE: int = 64 * 1024
+
+POD_PATH = re.compile(r"^/api/v1/namespaces/(?P<namespace>[^/]+)/pods(?:/(?P<name>[^/]+)(?:/(?P<subresource>[^/]+))?)?$")
+
+
+class _WebSocket:
+    """
+    Server side of a websocket connection, sending unmasked frames.
+    """
+
+    def __init__(self, connection: socket.socket, reader):
+        self.connection: socket.socket = connection
+        self.reader = reader
+        self._send_lock: threading.Lock = threading.Lock()
+
+    def send(self, payload: bytes, opcode: int = OPCODE_BINARY) -> None:
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 2**16:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+        with self._send_lock:
+            self.connection.sendall(header + payload)
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self.reader.read(size)
+        if len(data) != size:
+            raise ConnectionError("websocket closed")
+        return data
+
+    def receive(self) -> tuple:
+        """
+        Returns (opcode, payload) of the next complete message.
+        """
+        opcode, message = None, b""
+        while True:
+            first, second = self._read_exactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read_exactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read_exactly(8))[0]
+            mask = self._read_exactly(4) if second & 0x80 else None
+            payload = self._read_exactly(length)
+            if mask:
+                payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload)) if length < 1024 else \
+                    (int.from_bytes(payload, "big") ^ int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+                     ).to_bytes(length, "big")
+            frame_opcode = first & 0x0F
+            if frame_opcode == OPCODE_PING:
+                self.send(payload, OPCODE_PONG)
+                continue
+            if frame_opcode != 0:
+                opcode = frame_opcode
+            message += payload
+            if first & 0x80:
+                return opcode, message
+
+
+class FakePod:
+
+    def __init__(self, body: dict, ready_at: float):
+        self.body: dict = body
+        self.ready_at: float = ready_at
+        self.root: str = tempfile.mkdtemp(prefix=f"fake-pod-{body['metadata']['name']}-")
+
+    def to_dict(self) -> dict:
+        phase = "Running" if time.monotonic() >= self.ready_at else "Pending"
+        return dict(self.body, status={"phase": phase})
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """
+    Serves on 127.0.0.1 at a free port (see `host`), in a background thread after `start`.
+    `spawn_delay` is the number of seconds after which created pods become Running.
+    """
+    daemon_threads = True
+    # default backlog of 5 resets connections when dozens of pods connect at once
+    request_queue_size = 256
+
+    def __init__(self, spawn_delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.spawn_delay: float = spawn_delay
+        self.pods: dict = {}
+        self.lock: threading.Lock = threading.Lock()
+        self._resource_version: int = 0
+        self._thread: threading.Thread = None
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_resource_version(self) -> str:
+        with self.lock:
+            self._resource_version += 1
+            return str(self._resource_version)
+
+    def start(self) -> "FakeApiServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        for pod in self.pods.values():
+            shutil.rmtree(pod.root, ignore_errors=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeApiServer
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_not_found(self, name: str) -> None:
+        self._send_json(404, {"kind": "Status", "apiVersion": "v1", "status": "Failure",
+                              "message": f"pods \"{name}\" not found", "reason": "NotFound", "code": 404})
+
+    def _route(self) -> tuple:
+        url = urlparse(self.path)
+        match = POD_PATH.match(url.path)
+        if match is None:
+            self._send_json(404, {"kind": "Status", "status": "Failure", "code": 404})
+            return None
+        return match, parse_qs(url.query)
+
+    def do_POST(self) -> None:
+        route = self._route()
+        if route is None:
+            return
+        match, _ = route
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body.setdefault("metadata", {})["namespace"] = match["namespace"]
+        body["metadata"]["resourceVersion"] = self.server.next_resource_version()
+        pod = FakePod(body, time.monotonic() + self.server.spawn_delay)
+        with self.server.lock:
+            self.server.pods[(match["namespace"], body["metadata"]["name"])] = pod
+        self._send_json(201, pod.to_dict())
+
+    def do_DELETE(self) -> None:
+        route = self._route()
+        if route is None:
+            return
+        match, query = route
+        if match["name"] is None:
+            self._delete_collection(match["namespace"], query)
+            return
+        with self.server.lock:
+            pod = self.server.pods.pop((match["namespace"], match["name"]), None)
+        if pod is None:
+            self._send_not_found(match["name"])
+            return
+        shutil.rmtree(pod.root, ignore_errors=True)
+        self._send_json(200, pod.to_dict())
+
+    def _delete_collection(self, namespace: str, query: dict) -> None:
+        """
+        Deletes pods matching labelSelector made of `key=value` pairs.
+        """
+        selector = dict(pair.split("=", 1) for pair in query.get("labelSelector", [""])[0].split(",") if pair)
+        with self.server.lock:
+            deleted = [key for key, pod in self.server.pods.items() if key[0] == namespace and
+                       all(pod.body["metadata"].get("labels", {}).get(label) == value for label, value in selector.items())]
+            pods = [self.server.pods.pop(key) for key in deleted]
+        for pod in pods:
+            shutil.rmtree(pod.root, ignore_errors=True)
+        self._send_json(200, {"kind": "PodList", "apiVersion": "v1", "metadata": {}, "items": [pod.to_dict() for pod in pods]})
+
+    def do_GET(self) -> None:
+        route = self._route()
+        if route is None:
+            return
+        match, query = route
+        if match["name"] is None:
+            self._watch(match["namespace"], query)
+            return
+        pod = self.server.pods.get((match["namespace"], match["name"]))
+        if pod is None:
+            self._send_not_found(match["name"])
+        elif match["subresource"] == "exec":
+            self._exec(pod, query)
+        else:
+            self._send_json(200, pod.to_dict())
+
+    def _watch(self, namespace: str, query: dict) -> None:
+        """
+        Watch of a single pod selected with metadata.name field selector, sending
+        one MODIFIED event once the pod is running.
+        """
+        name = query.get("fieldSelector", ["metadata.name="])[0].split("=", 1)[1]
+        timeout = float(query.get("timeoutSeconds", ["60"])[0])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pod = self.server.pods.get((namespace, name))
+            if pod is None:
+                return
+            if time.monotonic() >= pod.ready_at:
+                self.wfile.write(json.dumps({"type": "MODIFIED", "object": pod.to_dict()}).encode("utf-8") + b"\n")
+                return
+            time.sleep(min(0.01, max(0.0, pod.ready_at - time.monotonic())))
+        self.close_connection = True
+
+    def _exec(self, pod: FakePod, query: dict) -> None:
+        key = self.headers["Sec-WebSocket-Key"]
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.send_header("Sec-WebSocket-Protocol", "v4.channel.k8s.io")
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        websocket = _WebSocket(self.connection, self.rfile)
+        process = subprocess.Popen(query["command"], cwd=pod.root, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def _pump(stream, channel: int) -> None:
+            for data in iter(lambda: stream.read1(READ_SIZE), b""):
+                websocket.send(bytes([channel]) + data)
+
+        def _receive() -> None:
+            try:
+                while True:
+                    opcode, message = websocket.receive()
+                    if opcode == OPCODE_CLOSE:
+                        break
+                    if message and message[0] == 0:
+                        process.stdin.write(message[1:])
+                        process.stdin.flush()
+            except (ConnectionError, OSError, ValueError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        pumps = [threading.Thread(target=_pump, args=(process.stdout, 1), daemon=True),
+                 threading.Thread(target=_pump, args=(process.stderr, 2), daemon=True)]
+        for thread in pumps:
+            thread.start()
+        threading.Thread(target=_receive, daemon=True).start()
+        for thread in pumps:
+            thread.join()
+        returncode = process.wait()
+        status = {"metadata": {}, "status": "Success"} if returncode == 0 else \
+            {"metadata": {}, "status": "Failure", "reason": "NonZeroExitCode",
+             "details": {"causes": [{"reason": "ExitCode", "message": str(returncode)}]}}
+        try:
+            websocket.send(bytes([3]) + json.dumps(status).encode("utf-8"))
+            websocket.send(struct.pack("!H", 1000), OPCODE_CLOSE)
+        except OSError:
+            pass
@@ -0,0 +1,193 @@
+"""
+Measures Pod against FakeApiServer, so it runs on any Linux box without a cluster:
+spawn latency, exec round-trip latency and output throughput, and copy_file_to /
+copy_file_from / transfer_to throughput for several file sizes, and throughput of many pods
+working concurrently with the default API client and the one of k8s.api.create_api. Results are printed (or written
+with --output) as JSON, so they can be compared between commits:
+
+    python3 tests/benchmarks/pod_benchmark.py --output pod_benchmark.json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+from kubernetes import client
+from tests.benchmarks.fake_api_server import FakeApiServer
+from utils.environment import env
+from utils.masking import SecretMasker
+
+MIB: int = 2**20
+
+
+def make_configuration(server: FakeApiServer) -> client.Configuration:
+    configuration = client.Configuration()
+    configuration.host = server.host
+    return configuration
+
+
+def setup_env(server: FakeApiServer) -> None:
+    env["kubernetes"] = {}
+    env["kubernetes"]["api"] = client.CoreV1Api(client.ApiClient(make_configuration(server)))
+    env["kubernetes"]["pods"] = []
+    env["kubernetes"]["default_namespace"] = "python-pipelines-benchmark"
+    env["kubernetes"]["default_serviceaccount"] = "python-pipelines"
+    env["general"] = {}
+    env["general"]["relocated_env"] = False
+    env["general"]["secrets"] = SecretMasker()
+
+
+def summary(seconds: list) -> dict:
+    return {"median_seconds": statistics.median(seconds), "min_seconds": min(seconds), "max_seconds": max(seconds),
+            "samples": len(seconds)}
+
+
+def measure(function, repeat: int) -> list:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def benchmark_spawn(repeat: int) -> dict:
+    from k8s.pod import Pod
+    pods = []
+
+    def _spawn():
+        pod = Pod("busybox")
+        pod.spawn()
+        pods.append(pod)
+
+    result = summary(measure(_spawn, repeat))
+    for pod in pods:
+        pod.delete()
+    return result
+
+
+def benchmark_exec(pod, repeat: int, output_sizes: list) -> dict:
+    results = {"round_trip": summary(measure(lambda: pod.exec("true", silent=True), repeat)), "output": {}}
+    for size in output_sizes:
+        seconds = measure(lambda: pod.exec(f"head -c {size} /dev/zero", silent=True, binary=True), max(1, repeat // 10))
+        results["output"][str(size)] = dict(summary(seconds), mib_per_second=size / MIB / statistics.median(seconds))
+    return results
+
+
+def benchmark_copy(pod, work_dir: str, repeat: int, file_sizes: list) -> dict:
+    results = {"copy_file_to": {}, "copy_file_from": {}}
+    for size in file_sizes:
+        source_dir = os.path.join(work_dir, f"source-{size}")
+        os.makedirs(source_dir)
+        with open(os.path.join(source_dir, "data"), "wb") as data:
+            # half random, half repeating, so compression has something to do but not everything
+            data.write(os.urandom(size // 2) + b"pipelines" * (size // 2 // 9 + 1))
+        remote_dir = os.path.join(work_dir, f"remote-{size}")
+        seconds = measure(lambda: pod.copy_file_to(source_dir, remote_dir), repeat)
+        results["copy_file_to"][str(size)] = dict(summary(seconds), mib_per_second=size / MIB / statistics.median(seconds))
+
+        def _copy_from():
+            with tempfile.TemporaryDirectory(dir=work_dir) as destination:
+                pod.copy_file_from(os.path.join(remote_dir, os.path.basename(source_dir)), destination)
+
+        seconds = measure(_copy_from, repeat)
+        results["copy_file_from"][str(size)] = dict(summary(seconds), mib_per_second=size / MIB / statistics.median(seconds))
+    return results
+
+
+def benchmark_transfer(pod, other_pod, work_dir: str, repeat: int, file_sizes: list) -> dict:
+    results = {}
+    for size in file_sizes:
+        # reuses files sent by benchmark_copy
+        source = os.path.join(work_dir, f"remote-{size}", f"source-{size}")
+        seconds = measure(lambda: pod.transfer_to(other_pod, source, os.path.join(work_dir, f"transferred-{size}")), repeat)
+        results[str(size)] = dict(summary(seconds), mib_per_second=size / MIB / statistics.median(seconds))
+    return {"transfer_to": results}
+
+
+class _CountingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count: int = 0
+
+    def emit(self, record) -> None:
+        self.count += 1
+
+
+def benchmark_concurrent_pods(server: FakeApiServer, count: int, exec_count: int) -> dict:
+    """
+    Spawns `count` pods at once, runs `exec_count` commands in each and deletes them, first
+    with the default API client and then with the one of create_api sized for `count` pods.
+    """
+    from k8s.api import create_api, api_metrics
+    from k8s.pod import Pod
+    from utils.parallel import parallel
+
+    def _pod_lifecycle():
+        with Pod("busybox") as pod:
+            for _ in range(exec_count):
+                pod.exec("true", silent=True)
+
+    results = {}
+    clients = {"default_client": lambda: client.CoreV1Api(client.ApiClient(make_configuration(server))),
+               "create_api": lambda: create_api(count, make_configuration(server))}
+    for name, create_client in clients.items():
+        env["kubernetes"]["api"] = create_client()
+        pool_warnings = _CountingHandler()
+        logging.getLogger("urllib3.connectionpool").addHandler(pool_warnings)
+        start = time.perf_counter()
+        try:
+            parallel({f"pod{index}": _pod_lifecycle for index in range(count)}, max_workers=count)
+        finally:
+            logging.getLogger("urllib3.connectionpool").removeHandler(pool_warnings)
+        seconds = time.perf_counter() - start
+        results[name] = {"pods": count, "seconds": seconds, "pods_per_second": count / seconds,
+                         "connection_pool_warnings": pool_warnings.count}
+        if api_metrics():
+            results[name]["api"] = api_metrics()
+    setup_env(server)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="samples per latency measurement")
+    parser.add_argument("--copy-repeat", type=int, default=3, help="samples per copy measurement")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[MIB, 16 * MIB, 64 * MIB],
+                        help="sizes in bytes of copied files and exec outputs")
+    parser.add_argument("--concurrent-pods", type=int, default=50, help="pods working at once in concurrency benchmark")
+    parser.add_argument("--output", help="file to write JSON results to instead of stdout")
+    args = parser.parse_args()
+
+    server = FakeApiServer().start()
+    setup_env(server)
+    from k8s.pod import Pod
+    from utils.logger import logger
+    logger.setLevel("WARNING")
+    results = {"python": sys.version.split()[0], "spawn": benchmark_spawn(args.repeat)}
+    try:
+        with tempfile.TemporaryDirectory() as work_dir, Pod("busybox") as pod, Pod("busybox") as other_pod:
+            results["exec"] = benchmark_exec(pod, args.repeat, args.sizes)
+            results.update(benchmark_copy(pod, work_dir, args.copy_repeat, args.sizes))
+            results.update(benchmark_transfer(pod, other_pod, work_dir, args.copy_repeat, args.sizes))
+        results["concurrent_pods"] = benchmark_concurrent_pods(server, args.concurrent_pods, 5)
+    finally:
+        server.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
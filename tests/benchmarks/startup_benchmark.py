@@ -0,0 +1,65 @@
+"""
+Measures startup time of pipelines entry point and of importing k8s.pod,
+in fresh interpreters, together with the slowest imports reported by
+`python -X importtime`. Results are printed (or written with --output) as JSON:
+
+    python3 tests/benchmarks/startup_benchmark.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+SCENARIOS = {
+    "pipelines --help": [os.path.join(REPO_DIR, "pipelines"), "--help"],
+    "import k8s.pod": ["-c", "import k8s.pod"],
+    "load pod templates": ["-c", "import k8s.pod; k8s.pod.get_pod_templates()"],
+}
+
+
+def run(arguments: list, importtime: bool = False) -> tuple:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + arguments
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, process.stderr
+
+
+def slowest_imports(importtime_output: str, count: int) -> list:
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            imports.append({"module": name.strip(), "cumulative_us": int(cumulative)})
+    return sorted(imports, key=lambda entry: entry["cumulative_us"], reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest top-level imports reported")
+    parser.add_argument("--output", help="file to write JSON results to instead of stdout")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "runs": args.runs, "scenarios": {}}
+    for name, arguments in SCENARIOS.items():
+        run(arguments)  # warm up filesystem and bytecode caches
+        seconds = [run(arguments)[0] for _ in range(args.runs)]
+        results["scenarios"][name] = {"median_seconds": statistics.median(seconds), "min_seconds": min(seconds),
+                                      "slowest_imports": slowest_imports(run(arguments, importtime=True)[1], args.top)}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import unittest
+import asyncio
+import tempfile
+import os
+from k8s.api import close_async_apis
+from k8s.async_pod import AsyncPod
+from tests.integration_tests.generic_test import GenericTest
+
+
+class AsyncPodTests(GenericTest):
+
+    def run_async(self, coroutine):
+        async def _run():
+            try:
+                return await coroutine
+            finally:
+                await close_async_apis()
+        return asyncio.run(_run())
+
+    def test_exec_pod_correct_return_value(self):
+        """
+        Test to verify if exec command on async pod returns correct return value and output.
+        """
+        async def _test():
+            async with AsyncPod("busybox") as pod:
+                result = await pod.exec("cat /etc/hostname", silent=True, useLegacyShell=True)
+                self.assertEqual(result["ret_val"], 0)
+                self.assertEqual(result["output"], pod.name)
+                result = await pod.exec("ls /etc/passwddddddddd", silent=True, useLegacyShell=True)
+                self.assertNotEqual(result["ret_val"], 0)
+        self.run_async(_test())
+
+    def test_many_pods_in_one_event_loop(self):
+        """
+        Test to verify if several async pods can be driven concurrently from one event loop.
+        """
+        async def _spawn_and_exec(i):
+            async with AsyncPod("busybox") as pod:
+                return (await pod.exec(f"echo {i}", silent=True, useLegacyShell=True))["output"]
+
+        async def _test():
+            return await asyncio.gather(*[_spawn_and_exec(i) for i in range(5)])
+        self.assertEqual(self.run_async(_test()), [str(i) for i in range(5)])
+
+    def test_copy_to_and_from_pod(self):
+        """
+        Test to verify if coping files to and from async pod works correctly.
+        """
+        test_content = "somecontent"
+        async def _test():
+            async with AsyncPod("busybox") as pod:
+                with tempfile.TemporaryDirectory() as tmpdirname:
+                    with open(f"{tmpdirname}/somefile", "w") as f:
+                        f.write(test_content)
+                    await pod.copy_file_to(f"{tmpdirname}/somefile", "/optopt")
+                    self.assertTrue(await pod.check_is_file("/optopt/somefile"))
+                with tempfile.TemporaryDirectory() as tmpdirname:
+                    await pod.copy_file_from("/optopt/somefile", tmpdirname)
+                    with open(os.path.join(tmpdirname, "somefile")) as f:
+                        self.assertEqual(f.read(), test_content)
+        self.run_async(_test())
+
+
+if __name__=='__main__':
+    unittest.main()
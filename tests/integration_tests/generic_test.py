@@ -3,6 +3,8 @@ import tempfile
 import shutil
 from utils.environment import env
 from kubernetes import client, config
+from k8s.api import create_api
+from utils.masking import SecretMasker
 
 
 class GenericTest(unittest.TestCase):
@@ -12,13 +14,13 @@ class GenericTest(unittest.TestCase):
         print("Setting up the environmet")
         config.load_kube_config()
         env["kubernetes"] = {}
-        env["kubernetes"]["api"] = client.CoreV1Api()
+        env["kubernetes"]["api"] = create_api()
         env["kubernetes"]["pods"] = []
         env["kubernetes"]["default_namespace"] = "python-pipelines-test"
         env["kubernetes"]["default_serviceaccount"] = "python-pipelines"
         env["general"] = {}
         env["general"]["relocated_env"] = False
-        env["general"]["secrets"] = []
+        env["general"]["secrets"] = SecretMasker()
         env["general"]["artifacts_dir_name"] = ".artifacts"
         env["general"]["artifacts_path"] = tempfile.mkdtemp()
         cls.kubernetes_api: client.CoreV1Api = env["kubernetes"]["api"]
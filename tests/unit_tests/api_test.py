@@ -0,0 +1,49 @@
+import socket
+import unittest
+from unittest.mock import Mock, patch
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+from k8s.api import create_api, api_metrics, MeteredApiClient, API_REQUEST_TIMEOUT
+from tests.unit_tests.generic_test import GenericTest
+from utils.environment import env
+
+
+def make_configuration() -> client.Configuration:
+    configuration = client.Configuration()
+    configuration.host = "http://127.0.0.1:1"
+    return configuration
+
+
+class ApiTests(GenericTest):
+
+    def test_create_api_sizes_pool_for_concurrency(self):
+        api_instance = create_api(50, make_configuration(), retries=2)
+        api_client: MeteredApiClient = api_instance.api_client
+        pool_manager = api_client.rest_client.pool_manager
+        self.assertEqual(pool_manager.connection_pool_kw["maxsize"], 100)
+        self.assertEqual(pool_manager.connection_pool_kw["retries"].total, 2)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), pool_manager.connection_pool_kw["socket_options"])
+
+    def test_requests_are_metered(self):
+        env["kubernetes"]["api"] = create_api(4, make_configuration())
+        rest_client = env["kubernetes"]["api"].api_client.rest_client
+        response = Mock(status=200, data=b'{"kind": "Pod", "apiVersion": "v1", "metadata": {"name": "busybox"}}')
+        response.getheaders.return_value = {}
+        with patch.object(rest_client, "GET", return_value=response) as get_mock:
+            env["kubernetes"]["api"].read_namespaced_pod_status("busybox", "python-pipelines-test")
+        self.assertEqual(get_mock.call_args.kwargs["_request_timeout"], API_REQUEST_TIMEOUT)
+        with patch.object(rest_client, "GET", side_effect=ApiException(status=500)):
+            with self.assertRaises(ApiException):
+                env["kubernetes"]["api"].read_namespaced_pod_status("busybox", "python-pipelines-test")
+        metrics = api_metrics()
+        self.assertEqual((metrics["requests"], metrics["errors"], metrics["peak_in_flight"]), (2, 1, 1))
+        self.assertGreaterEqual(metrics["latency"]["max_seconds"], metrics["latency"]["p50_seconds"])
+        self.assertEqual(metrics["pool"]["opened"], 0)
+
+    def test_api_metrics_of_plain_client(self):
+        env["kubernetes"]["api"] = client.CoreV1Api(client.ApiClient(make_configuration()))
+        self.assertEqual(api_metrics(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from tests.unit_tests.generic_test import GenericTest
+from utils.artifacts import ArtifactStore, read_manifest, update_manifest
+from utils.common import archive_artifacts, ArtifactNotExistsException, PipelinesException
+from utils.environment import env
+
+
+class ArtifactsTests(GenericTest):
+
+    def test_archive_local_artifacts_with_manifest(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as artifacts_path:
+            env["general"]["artifacts_path"] = artifacts_path
+            for name in ["a.log", "b.log", "c.txt"]:
+                with open(os.path.join(source, name), "w") as file:
+                    file.write(name)
+            artifacts = archive_artifacts([os.path.join(source, "*.log")])
+            self.assertEqual(sorted(artifacts), ["a.log", "b.log"])
+            self.assertFalse(os.path.exists(os.path.join(artifacts_path, "c.txt")))
+            manifest = read_manifest(artifacts_path)["artifacts"]
+            self.assertEqual(manifest["a.log"]["origin"], "local")
+            self.assertEqual(manifest["a.log"]["files"]["a.log"]["size"], 5)
+            with self.assertRaises(ArtifactNotExistsException):
+                archive_artifacts([os.path.join(source, "*.xml")])
+
+    def test_update_manifest_merges_entries(self):
+        with tempfile.TemporaryDirectory() as artifacts_path:
+            update_manifest(artifacts_path, {"a": {"size": 1}})
+            update_manifest(artifacts_path, {"b": {"size": 2}, "a": {"size": 3}})
+            self.assertEqual(read_manifest(artifacts_path), {"artifacts": {"a": {"size": 3}, "b": {"size": 2}}})
+
+    def test_store_deduplicates_with_hardlinks(self):
+        with tempfile.TemporaryDirectory() as store_path, tempfile.TemporaryDirectory() as artifacts_path:
+            store = ArtifactStore(store_path)
+            for name in ["a", "b"]:
+                with open(os.path.join(artifacts_path, name), "w") as file:
+                    file.write("same")
+            digests = store.ingest(artifacts_path)
+            self.assertEqual(digests["a"], digests["b"])
+            self.assertTrue(store.has(digests["a"]))
+            self.assertEqual(os.stat(os.path.join(artifacts_path, "a")).st_ino,
+                             os.stat(os.path.join(artifacts_path, "b")).st_ino)
+            store.materialize(digests["a"], os.path.join(artifacts_path, "copy", "c"))
+            with open(os.path.join(artifacts_path, "copy", "c")) as file:
+                self.assertEqual(file.read(), "same")
+            with self.assertRaises(PipelinesException):
+                store.add(os.path.join(artifacts_path, "a"), "0" * 64)
+
+    def test_store_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as store_path, tempfile.TemporaryDirectory() as artifacts_path:
+            store = ArtifactStore(store_path, max_bytes=10)
+            digests = []
+            for index, content in enumerate(["old blob", "new blob"]):
+                path = os.path.join(artifacts_path, content)
+                with open(path, "w") as file:
+                    file.write(content)
+                digests.append(store.add(path))
+                os.utime(store.blob_path(digests[-1]), (1000 + index, 1000 + index))
+            store.max_age = float("inf")
+            self.assertEqual(store.evict(), {"blobs": 1, "bytes": 8, "evicted": 1})
+            self.assertFalse(store.has(digests[0]))
+            self.assertTrue(store.has(digests[1]))
+            store.max_age = 0
+            self.assertEqual(store.evict()["blobs"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
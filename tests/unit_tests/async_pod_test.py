@@ -0,0 +1,139 @@
+import base64
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import aiohttp
+from unittest.mock import AsyncMock, Mock, patch
+from k8s.async_pod import AsyncPod
+from k8s.exec_io import parse_returncode, ExecException
+from k8s.pod import PodException, PodStartupException, COPY_FAILED_MARKER
+from tests.unit_tests.generic_test import GenericAsyncTest, make_pod_details
+from utils.environment import env
+
+
+class FakeWebSocket:
+
+    def __init__(self, frames: list):
+        self.frames = [Mock(type=aiohttp.WSMsgType.BINARY, data=frame) for frame in frames]
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.frames:
+            raise StopAsyncIteration
+        return self.frames.pop(0)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+class AsyncPodTests(GenericAsyncTest):
+
+    def setUp(self):
+        super().setUp()
+        self.api = AsyncMock()
+        self.ws_api = AsyncMock()
+        patcher = patch("k8s.async_pod.get_async_apis", return_value=(self.api, self.ws_api))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_returncode(self):
+        self.assertEqual(parse_returncode('{"metadata":{},"status":"Success"}'), 0)
+        failure = '{"status":"Failure","reason":"NonZeroExitCode","details":{"causes":[{"reason":"ExitCode","message":"2"}]}}'
+        self.assertEqual(parse_returncode(failure), 2)
+        with self.assertRaises(ExecException):
+            parse_returncode('{"status":"Failure","message":"executable file not found"}')
+
+    async def test_exec(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        self.ws_api.connect_get_namespaced_pod_exec.return_value = FakeWebSocket(
+            [b"\x01hello\n", b"\x02world\n", b'\x03{"metadata":{},"status":"Success"}'])
+        pod = AsyncPod("busybox")
+        result = await pod.exec("echo hello", silent=True)
+        self.assertEqual(result, {"ret_val": 0, "output": "hello\nworld", "stdout": "hello\n", "stderr": "world\n"})
+
+    async def test_wait_for_running_status_fails_fast(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Failed")
+        pod = AsyncPod("busybox")
+        with self.assertRaises(PodStartupException):
+            await pod.wait_for_running_status()
+
+    async def test_pod_failing_to_start_is_deleted(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Failed")
+        with self.assertRaises(PodStartupException):
+            async with AsyncPod("busybox"):
+                pass
+        self.api.delete_namespaced_pod.assert_awaited_once()
+        self.assertEqual(env["kubernetes"]["pods"], [])
+
+    async def test_copy_file_to_frames_stdin(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        ws = FakeWebSocket([b'\x03{"metadata":{},"status":"Success"}'])
+        self.ws_api.connect_get_namespaced_pod_exec.return_value = ws
+        pod = AsyncPod("busybox")
+        await pod.copy_file_to(__file__, "/tmp/dest")
+        self.assertEqual(ws.sent[-1], b"\x00PYTHON-PIPELINES-EOF\n")
+        command = self.ws_api.connect_get_namespaced_pod_exec.call_args.kwargs["command"]
+        self.assertIn("tar zxf - --directory /tmp/dest", command[-1])
+        archive = base64.b64decode(b"".join(frame[1:] for frame in ws.sent[:-1]))
+        with tarfile.open(fileobj=io.BytesIO(archive), mode='r:gz') as tar:
+            self.assertEqual(tar.getnames(), [os.path.basename(__file__)])
+
+    async def test_copy_file_to_failing_archive_is_not_terminated(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        ws = FakeWebSocket([b'\x03{"metadata":{},"status":"Success"}'])
+        self.ws_api.connect_get_namespaced_pod_exec.return_value = ws
+        with self.assertRaises(FileNotFoundError):
+            await AsyncPod("busybox").copy_file_to("/missing/file", "/tmp/my dest")
+        self.assertNotIn(b"\x00PYTHON-PIPELINES-EOF\n", ws.sent)
+        self.assertTrue(ws.closed)
+        command = self.ws_api.connect_get_namespaced_pod_exec.call_args.kwargs["command"]
+        self.assertIn("mkdir -p '/tmp/my dest'", command[-1])
+
+    async def test_copy_file_from_extracts_streamed_archive(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            content = os.urandom(100000)
+            info = tarfile.TarInfo("my file")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        encoded = base64.encodebytes(archive.getvalue())
+        # frames split base64 at arbitrary positions
+        frames = [b"\x01" + encoded[offset:offset + 1001] for offset in range(0, len(encoded), 1001)]
+        self.ws_api.connect_get_namespaced_pod_exec.return_value = FakeWebSocket(
+            frames + [b'\x03{"metadata":{},"status":"Success"}'])
+        with tempfile.TemporaryDirectory() as destination:
+            await AsyncPod("busybox").copy_file_from("/tmp/my file", destination)
+            with open(os.path.join(destination, "my file"), "rb") as copied:
+                self.assertEqual(copied.read(), content)
+        command = self.ws_api.connect_get_namespaced_pod_exec.call_args.kwargs["command"]
+        self.assertIn('cd "$(dirname \'/tmp/my file\')" && tar cf - "$(basename \'/tmp/my file\')"', command[-1])
+
+    async def test_copy_file_from_reports_tar_failure(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        # base64 of the empty gzip stream succeeds, so only the marker tells tar failed
+        self.ws_api.connect_get_namespaced_pod_exec.return_value = FakeWebSocket([
+            b"\x02tar: missing: No such file or directory\n" + COPY_FAILED_MARKER.encode() + b"\n",
+            b'\x03{"metadata":{},"status":"Success"}'])
+        with self.assertRaises(PodException) as context:
+            await AsyncPod("busybox").copy_file_from("/missing", "/tmp")
+        self.assertIn("No such file", str(context.exception))
+        self.assertNotIn(COPY_FAILED_MARKER, str(context.exception))
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+from k8s.bootstrap import DependencyBootstrap, requirements_hash
+from tests.unit_tests.generic_test import GenericTest
+
+
+class DependencyBootstrapTests(GenericTest):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.requirements_path = os.path.join(self.temp_dir.name, "requirements.txt")
+        with open(self.requirements_path, "w") as requirements:
+            requirements.write("kubernetes==23.3.0\n")
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        self.pod = Mock(image="python:3.9.12")
+        self.pod.name = "pipelines-pod"
+        self.pod.check_is_file.return_value = False
+        self.pod.exec.return_value = {"ret_val": 0, "output": ""}
+        self.pod._download_archive.side_effect = lambda command, read, description: read(io.BytesIO(b"layer"))
+        self.uploaded = []
+        self.pod._upload_archive.side_effect = lambda destination, write: write(self)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def write(self, data):
+        self.uploaded.append(data)
+
+    def bootstrap(self, **kwargs) -> DependencyBootstrap:
+        return DependencyBootstrap(self.pod, self.requirements_path, "/relocated/pipelines/requirements.txt",
+                                   "/relocated", cache_dir=self.cache_dir, **kwargs)
+
+    def test_install_then_layer(self):
+        stats = self.bootstrap().run()
+        self.assertEqual(stats["method"], "install")
+        self.assertIn("pip3 install", self.pod.exec.call_args.args[0])
+        self.assertIn("--target /relocated/.dependencies -r /relocated/pipelines/requirements.txt",
+                      self.pod.exec.call_args.args[0])
+
+        self.pod.exec.reset_mock()
+        stats = self.bootstrap().run()
+        self.assertEqual(stats["method"], "layer")
+        self.assertIsNotNone(stats["saved_seconds"])
+        self.pod.exec.assert_not_called()
+        self.assertEqual(self.pod._upload_archive.call_args.args[0], "/relocated/.dependencies")
+        self.assertEqual(b"".join(self.uploaded), b"layer")
+
+    def test_marker_in_pod(self):
+        self.pod.check_is_file.return_value = True
+        bootstrap = self.bootstrap()
+        self.assertEqual(bootstrap.run()["method"], "marker")
+        self.assertTrue(self.pod.check_is_file.call_args.args[0].endswith(bootstrap.key))
+        self.pod.exec.assert_not_called()
+
+    def test_changed_requirements_and_wheelhouse(self):
+        key = requirements_hash(self.requirements_path, "python:3.9.12")
+        self.bootstrap().run()
+        with open(self.requirements_path, "a") as requirements:
+            requirements.write("pyyaml\n")
+        self.assertNotEqual(requirements_hash(self.requirements_path, "python:3.9.12"), key)
+        stats = self.bootstrap(wheelhouse="/local/wheels").run()
+        self.assertEqual(stats["method"], "wheelhouse")
+        self.assertIn("--no-index --find-links /relocated/wheels", self.pod.exec.call_args.args[0])
+
+    def test_bundle_on_pythonpath(self):
+        bootstrap = self.bootstrap(bundle="/local/dependencies.pyz")
+        self.assertEqual(bootstrap.run()["method"], "bundle")
+        self.pod.copy_file_to.assert_called_once_with("/local/dependencies.pyz", "/relocated")
+        self.assertEqual(bootstrap.environment(), "PYTHONPATH=/relocated/.dependencies:/relocated/dependencies.pyz")
+
+
+if __name__ == '__main__':
+    unittest.main()
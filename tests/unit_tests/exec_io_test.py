@@ -0,0 +1,114 @@
+import unittest
+import base64
+import os
+import subprocess
+import tarfile
+import tempfile
+from tests.unit_tests.generic_test import FakeWSClient
+from k8s.exec_io import ExecStdinWriter, ExecStdoutReader, OutputBuffer, LineSplitter, STDIN_CHUNK_SIZE, STDOUT_CHANNEL, STDERR_CHANNEL, stdin_command
+
+
+class ExecStdinWriterTests(unittest.TestCase):
+
+    def run_remote(self, command: str, stdin: bytes) -> subprocess.CompletedProcess:
+        """
+        Runs command wrapped with stdin_command locally, like it would be run in pod.
+        Data after end marker is appended to make sure it isn't read by the command.
+        """
+        return subprocess.run(["sh", "-c", stdin_command(command)], input=stdin + b"garbage\n", capture_output=True)
+
+    def test_stream_roundtrip(self):
+        content = os.urandom(3 * STDIN_CHUNK_SIZE + 123)
+        for compresslevel in [None, 6]:
+            resp = FakeWSClient()
+            with ExecStdinWriter(resp, compresslevel) as stdin:
+                for offset in range(0, len(content), 1000):
+                    stdin.write(content[offset:offset + 1000])
+            self.assertGreater(resp.writes, 3, "Data should be sent in chunks")
+            decode = "gzip -dc" if compresslevel else "cat"
+            result = self.run_remote(decode, bytes(resp.stdin))
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout, content)
+
+    def test_tar_roundtrip(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as destination:
+            os.mkdir(os.path.join(source, "dir"))
+            for i in range(3):
+                with open(os.path.join(source, "dir", f"file{i}"), "wb") as f:
+                    f.write(os.urandom(50000 * i))
+            resp = FakeWSClient()
+            with ExecStdinWriter(resp, 6) as stdin:
+                with tarfile.open(fileobj=stdin, mode="w|") as tar:
+                    tar.add(os.path.join(source, "dir"), arcname="dir")
+            result = self.run_remote(f"tar zxf - --directory {destination}", bytes(resp.stdin))
+            self.assertEqual(result.returncode, 0, result.stderr)
+            for i in range(3):
+                with open(os.path.join(source, "dir", f"file{i}"), "rb") as expected, \
+                        open(os.path.join(destination, "dir", f"file{i}"), "rb") as copied:
+                    self.assertEqual(expected.read(), copied.read())
+
+
+
+class ExecStdoutReaderTests(unittest.TestCase):
+
+    def test_tar_stream_extraction(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as destination:
+            content = os.urandom(200000)
+            with open(os.path.join(source, "file"), "wb") as f:
+                f.write(content)
+            encoded = subprocess.run(["sh", "-c", f"cd {source} && tar cf - file | gzip -c | base64"],
+                                     capture_output=True, check=True).stdout
+            frames = [(STDOUT_CHANNEL, encoded[offset:offset + 1001]) for offset in range(0, len(encoded), 1001)]
+            frames.insert(3, (STDERR_CHANNEL, b"warning"))
+            stdout = ExecStdoutReader(FakeWSClient(frames))
+            with tarfile.open(fileobj=stdout, mode="r|*") as tar:
+                tar.extractall(path=destination)
+            stdout.drain()
+            with open(os.path.join(destination, "file"), "rb") as f:
+                self.assertEqual(f.read(), content)
+            self.assertEqual(stdout.stderr, "warning")
+            self.assertEqual(stdout.bytes_read, len(base64.b64decode(encoded)))
+
+
+
+class OutputBufferTests(unittest.TestCase):
+
+    def fill(self, output_buffer: OutputBuffer, content: bytes) -> OutputBuffer:
+        for offset in range(0, len(content), 7):
+            output_buffer.append(content[offset:offset + 7])
+        return output_buffer
+
+    def test_retention(self):
+        content = bytes(range(100))
+        self.assertEqual(self.fill(OutputBuffer(30, "head"), content).getvalue(), content[:30])
+        self.assertEqual(self.fill(OutputBuffer(30, "tail"), content).getvalue(), content[-30:])
+        self.assertEqual(self.fill(OutputBuffer(30, "head+tail"), content).getvalue(), content[:15] + content[-15:])
+        for retention in ["head", "tail", "head+tail"]:
+            output_buffer = self.fill(OutputBuffer(1000, retention), content)
+            self.assertEqual(output_buffer.getvalue(), content)
+            self.assertFalse(output_buffer.truncated)
+
+    def test_unknown_retention(self):
+        with self.assertRaises(ValueError):
+            OutputBuffer(10, "middle")
+
+
+class LineSplitterTests(unittest.TestCase):
+
+    def test_lines_split_between_frames(self):
+        splitter = LineSplitter()
+        content = "zażółć\n\nline two\nlast".encode("utf-8")
+        lines = []
+        for offset in range(len(content)):
+            lines += splitter.feed(content[offset:offset + 1])
+        self.assertEqual(lines + splitter.flush(), ["zażółć", "", "line two", "last"])
+
+    def test_binary_lines(self):
+        splitter = LineSplitter(binary=True)
+        self.assertEqual(splitter.feed(b"\xff\x00\nab"), [b"\xff\x00"])
+        self.assertEqual(splitter.feed(b"c\n"), [b"abc"])
+        self.assertEqual(splitter.flush(), [])
+
+
+if __name__=='__main__':
+    unittest.main()
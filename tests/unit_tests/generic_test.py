@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import Mock
+from kubernetes import client
+from k8s.exec_io import ERROR_CHANNEL, parse_returncode
+from utils.environment import env
+from utils.masking import SecretMasker
+
+
+def make_pod_details(phase: str = "Pending", waiting_reason: str = None, conditions: list = None) -> client.V1Pod:
+    container_statuses = None
+    if waiting_reason is not None:
+        state = client.V1ContainerState(waiting=client.V1ContainerStateWaiting(reason=waiting_reason))
+        container_statuses = [client.V1ContainerStatus(name="c", image="i", image_id="", ready=False, restart_count=0, state=state)]
+    status = client.V1PodStatus(phase=phase, container_statuses=container_statuses, conditions=conditions)
+    return client.V1Pod(metadata=client.V1ObjectMeta(resource_version="1"), status=status)
+
+
+class FakeWSClient:
+    """
+    Stands in for BinaryWSClient, receiving given (channel, bytes) frames one per update.
+    """
+
+    def __init__(self, frames: list = None):
+        self.stdin = bytearray()
+        self.writes = 0
+        self.frames = frames
+        self.channels = {}
+        self.open = True
+
+    def is_open(self):
+        return self.open
+
+    def write_stdin(self, data):
+        self.writes += 1
+        self.stdin += data.encode("utf-8") if isinstance(data, str) else data
+
+    def update(self, timeout=0):
+        if self.frames:
+            channel, data = self.frames.pop(0)
+            self.channels[channel] = self.channels.get(channel, b"") + data
+        elif self.frames is not None:
+            self.open = False
+
+    def pop_channel(self, channel):
+        return self.channels.pop(channel, b"")
+
+    def close(self):
+        self.open = False
+
+    @property
+    def returncode(self):
+        return parse_returncode(self.pop_channel(ERROR_CHANNEL).decode("utf-8"))
+
+
+def setup_env() -> None:
+    env["kubernetes"] = {}
+    env["kubernetes"]["api"] = Mock()
+    env["kubernetes"]["pods"] = []
+    env["kubernetes"]["default_namespace"] = "python-pipelines-test"
+    env["kubernetes"]["default_serviceaccount"] = "python-pipelines"
+    env["general"] = {}
+    env["general"]["relocated_env"] = False
+    env["general"]["secrets"] = SecretMasker()
+
+
+class GenericTest(unittest.TestCase):
+
+    def setUp(self):
+        setup_env()
+        self.api: Mock = env["kubernetes"]["api"]
+
+    def tearDown(self):
+        env.clear()
+
+
+class GenericAsyncTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        setup_env()
+
+    def tearDown(self):
+        env.clear()
@@ -0,0 +1,59 @@
+import base64
+import unittest
+import urllib.parse
+from unittest.mock import patch
+from k8s.pod import Pod
+from k8s.exec_io import STDOUT_CHANNEL, ERROR_CHANNEL
+from utils.environment import env
+from utils.logger import Logger
+from utils.masking import SecretMasker
+from tests.unit_tests.generic_test import GenericTest, FakeWSClient, make_pod_details
+
+SECRET = "marchewkowa/p@ss"
+
+
+class MaskingTests(GenericTest):
+
+    def test_masks_only_secret(self):
+        masker = SecretMasker()
+        masker.add(SECRET)
+        self.assertEqual(masker.mask(f"user: ogorek, password: {SECRET}."), f"user: ogorek, password: {'*' * len(SECRET)}.")
+
+    def test_masks_encoded_forms(self):
+        masker = SecretMasker()
+        masker.add(SECRET)
+        for prefix in [b"", b"a", b"ab", b"abc"]:
+            encoded = base64.b64encode(prefix + b"Authorization " + SECRET.encode("utf-8") + b" end").decode("ascii")
+            self.assertNotIn(base64.b64encode(SECRET.encode("utf-8"))[4:12].decode("ascii"), masker.mask(encoded))
+            self.assertIn("****", masker.mask(encoded))
+        self.assertEqual(masker.mask(urllib.parse.quote_plus(SECRET)), "*" * len(urllib.parse.quote_plus(SECRET)))
+
+    def test_recompiled_after_change(self):
+        masker = SecretMasker()
+        masker.add(SECRET)
+        self.assertNotIn(SECRET, masker.mask(SECRET))
+        masker.remove(SECRET)
+        self.assertEqual(masker.mask(SECRET), SECRET)
+        self.assertEqual(len(masker), 0)
+
+    def test_secret_split_between_exec_frames(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        env["general"]["secrets"].add(SECRET)
+        frames = [(STDOUT_CHANNEL, b"token=marchew"), (STDOUT_CHANNEL, b"kowa/p@ss\nnext line\n"),
+                  (ERROR_CHANNEL, b'{"status":"Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)), \
+                patch("utils.logger.logger") as logger_mock:
+            Pod("busybox").exec("env")
+        logged = "\n".join(call.args[0] for call in logger_mock.info.call_args_list)
+        self.assertNotIn("marchew", logged)
+        self.assertIn("token=" + "*" * len(SECRET), logged)
+        self.assertIn("next line", logged)
+
+    def test_logger_without_secrets(self):
+        with patch("utils.logger.logger") as logger_mock:
+            Logger.info(SECRET)
+        logger_mock.info.assert_called_once_with(SECRET)
+
+
+if __name__=='__main__':
+    unittest.main()
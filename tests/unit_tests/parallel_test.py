@@ -0,0 +1,53 @@
+import unittest
+import threading
+from utils.parallel import parallel, raise_if_cancelled, ParallelException, BranchCancelledException
+from tests.unit_tests.generic_test import GenericTest
+
+
+class ParallelTests(GenericTest):
+
+    def test_parallel_returns_results(self):
+        results = parallel({"a": lambda: 1, "b": lambda: 2, "c": lambda: 3}, max_workers=2)
+        self.assertEqual(results, {"a": 1, "b": 2, "c": 3})
+
+    def test_parallel_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        results = parallel({name: barrier.wait for name in ["a", "b", "c"]})
+        self.assertEqual(len(results), 3)
+
+    def test_parallel_wait_all(self):
+        def fail():
+            raise RuntimeError("broken")
+
+        with self.assertRaises(ParallelException) as context:
+            parallel({"ok": lambda: "done", "broken": fail}, fail_fast=False)
+        self.assertEqual(list(context.exception.failures), ["broken"])
+        self.assertEqual(context.exception.results, {"ok": "done"})
+
+    def test_parallel_fail_fast_cancels_other_branches(self):
+        failed = threading.Event()
+
+        def fail():
+            failed.set()
+            raise RuntimeError("broken")
+
+        def slow():
+            failed.wait(5)
+            for _ in range(500):
+                raise_if_cancelled()
+                threading.Event().wait(0.01)
+            return "finished"
+
+        with self.assertRaises(ParallelException) as context:
+            parallel({"broken": fail, "slow": slow})
+        self.assertIsInstance(context.exception.failures["slow"], BranchCancelledException)
+
+    def test_parallel_prefixes_logs(self):
+        from utils.logger import Logger
+        prefixes = parallel({"first": Logger.get_prefix, "second": Logger.get_prefix})
+        self.assertEqual(prefixes, {"first": "[first] ", "second": "[second] "})
+        self.assertEqual(Logger.add_prefix("text"), "text")
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import Mock, patch
+from k8s.pod import PodStartupException
+from k8s.pod_pool import PodPool
+from tests.unit_tests.generic_test import GenericTest
+from utils.environment import env
+
+
+def make_pod(pod_template_name: str, **kwargs) -> Mock:
+    pod = Mock()
+    pod.pod_template_name = pod_template_name
+    pod.name = f"{pod_template_name}-{id(pod)}"
+    pod.exec.return_value = {"ret_val": 0, "output": ""}
+    return pod
+
+
+class PodPoolTests(GenericTest):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch("k8s.pod_pool.Pod", side_effect=make_pod)
+        self.pod_class: Mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_prewarm(self, pool: PodPool):
+        for thread in pool._threads:
+            thread.join()
+
+    def test_reuses_released_pod(self):
+        pool = PodPool(size=1, reset_command="rm -rf /workspace/*")
+        with pool.pod("busybox") as first:
+            pass
+        self.wait_for_prewarm(pool)
+        with pool.pod("busybox") as second:
+            self.assertIs(first, second, "Released pod should be handed out again")
+        first.exec.assert_called_with("rm -rf /workspace/*", silent=True)
+        first.delete.assert_not_called()
+        self.assertEqual(pool.stats["hits"], 1)
+        self.assertEqual(pool.stats["misses"], 1)
+        pool.drain()
+        first.delete.assert_called_once()
+
+    def test_recycles_pod_without_reset_command(self):
+        pool = PodPool(size=1)
+        with pool.pod("busybox") as first:
+            pass
+        first.delete.assert_called_once()
+        self.wait_for_prewarm(pool)
+        with pool.pod("busybox") as second:
+            self.assertIsNot(first, second)
+        self.assertEqual(pool.stats["hits"], 1)
+        pool.drain()
+
+    def test_recycles_pod_after_failure(self):
+        pool = PodPool(size=1, reset_command="true")
+        with self.assertRaises(RuntimeError):
+            with pool.pod("busybox") as pod:
+                raise RuntimeError()
+        pod.delete.assert_called_once()
+        pool.drain()
+
+    def test_pod_failing_reset_is_replaced(self):
+        pool = PodPool(size=1, reset_command="rm -rf /workspace/*")
+        with pool.pod("busybox") as pod:
+            pod.exec.side_effect = ConnectionResetError("websocket dropped")
+        pod.delete.assert_called_once()
+        self.assertNotIn(pod.name, pool._spawned_at)
+        self.wait_for_prewarm(pool)
+        self.assertEqual(len(pool._idle["busybox"]), 1)
+        pool.drain()
+
+    def test_failed_spawn_releases_capacity(self):
+        failing_pods = []
+
+        def _failing_pod(pod_template_name: str, **kwargs) -> Mock:
+            pod = make_pod(pod_template_name)
+
+            def _spawn():
+                # registered, but spawn couldn't delete it
+                env["kubernetes"]["pods"].append(pod.name)
+                raise PodStartupException("ImagePullBackOff")
+            pod.spawn.side_effect = _spawn
+            failing_pods.append(pod)
+            return pod
+
+        self.pod_class.side_effect = _failing_pod
+        pool = PodPool(size=1)
+        with self.assertRaises(PodStartupException):
+            pool.acquire("busybox")
+        self.assertEqual(pool._in_use["busybox"], 0)
+        failing_pods[0].delete.assert_called_once()
+        pool.drain()
+
+    def test_reap_expired_idle_pods(self):
+        pool = PodPool(size=1, max_idle=0, reset_command="true")
+        pool.prewarm("busybox")
+        self.wait_for_prewarm(pool)
+        idle_pod = pool._idle["busybox"][0].pod
+        pool.reap()
+        idle_pod.delete.assert_called_once()
+        self.assertEqual(pool._idle["busybox"], [])
+        pool.drain()
+
+
+if __name__=='__main__':
+    unittest.main()
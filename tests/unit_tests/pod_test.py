@@ -1,9 +1,330 @@
+import base64
+import hashlib
+import io
+import os
 import unittest
-from unittest.mock import Mock
+import queue
+import tarfile
+import tempfile
+from unittest.mock import Mock, patch
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+from k8s.pod import Pod, PodException, PodStartupException, PodStartupTimeoutException, ArtifactNotExistsException, \
+    _load_pod_templates, _validate_pod_templates, COPY_FAILED_MARKER, ARTIFACT_MISSING_MARKER
+from k8s.exec_io import STDOUT_CHANNEL, STDERR_CHANNEL, ERROR_CHANNEL
+from tests.unit_tests.generic_test import GenericTest, FakeWSClient, make_pod_details
+from utils.artifacts import ArtifactStore, read_manifest
+from utils.environment import env
+
+
+def make_tar(files: dict) -> bytes:
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, content in files.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+    return archive.getvalue()
+
+
+class PodTests(GenericTest):
+
+    def test_pod_is_running(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        pod = Pod("busybox")
+        self.assertTrue(pod.is_running)
+        self.assertTrue(pod.is_running)
+        self.assertEqual(self.api.read_namespaced_pod_status.call_count, 1, "Running state should be cached")
+
+    def test_wait_for_running_status_uses_watch(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Pending")
+        events = [{"type": "MODIFIED", "object": make_pod_details("Pending")},
+                  {"type": "MODIFIED", "object": make_pod_details("Running")}]
+        with patch("k8s.pod.watch.Watch") as watch_mock:
+            watch_mock.return_value.stream.return_value = iter(events)
+            pod = Pod("busybox")
+            pod.wait_for_running_status()
+            pod.wait_for_running_status()
+            self.assertEqual(watch_mock.return_value.stream.call_count, 1)
+            self.assertEqual(watch_mock.return_value.stream.call_args.kwargs["resource_version"], "1")
+        self.assertEqual(self.api.read_namespaced_pod_status.call_count, 1)
+
+    def test_wait_for_running_status_fails_fast_on_image_pull_error(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Pending", waiting_reason="ImagePullBackOff")
+        pod = Pod("busybox")
+        with self.assertRaises(PodStartupException):
+            pod.wait_for_running_status()
+
+    def test_wait_for_running_status_fails_fast_on_unschedulable(self):
+        condition = client.V1PodCondition(type="PodScheduled", status="False", reason="Unschedulable")
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Pending", conditions=[condition])
+        pod = Pod("busybox")
+        with self.assertRaises(PodStartupException):
+            pod.wait_for_running_status()
+
+    def test_pod_failing_to_start_is_deleted(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Pending", waiting_reason="ImagePullBackOff")
+        with self.assertRaises(PodStartupException):
+            with Pod("busybox"):
+                pass
+        self.api.delete_namespaced_pod.assert_called_once()
+        self.assertEqual(env["kubernetes"]["pods"], [])
+
+    def test_wait_for_running_status_retries_api_errors(self):
+        self.api.read_namespaced_pod_status.side_effect = [ApiException(status=503), make_pod_details("Running")]
+        pod = Pod("busybox")
+        with patch("k8s.pod.time.sleep") as sleep_mock:
+            pod.wait_for_running_status()
+            sleep_mock.assert_called_once()
+
+    def test_wait_for_running_status_timeout(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Pending")
+        pod = Pod("busybox", startup_timeout=0)
+        with self.assertRaises(PodStartupTimeoutException):
+            pod.wait_for_running_status()
+
+    def test_exec_preserves_output(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, b"first li"), (STDOUT_CHANNEL, "ne \xc5".encode("latin-1")),
+                  (STDOUT_CHANNEL, b"\xbc\n  indented\n"), (STDERR_CHANNEL, b"error\n"),
+                  (ERROR_CHANNEL, b'{"status":"Failure","details":{"causes":[{"reason":"ExitCode","message":"3"}]}}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)):
+            result = Pod("busybox").exec("make", silent=True)
+        self.assertEqual(result["ret_val"], 3)
+        self.assertEqual(result["stdout"], "first line ż\n  indented\n")
+        self.assertEqual(result["stderr"], "error\n")
+        self.assertEqual(result["output"], "first line ż\n  indented\nerror")
+
+    def test_exec_binary_tail(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, bytes([i]) * 10) for i in range(10)] + [(ERROR_CHANNEL, b'{"status":"Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)):
+            result = Pod("busybox").exec("cat", silent=True, maxOutputCharacters=15, retention="tail", binary=True)
+        self.assertEqual(result["stdout"], b"\x08" * 5 + b"\x09" * 10)
+
+    def test_exec_stream(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, b"one\ntw"), (STDERR_CHANNEL, b"err\n"), (STDOUT_CHANNEL, b"o\nthree"),
+                  (ERROR_CHANNEL, b'{"status":"Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)):
+            with Pod("busybox").exec_stream("make", stderr=False) as lines:
+                self.assertIsNone(lines.ret_val)
+                self.assertEqual(list(lines), ["one", "two", "three"])
+        self.assertEqual(lines.ret_val, 0)
+
+    def test_exec_sinks(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, b"one\ntw"), (STDOUT_CHANNEL, b"o\n"), (ERROR_CHANNEL, b'{"status":"Success"}')]
+        received_lines = []
+        output_queue = queue.Queue()
+        with tempfile.TemporaryFile() as output_file:
+            for sink in [received_lines.append, output_queue, output_file]:
+                with patch("k8s.pod.stream_exec", return_value=FakeWSClient(list(frames))):
+                    Pod("busybox").exec("make", silent=True, sink=sink)
+            output_file.seek(0)
+            self.assertEqual(output_file.read(), b"one\ntwo\n")
+        self.assertEqual(received_lines, ["one", "two"])
+        self.assertEqual([output_queue.get() for _ in range(3)], ["one", "two", None])
+
+    def test_stat_many(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, b"dir 4096 1700000000\nmissing\nfile 3 1700000001\n"), (ERROR_CHANNEL, b'{"status":"Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)) as stream_exec_mock:
+            stats = Pod("busybox").stat_many(["/src", "/missing", "/it's here"])
+        self.assertEqual(stream_exec_mock.call_count, 1)
+        self.assertIn("'/it'\"'\"'s here'", stream_exec_mock.call_args.args[2][2])
+        self.assertEqual(stats["/src"], {"exists": True, "type": "dir", "size": 4096, "mtime": 1700000000})
+        self.assertFalse(stats["/missing"]["exists"])
+        self.assertEqual(stats["/it's here"]["type"], "file")
+
+    def test_archive_artifact_probes_paths_once(self):
+        pod = Pod("busybox")
+        missing = {"exists": False, "type": None, "size": None, "mtime": None}
+        found = {"exists": True, "type": "file", "size": 1, "mtime": 0}
+        with tempfile.TemporaryDirectory() as artifacts_path:
+            env["general"]["artifacts_path"] = artifacts_path
+            with patch.object(pod, "stat_many", return_value={"a": found, "b": found}) as stat_mock, \
+                    patch.object(pod, "copy_file_from") as copy_mock:
+                pod.archive_artifact(["a", "b"])
+        stat_mock.assert_called_once_with(["a", "b"], None)
+        self.assertEqual(copy_mock.call_count, 2)
+        with patch.object(pod, "stat_many", return_value={"a": found, "b": missing}):
+            with self.assertRaises(ArtifactNotExistsException):
+                pod.archive_artifact(["a", "b"])
+
+    def test_archive_artifacts_in_one_stream(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        archive = make_tar({"tmp/roots.rel": b"build/out\nbuild/report.xml\n"}) + \
+            make_tar({"build/out/bin/app": b"binary", "build/report.xml": b"<xml/>"})
+        frames = [(STDOUT_CHANNEL, base64.b64encode(archive) + b"\n"), (ERROR_CHANNEL, b'{"status":"Success"}')]
+        with tempfile.TemporaryDirectory() as artifacts_path:
+            env["general"]["artifacts_path"] = artifacts_path
+            with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)) as stream_exec_mock:
+                stats = Pod("busybox").archive_artifacts(["build/out", "build/*.xml"], compression="none")
+            with open(os.path.join(artifacts_path, "out", "bin", "app"), "rb") as artifact:
+                self.assertEqual(artifact.read(), b"binary")
+            manifest = read_manifest(artifacts_path)["artifacts"]
+        self.assertEqual(stream_exec_mock.call_count, 1)
+        self.assertIn("'build/*.xml'", stream_exec_mock.call_args.args[2][2])
+        self.assertEqual(stats["artifacts"], 2)
+        self.assertEqual(stats["size"], 12)
+        self.assertEqual(manifest["report.xml"]["source"], "/build/report.xml")
+        self.assertEqual(manifest["out"]["files"]["out/bin/app"]["size"], 6)
+
+    def test_archive_artifacts_reports_missing_paths(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDERR_CHANNEL, f"{ARTIFACT_MISSING_MARKER}logs/*.log\n".encode()),
+                  (ERROR_CHANNEL, b'{"status":"Failure","details":{"causes":[{"reason":"ExitCode","message":"3"}]}}')]
+        with tempfile.TemporaryDirectory() as artifacts_path:
+            env["general"]["artifacts_path"] = artifacts_path
+            with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)):
+                with self.assertRaises(ArtifactNotExistsException) as context:
+                    Pod("busybox").archive_artifacts(["logs/*.log"])
+        self.assertIn("logs/*.log", str(context.exception))
+        with self.assertRaises(PodException):
+            Pod("busybox").archive_artifacts(["logs"], compression="bz2")
+
+    def test_fetch_artifacts_skips_stored_content(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        with tempfile.TemporaryDirectory() as store_path, tempfile.TemporaryDirectory() as local_path:
+            store = ArtifactStore(store_path)
+            stored_path = os.path.join(local_path, "stored")
+            with open(stored_path, "w") as stored:
+                stored.write("old")
+            stored_digest = store.add(stored_path)
+            new_digest = hashlib.sha256(b"new").hexdigest()
+            listing = f"{stored_digest}  ./logs/old.log\n{new_digest}  ./new.txt\n{new_digest}  ./copy.txt\n"
+            frames = [(STDOUT_CHANNEL, base64.b64encode(make_tar({"new.txt": b"new"})) + b"\n"),
+                      (ERROR_CHANNEL, b'{"status":"Success"}')]
+            pod = Pod("busybox")
+            destination = os.path.join(local_path, "artifacts")
+            with patch.object(pod, "exec", return_value={"stdout": listing}), \
+                    patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)) as stream_exec_mock:
+                stats = pod.fetch_artifacts("/relocated/.artifacts", destination, store)
+            self.assertEqual(stream_exec_mock.call_count, 1)
+            self.assertIn("tar cf - -- new.txt", stream_exec_mock.call_args.args[2][2])
+            self.assertEqual((stats["files"], stats["downloaded"], stats["reused"]), (3, 1, 2))
+            with open(os.path.join(destination, "logs", "old.log")) as fetched:
+                self.assertEqual(fetched.read(), "old")
+            with open(os.path.join(destination, "copy.txt")) as fetched:
+                self.assertEqual(fetched.read(), "new")
+            self.assertTrue(store.has(new_digest))
+
+    def test_copy_file_from_quotes_source(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        archive = make_tar({"my file": b"content"})
+        frames = [(STDOUT_CHANNEL, base64.encodebytes(archive)), (ERROR_CHANNEL, b'{"status": "Success"}')]
+        with tempfile.TemporaryDirectory() as destination:
+            with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)) as stream_exec_mock:
+                stats = Pod("busybox").copy_file_from("/tmp/my file", destination, compresslevel=None)
+            with open(os.path.join(destination, "my file"), "rb") as copied:
+                self.assertEqual(copied.read(), b"content")
+        self.assertIn("cd \"$(dirname '/tmp/my file')\" && tar cf - \"$(basename '/tmp/my file')\"",
+                      stream_exec_mock.call_args.args[2][2])
+        self.assertEqual(stats["bytes"], len(archive))
+
+    def test_copy_file_to_failing_archive_is_not_terminated(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        resp = FakeWSClient([(ERROR_CHANNEL, b'{"status": "Success"}')])
+        with patch("k8s.pod.stream_exec", return_value=resp) as stream_exec_mock:
+            with self.assertRaises(FileNotFoundError):
+                Pod("busybox").copy_file_to("/missing/file", "/tmp/my dest")
+        self.assertIn("tar zxf - --directory '/tmp/my dest'", stream_exec_mock.call_args.args[2][2])
+        self.assertNotIn(b"PYTHON-PIPELINES-EOF", bytes(resp.stdin))
+        self.assertFalse(resp.is_open())
+
+    def test_transfer_to_forwards_encoded_archive(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        source, target = Pod("busybox"), Pod("busybox")
+        source_resp = FakeWSClient([(STDOUT_CHANNEL, b"dGFy"), (STDOUT_CHANNEL, b"IGRh\ndGE=\n"),
+                                    (ERROR_CHANNEL, b'{"status": "Success"}')])
+        # target replies with its status only after the whole archive was sent
+        target_resp = FakeWSClient([(STDOUT_CHANNEL, b"")] * 2 + [(ERROR_CHANNEL, b'{"status": "Success"}')])
+        with patch("k8s.pod.stream_exec", side_effect=[source_resp, target_resp]) as stream_exec_mock:
+            stats = source.transfer_to(target, "/build/my out", "/my input")
+        self.assertEqual(stream_exec_mock.call_args_list[0].args[0], source.name)
+        self.assertIn("gzip -1", stream_exec_mock.call_args_list[0].args[2][2])
+        self.assertIn("tar cf - \"$(basename '/build/my out')\"", stream_exec_mock.call_args_list[0].args[2][2])
+        self.assertEqual(stream_exec_mock.call_args_list[1].args[0], target.name)
+        self.assertIn("mkdir -p '/my input'", stream_exec_mock.call_args_list[1].args[2][2])
+        self.assertIn("tar zxf - --directory '/my input'", stream_exec_mock.call_args_list[1].args[2][2])
+        self.assertEqual(bytes(target_resp.stdin), b"dGFyIGRh\ndGE=\n\nPYTHON-PIPELINES-EOF\n")
+        self.assertEqual(stats["bytes"], 9)
+
+    def test_transfer_to_reports_source_failure(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        source_resp = FakeWSClient([(STDERR_CHANNEL, b"tar: out: No such file or directory\n" + COPY_FAILED_MARKER.encode()),
+                                    (ERROR_CHANNEL, b'{"status": "Success"}')])
+        target_resp = FakeWSClient([(ERROR_CHANNEL, b'{"status": "Success"}')])
+        with patch("k8s.pod.stream_exec", side_effect=[source_resp, target_resp]):
+            with self.assertRaises(PodException) as context:
+                Pod("busybox").transfer_to(Pod("busybox"), "/build/out", "/input")
+        self.assertIn("No such file", str(context.exception))
+
+    def test_transfer_to_reports_target_failure(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        failure = (ERROR_CHANNEL, b'{"status":"Failure","details":{"causes":[{"reason":"ExitCode","message":"2"}]}}')
+        for broken_pipe in [False, True]:
+            source_resp = FakeWSClient([(STDOUT_CHANNEL, b"dGFy\n")] * 5 + [(ERROR_CHANNEL, b'{"status": "Success"}')])
+            target_resp = FakeWSClient([(STDERR_CHANNEL, b"mkdir: can't create directory '/input': Permission denied"),
+                                        failure])
+            if broken_pipe:
+                target_resp.write_stdin = Mock(side_effect=BrokenPipeError)
+            with patch("k8s.pod.stream_exec", side_effect=[source_resp, target_resp]):
+                with self.assertRaises(PodException) as context:
+                    Pod("busybox").transfer_to(Pod("busybox"), "/build/out", "/input")
+            self.assertIn("Permission denied", str(context.exception))
+
+    def test_pod_templates_are_cached_as_json(self):
+        with tempfile.TemporaryDirectory() as config_dir:
+            config_path = os.path.join(config_dir, "pod_config.yaml")
+            cache_path = os.path.join(config_dir, "__pycache__", "pod_config.json")
+            with open(config_path, "w") as config:
+                config.write("busybox:\n  image: busybox:1.35\n")
+            with patch("k8s.pod.POD_CONFIG_PATH", config_path), patch("k8s.pod.POD_CONFIG_CACHE_PATH", cache_path):
+                self.assertEqual(_load_pod_templates(), {"busybox": {"image": "busybox:1.35"}})
+                with patch("yaml.safe_load") as yaml_mock:
+                    self.assertEqual(_load_pod_templates(), {"busybox": {"image": "busybox:1.35"}})
+                yaml_mock.assert_not_called()
+                with open(config_path, "w") as config:
+                    config.write("broken:\n  resources:\n    limits: {}\n")
+                with self.assertRaises(PodException):
+                    _load_pod_templates()
+
+    def test_unknown_pod_template(self):
+        with self.assertRaises(PodException):
+            Pod("no-such-template")
+
+    def test_multi_container_pod(self):
+        templates = {"toolchains": {"image": "ubuntu:22.04",
+                                    "containers": {"python": {"image": "python:3.9.12"}},
+                                    "volumes": {"workspace": {"mount_path": "/workspace", "medium": "Memory"}}}}
+        _validate_pod_templates(templates)
+        with patch("k8s.pod.get_pod_templates", return_value=templates):
+            pod = Pod("toolchains")
+        containers = pod._pod.spec.containers
+        self.assertEqual([container.name for container in containers], [pod.name, "python"])
+        self.assertEqual(containers[1].image, "python:3.9.12")
+        self.assertTrue(all(container.volume_mounts[0].mount_path == "/workspace" for container in containers))
+        self.assertEqual(pod._pod.spec.volumes[0].empty_dir.medium, "Memory")
+
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(ERROR_CHANNEL, b'{"status": "Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(list(frames))) as stream_exec_mock:
+            pod.exec("python3 /workspace/build.py", container="python")
+        self.assertEqual(stream_exec_mock.call_args.kwargs["container"], "python")
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(list(frames))) as stream_exec_mock:
+            pod.exec("make")
+        self.assertEqual(stream_exec_mock.call_args.kwargs["container"], pod.name)
+        with self.assertRaises(PodException):
+            pod.exec("make", container="gcc")
+
+    def test_invalid_volume_template(self):
+        with self.assertRaises(PodException):
+            _validate_pod_templates({"broken": {"image": "busybox", "volumes": {"workspace": {"medium": "Memory"}}}})
+        with self.assertRaises(PodException):
+            _validate_pod_templates({"broken": {"image": "busybox", "containers": {"sidecar": {}}}})
 
-class PodTests(unittest.TestCase):
-  def test_pod_is_running(self):
-           self.assertEqual(1,1)
 
 if __name__=='__main__':
-  unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+from unittest.mock import patch
+from kubernetes import client
+from k8s.secret import SecretUserPassword, get_secret_store
+from utils.common import encode_str_to_base64
+from utils.environment import env
+from tests.unit_tests.generic_test import GenericTest
+
+
+def make_secret(name: str, password: str) -> client.V1Secret:
+    return client.V1Secret(metadata=client.V1ObjectMeta(name=name, namespace="python-pipelines-test"),
+                           data={"username": encode_str_to_base64("kartoszka"), "password": encode_str_to_base64(password)})
+
+
+class SecretTests(GenericTest):
+
+    def test_secret_is_read_once(self):
+        self.api.read_namespaced_secret.return_value = make_secret("creds", "marchewkowa")
+        for _ in range(3):
+            with SecretUserPassword("creds") as secret:
+                self.assertEqual(secret.password, "marchewkowa")
+        self.assertEqual(self.api.read_namespaced_secret.call_count, 1)
+
+    def test_secret_is_read_again_after_ttl(self):
+        self.api.read_namespaced_secret.return_value = make_secret("creds", "marchewkowa")
+        get_secret_store().ttl = 0
+        SecretUserPassword("creds").remove_secrets_from_env()
+        SecretUserPassword("creds").remove_secrets_from_env()
+        self.assertEqual(self.api.read_namespaced_secret.call_count, 2)
+
+    def test_prefetch_uses_single_list_call(self):
+        self.api.list_namespaced_secret.return_value = client.V1SecretList(
+            items=[make_secret("first", "one"), make_secret("second", "two")])
+        self.assertEqual(get_secret_store().prefetch(label_selector="team=ci"), 2)
+        self.assertEqual(SecretUserPassword("second").password, "two")
+        self.api.read_namespaced_secret.assert_not_called()
+
+    def test_nested_secrets_keep_values_registered(self):
+        self.api.read_namespaced_secret.return_value = make_secret("creds", "marchewkowa")
+        with SecretUserPassword("creds"):
+            with SecretUserPassword("creds"):
+                pass
+            self.assertIn("marchewkowa", env["general"]["secrets"])
+        self.assertNotIn("marchewkowa", env["general"]["secrets"])
+
+    def test_watch_updates_rotated_secret(self):
+        self.api.list_namespaced_secret.return_value = client.V1SecretList(
+            items=[make_secret("creds", "old")], metadata=client.V1ListMeta(resource_version="5"))
+        rotated = threading.Event()
+
+        def _stream(*args, **kwargs):
+            yield {"type": "MODIFIED", "object": make_secret("creds", "new")}
+            rotated.set()
+
+        store = get_secret_store()
+        with patch("k8s.secret.watch.Watch") as watch_mock:
+            watch_mock.return_value.stream.side_effect = _stream
+            store.watch_rotation()
+            rotated.wait(5)
+        self.assertEqual(SecretUserPassword("creds").password, "new")
+        self.assertEqual(watch_mock.return_value.stream.call_args.kwargs["resource_version"], "5")
+        store.stop()
+
+
+if __name__=='__main__':
+    unittest.main()
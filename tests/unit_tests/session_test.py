@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch
+from k8s.session import ShellSession, ShellSessionException, _SentinelScanner
+from k8s.pod import Pod
+from k8s.exec_io import STDOUT_CHANNEL, STDERR_CHANNEL, ERROR_CHANNEL
+from tests.unit_tests.generic_test import GenericTest, FakeWSClient, make_pod_details
+
+SENTINEL = b"PYTHON-PIPELINES-abc"
+
+
+class ShellSessionTests(GenericTest):
+
+    def run_session(self, session: ShellSession) -> tuple:
+        output = {STDOUT_CHANNEL: b"", STDERR_CHANNEL: b""}
+
+        def _on_output(channel, data):
+            output[channel] += data
+
+        with patch("k8s.session.generate_random_string", return_value="abc"):
+            ret_val = session.run("make", _on_output)
+        return ret_val, output
+
+    def test_sentinel_split_between_frames(self):
+        scanner = _SentinelScanner(SENTINEL)
+        passed = scanner.feed(b"out\nPYTHON-PIPE") + scanner.feed(b"LINES-a") + scanner.feed(b"bc0 /tmp\n")
+        self.assertEqual(passed, b"out\n")
+        self.assertTrue(scanner.found)
+        self.assertEqual(scanner.rest, b"0 /tmp\n")
+
+    def test_run_reuses_connection(self):
+        fake = FakeWSClient([(STDOUT_CHANNEL, b"built\n" + SENTINEL[:5]), (STDERR_CHANNEL, b"warn\n" + SENTINEL + b"\n"),
+                             (STDOUT_CHANNEL, SENTINEL[5:] + b"2 ZXhwb3J0IEE9JzEn /src dir\n")])
+        session = ShellSession("pod", "namespace")
+        with patch("k8s.session.stream_exec", return_value=fake) as stream_exec_mock:
+            ret_val, output = self.run_session(session)
+            fake.frames = [(STDOUT_CHANNEL, SENTINEL + b"0 ZXhwb3J0IEE9JzEn /src dir\n"), (STDERR_CHANNEL, SENTINEL + b"\n")]
+            self.assertEqual(self.run_session(session)[0], 0)
+        self.assertEqual(stream_exec_mock.call_count, 1)
+        self.assertEqual(ret_val, 2)
+        self.assertEqual(output, {STDOUT_CHANNEL: b"built\n", STDERR_CHANNEL: b"warn\n"})
+        self.assertEqual(session.cwd, "/src dir")
+
+    def test_reconnect_restores_cwd_and_exports(self):
+        session = ShellSession("pod", "namespace")
+        fake = FakeWSClient([(STDOUT_CHANNEL, SENTINEL + b"0 ZXhwb3J0IEE9JzEn /src dir\n"), (STDERR_CHANNEL, SENTINEL + b"\n")])
+        with patch("k8s.session.stream_exec", return_value=fake):
+            self.run_session(session)
+        self.assertEqual(session.exports, "ZXhwb3J0IEE9JzEn")
+        fake.close()
+        reopened = FakeWSClient([(STDOUT_CHANNEL, SENTINEL + b"0 ZXhwb3J0IEE9JzEn /src dir\n"), (STDERR_CHANNEL, SENTINEL + b"\n")])
+        with patch("k8s.session.stream_exec", return_value=reopened):
+            self.run_session(session)
+        self.assertTrue(reopened.stdin.startswith(b"cd '/src dir'\n"
+                                                  b'eval "$(echo ZXhwb3J0IEE9JzEn | base64 -d)" >/dev/null 2>&1\n'))
+
+    def test_command_exiting_shell(self):
+        session = ShellSession("pod", "namespace")
+        fake = FakeWSClient([(ERROR_CHANNEL, b'{"status":"Failure","details":{"causes":[{"reason":"ExitCode","message":"4"}]}}')])
+        with patch("k8s.session.stream_exec", return_value=fake):
+            self.assertEqual(self.run_session(session)[0], 4)
+            with self.assertRaises(ShellSessionException):
+                self.run_session(session)
+
+    def test_pod_exec_with_persistent_session(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        fake = FakeWSClient([(STDOUT_CHANNEL, b"hello\n" + SENTINEL + b"0 - /\n"), (STDERR_CHANNEL, SENTINEL + b"\n")])
+        pod = Pod("busybox", persistent_session=True)
+        pod.spawn()
+        with patch("k8s.session.stream_exec", return_value=fake), \
+                patch("k8s.session.generate_random_string", return_value="abc"):
+            result = pod.exec("echo hello", silent=True)
+        self.assertEqual(result["output"], "hello")
+        pod.delete()
+        self.assertFalse(fake.is_open())
+
+
+if __name__=='__main__':
+    unittest.main()
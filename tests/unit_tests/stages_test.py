@@ -0,0 +1,131 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from utils.parallel import raise_if_cancelled
+from utils.stages import Stages, StagesException, StageGraphException
+from tests.unit_tests.generic_test import GenericTest
+
+
+class StagesTests(GenericTest):
+
+    def test_stages_run_after_their_dependencies(self):
+        stages = Stages()
+        finished = []
+
+        @stages.stage()
+        def build():
+            finished.append("build")
+            return "built"
+
+        @stages.stage(needs=[build])
+        def unit():
+            finished.append("unit")
+
+        @stages.stage(name="lint-code", needs=["build"])
+        def lint():
+            finished.append("lint")
+
+        @stages.stage(needs=[unit, lint])
+        def publish():
+            finished.append("publish")
+            return "published"
+
+        results = stages.run()
+        self.assertEqual(results["build"], "built")
+        self.assertEqual(results["publish"], "published")
+        self.assertEqual(finished[0], "build")
+        self.assertEqual(finished[-1], "publish")
+        self.assertEqual(stages.critical_path()[0], "build")
+        self.assertIn("critical path build -> ", stages.report)
+
+    def test_ready_stages_run_concurrently(self):
+        stages = Stages()
+        barrier = threading.Barrier(3, timeout=5)
+        for name in ["unit", "lint", "package"]:
+            stages.stage(name=name)(lambda: barrier.wait())
+        self.assertEqual(len(stages.run()), 3)
+
+    def test_pod_budget_and_critical_path_priority(self):
+        stages = Stages(max_pods=1)
+        started = []
+
+        def record(name):
+            return lambda pod: started.append(name)
+
+        stages.stage(name="short", pod="busybox", estimate=1)(record("short"))
+        stages.stage(name="long", pod="busybox", estimate=1)(record("long"))
+        stages.stage(name="after_long", needs=["long"], pod="busybox", estimate=10)(record("after_long"))
+        with patch("k8s.pod.Pod") as pod_mock:
+            stages.run()
+        self.assertEqual(started, ["long", "after_long", "short"])
+        self.assertEqual(pod_mock.call_count, 3)
+
+    def test_failure_skips_dependents_and_runs_always(self):
+        stages = Stages(fail_fast=False)
+
+        @stages.stage()
+        def build():
+            raise RuntimeError("broken")
+
+        @stages.stage(needs=[build])
+        def unit():
+            return "unit"
+
+        @stages.stage(needs=[unit], always=True)
+        def report():
+            return "report"
+
+        @stages.stage(when=lambda: False)
+        def optional():
+            return "optional"
+
+        with self.assertRaises(StagesException) as context:
+            stages.run()
+        self.assertEqual(list(context.exception.failures), ["build"])
+        self.assertEqual(context.exception.results, {"report": "report"})
+        self.assertEqual(stages.stages["unit"].status, "skipped")
+        self.assertEqual(stages.stages["unit"].reason, "build failed")
+        self.assertEqual(stages.stages["optional"].status, "skipped")
+
+    def test_fail_fast_cancels_running_stages(self):
+        stages = Stages()
+        failed = threading.Event()
+
+        @stages.stage()
+        def broken():
+            failed.set()
+            raise RuntimeError("broken")
+
+        @stages.stage()
+        def slow():
+            failed.wait(5)
+            for _ in range(500):
+                raise_if_cancelled()
+                time.sleep(0.01)
+
+        @stages.stage(needs=[slow])
+        def after_slow():
+            pass
+
+        with self.assertRaises(StagesException):
+            stages.run()
+        self.assertEqual(stages.stages["slow"].status, "cancelled")
+        self.assertEqual(stages.stages["after_slow"].status, "cancelled")
+
+    def test_invalid_graphs(self):
+        stages = Stages()
+        stages.stage(name="a", needs=["b"])(lambda: None)
+        stages.stage(name="b", needs=["a"])(lambda: None)
+        with self.assertRaises(StageGraphException):
+            stages.run()
+        with self.assertRaises(StageGraphException):
+            stages.stage(name="a")(lambda: None)
+        stages = Stages()
+        stages.stage(name="a", needs=["missing"])(lambda: None)
+        with self.assertRaises(StageGraphException):
+            stages.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from k8s.pod import Pod
+from k8s.step_cache import StepCache
+from tests.unit_tests.generic_test import GenericTest
+
+
+def exec_result(ret_val: int = 0, stdout: str = "") -> dict:
+    return {"ret_val": ret_val, "output": stdout.strip(), "stdout": stdout, "stderr": ""}
+
+
+class StepCacheTests(GenericTest):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = StepCache(self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+        super().tearDown()
+
+    def run_step(self, pod: Pod, probe: str, outputs: list = ("build", "/opt/out"), **kwargs) -> tuple:
+        uploaded = []
+        with patch.object(pod, "exec", side_effect=[exec_result(stdout=probe), exec_result(stdout="built\n")]) as exec_mock, \
+                patch.object(pod, "_download_archive", side_effect=lambda command, read, _, container=None: read(io.BytesIO(b"tar"))) as download_mock, \
+                patch.object(pod, "_upload_archive", side_effect=lambda destination, write, container=None: write(io.BytesIO()) or uploaded.append(destination)):
+            result = pod.cached_exec("make", inputs=["src"], outputs=list(outputs), cache=self.cache, silent=True, **kwargs)
+        return result, exec_mock, download_mock, uploaded
+
+    def test_miss_then_hit(self):
+        pod = Pod("busybox")
+        result, exec_mock, download_mock, uploaded = self.run_step(pod, "/work\nabc  src/main.c\n")
+        self.assertEqual(exec_mock.call_count, 2)
+        self.assertIn("tar cf - -- work/build opt/out", download_mock.call_args.args[0])
+        result, exec_mock, _, uploaded = self.run_step(pod, "/work\nabc  src/main.c\n")
+        self.assertEqual(exec_mock.call_count, 1)
+        self.assertEqual(uploaded, ["/"])
+        self.assertEqual(result["output"], "built")
+        self.assertEqual(self.cache.stats, {"hits": 1, "misses": 1})
+
+    def test_changed_input_and_refresh_run_command(self):
+        pod = Pod("busybox")
+        self.run_step(pod, "/work\nabc  src/main.c\n")
+        self.assertEqual(self.run_step(pod, "/work\ndef  src/main.c\n")[1].call_count, 2)
+        self.assertEqual(self.run_step(pod, "/work\nabc  src/main.c\n", refresh=True)[1].call_count, 2)
+
+    def test_changed_outputs_or_cwd_miss(self):
+        pod = Pod("busybox")
+        self.run_step(pod, "/work\nabc  src/main.c\n", outputs=["a.out"])
+        self.assertEqual(self.run_step(pod, "/work\nabc  src/main.c\n", outputs=["b.out"])[1].call_count, 2)
+        self.assertEqual(self.run_step(pod, "/other\nabc  src/main.c\n", outputs=["a.out"])[1].call_count, 2)
+        self.assertEqual(self.run_step(pod, "/work\nabc  src/main.c\n", outputs=["a.out"])[1].call_count, 1)
+
+    def test_failed_step_is_not_cached(self):
+        pod = Pod("busybox")
+        with patch.object(pod, "exec", side_effect=[exec_result(stdout="/work\n"), exec_result(2)]):
+            self.assertEqual(pod.cached_exec("make", cache=self.cache)["ret_val"], 2)
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_lru_eviction(self):
+        cache = StepCache(self.cache_dir.name, max_bytes=250)
+        for key in ["a", "b", "c"]:
+            cache.store(key, {"ret_val": 0}, lambda archive: archive.write(b"x" * 100))
+            os.utime(os.path.join(self.cache_dir.name, key), (0, {"a": 1, "b": 3, "c": 2}[key]))
+            cache.lookup("a")
+        self.assertEqual(sorted(os.listdir(self.cache_dir.name)), ["a", "c"])
+        cache.invalidate()
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+
+if __name__=='__main__':
+    unittest.main()
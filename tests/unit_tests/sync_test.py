@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from k8s.pod import Pod, PodException
+from utils.sync import SyncFilter, local_manifest, parse_sha256sum_output, diff_manifests, hash_file, parent_dirs
+from tests.unit_tests.generic_test import GenericTest, make_pod_details
+
+
+def write_tree(root: str, files: dict) -> None:
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as file:
+            file.write(content)
+
+
+class SyncTests(GenericTest):
+
+    def test_filter_follows_gitignore(self):
+        with tempfile.TemporaryDirectory() as root:
+            write_tree(root, {".gitignore": "*.pyc\nbuild/\n/top.txt\n!keep.pyc\n",
+                              "src/.gitignore": "local.cfg\n",
+                              "src/main.py": "", "src/main.pyc": "", "src/keep.pyc": "", "src/local.cfg": "",
+                              "build/out.o": "", "top.txt": "", "docs/top.txt": "", ".git/HEAD": "",
+                              ".artifacts/log": ""})
+            sync_filter = SyncFilter(root, exclude=["/.artifacts/"])
+            self.assertEqual(list(sync_filter.walk()),
+                             [".gitignore", "docs/top.txt", "src/.gitignore", "src/keep.pyc", "src/main.py"])
+            self.assertTrue(sync_filter.excluded_path("build/nested/file"))
+            self.assertTrue(sync_filter.excluded_path(".artifacts/log"))
+            self.assertFalse(sync_filter.excluded_path("src/new.py"))
+
+    def test_include_globs(self):
+        with tempfile.TemporaryDirectory() as root:
+            write_tree(root, {"a.py": "", "sub/b.py": "", "sub/c.txt": ""})
+            self.assertEqual(list(SyncFilter(root, include=["*.py"]).walk()), ["a.py", "sub/b.py"])
+
+    def test_manifest_diff(self):
+        with tempfile.TemporaryDirectory() as root:
+            write_tree(root, {"same": "1", "changed": "2", "new file": "3"})
+            local = local_manifest(SyncFilter(root))
+            remote = parse_sha256sum_output(f"{hash_file(os.path.join(root, 'same'))}  ./same\n"
+                                            f"{'0' * 64}  ./changed\n{'0' * 64}  ./gone\n\\{'0' * 64}  ./odd\\nname\n")
+        self.assertEqual(diff_manifests(local, remote), (["changed", "new file"], ["gone"]))
+
+    def test_parent_dirs_deepest_first(self):
+        self.assertEqual(parent_dirs(["top", "a/b/c/file", "a/other", "d/file"]), ["a/b/c", "a/b", "a", "d"])
+
+    def test_pod_sync_to_sends_only_changes(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        pod = Pod("busybox")
+        with tempfile.TemporaryDirectory() as root:
+            write_tree(root, {"same": "1", "changed": "2"})
+            remote = f"{hash_file(os.path.join(root, 'same'))}  ./same\n{'0' * 64}  ./changed\n{'0' * 64}  ./gone\n"
+            sent = []
+            with patch.object(pod, "exec", return_value={"ret_val": 0, "stdout": remote, "output": ""}) as exec_mock, \
+                    patch.object(pod, "_upload_tar", side_effect=lambda destination, add_members, _, container=None: sent.append(add_members)):
+                stats = pod.sync_to(root, "/target")
+                with patch("tarfile.TarFile") as tar:
+                    sent[0](tar)
+        self.assertEqual([call.kwargs["arcname"] for call in tar.add.call_args_list],
+                         [f"{os.path.basename(root)}/changed"])
+        self.assertIn("rm -f -- gone", exec_mock.call_args_list[1].args[0])
+        self.assertEqual((stats["files"], stats["uploaded"], stats["deleted"]), (2, 1, 1))
+
+    def test_pod_sync_to_prunes_emptied_dirs_and_reports_failure(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        pod = Pod("busybox")
+        with tempfile.TemporaryDirectory() as root:
+            write_tree(root, {"same": "1"})
+            remote = {"ret_val": 0, "stdout": f"{hash_file(os.path.join(root, 'same'))}  ./same\n{'0' * 64}  ./old/-gone\n",
+                      "output": ""}
+            failure = {"ret_val": 1, "stdout": "", "output": "rm: can't remove 'old/-gone': Permission denied"}
+            with patch.object(pod, "exec", side_effect=[remote, failure]) as exec_mock:
+                with self.assertRaises(PodException) as context:
+                    pod.sync_to(root, "/target")
+        self.assertIn("rm -f -- old/-gone && find ./old -maxdepth 0 -type d -empty -delete",
+                      exec_mock.call_args_list[1].args[0])
+        self.assertIn("Permission denied", str(context.exception))
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from kubernetes import client
+from urllib3.exceptions import MaxRetryError
+from k8s import teardown
+from k8s.pod import Pod
+from tests.unit_tests.generic_test import GenericTest, make_pod_details
+from utils.environment import env
+
+NOW = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def make_listed_pod(name: str, age: float, pod_timeout: str = None) -> client.V1Pod:
+    annotations = {teardown.POD_TIMEOUT_ANNOTATION: pod_timeout} if pod_timeout is not None else None
+    return client.V1Pod(metadata=client.V1ObjectMeta(name=name, annotations=annotations,
+                                                     creation_timestamp=NOW - timedelta(seconds=age)))
+
+
+class TeardownTests(GenericTest):
+
+    def setUp(self):
+        super().setUp()
+        teardown._namespaces.clear()
+
+    def test_pods_are_labelled_with_run_id(self):
+        env["kubernetes"]["run_id"] = "run123"
+        pod = Pod("busybox", pod_timeout=600)
+        self.assertEqual(pod._pod.metadata.labels, {"python-pipelines": "True", teardown.RUN_ID_LABEL: "run123"})
+        self.assertEqual(pod._pod.metadata.annotations, {teardown.POD_TIMEOUT_ANNOTATION: "600"})
+
+    def test_fast_teardown_deletes_immediately_in_background(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        env["kubernetes"]["fast_teardown"] = True
+        pod = Pod("busybox")
+        pod.spawn()
+        pod.delete()
+        teardown.wait_for_deletes()
+        self.api.delete_namespaced_pod.assert_called_once_with(pod.name, pod.namespace, grace_period_seconds=0)
+        self.assertEqual(env["kubernetes"]["pods"], [])
+
+        teardown.cleanup_run()
+        self.api.delete_collection_namespaced_pod.assert_called_once_with(
+            pod.namespace, label_selector=f"{teardown.RUN_ID_LABEL}={teardown.run_id()}", grace_period_seconds=0)
+
+    def test_cleanup_run_continues_after_connection_errors(self):
+        env["kubernetes"]["fast_teardown"] = True
+        self.api.delete_namespaced_pod.side_effect = MaxRetryError(None, "/api/v1/namespaces/first/pods/busybox")
+        teardown.register_namespace("first")
+        teardown.register_namespace("second")
+        self.api.delete_collection_namespaced_pod.side_effect = [MaxRetryError(None, "/api/v1/namespaces/first/pods"),
+                                                                 None]
+        teardown.delete_pod(self.api, "busybox", "first")
+        teardown.cleanup_run()
+        self.assertEqual([call.args[0] for call in self.api.delete_collection_namespaced_pod.call_args_list],
+                         ["first", "second"])
+
+    def test_reap_deletes_only_stale_pods(self):
+        self.api.list_namespaced_pod.return_value = client.V1PodList(items=[
+            make_listed_pod("fresh", 100), make_listed_pod("stale", 4000), make_listed_pod("short", 200, "60")])
+        reaped = teardown.reap("python-pipelines-test", now=NOW)
+        self.assertEqual(reaped, ["stale", "short"])
+        self.assertEqual(self.api.list_namespaced_pod.call_args.kwargs["label_selector"], "python-pipelines=True")
+        self.assertEqual(self.api.delete_namespaced_pod.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from kubernetes import client
+from k8s.exec_io import STDOUT_CHANNEL, ERROR_CHANNEL
+from k8s.pod import Pod
+from tests.unit_tests.generic_test import GenericTest, FakeWSClient, make_pod_details
+from utils.tracing import Tracer, TRACE_FILE, TRACE_SUMMARY_FILE, tracer
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_disabled_tracer_records_nothing(self):
+        disabled_tracer = Tracer()
+        with disabled_tracer.span("outer") as outer:
+            outer.set("bytes", 1)
+            disabled_tracer.current_span().add("bytes", 1)
+        self.assertEqual(disabled_tracer.events, [])
+
+    def test_nested_spans(self):
+        enabled_tracer = Tracer()
+        enabled_tracer.enabled = True
+        with enabled_tracer.span("outer"):
+            with enabled_tracer.span("inner") as inner:
+                inner.add("bytes", 3)
+                enabled_tracer.current_span().add("bytes", 4)
+            with self.assertRaises(ValueError), enabled_tracer.span("failing"):
+                raise ValueError()
+        events = {event["name"]: event for event in enabled_tracer.events}
+        self.assertEqual(events["inner"]["args"], {"bytes": 7, "parent": "outer"})
+        self.assertEqual(events["failing"]["args"], {"error": "ValueError", "parent": "outer"})
+        self.assertNotIn("parent", events["outer"]["args"])
+        self.assertLessEqual(events["outer"]["ts"], events["inner"]["ts"])
+
+    def test_write(self):
+        enabled_tracer = Tracer()
+        enabled_tracer.add_event("pod.exec", 10.0, 12.5, {"bytes": 100})
+        enabled_tracer.add_event("pod.exec", 20.0, 20.5, {"bytes": 50})
+        enabled_tracer.add_event("pod.spawn", 0.0, 1.0)
+        self.assertEqual(enabled_tracer.summary()[0], ("pod.exec", 2, 3.0, 1.5, 2.5, 150))
+        with tempfile.TemporaryDirectory() as directory:
+            enabled_tracer.write(directory, "relocation_")
+            with open(os.path.join(directory, "relocation_" + TRACE_FILE)) as trace_file:
+                trace = json.load(trace_file)
+            with open(os.path.join(directory, "relocation_" + TRACE_SUMMARY_FILE)) as summary_file:
+                summary = summary_file.read().splitlines()
+        self.assertEqual(trace["traceEvents"][0]["dur"], 2500000)
+        self.assertTrue(summary[1].startswith("pod.exec"))
+        self.assertTrue(summary[2].startswith("pod.spawn"))
+
+
+class PodTracingTest(GenericTest):
+
+    def setUp(self):
+        super().setUp()
+        tracer.enabled = True
+        tracer.events = []
+
+    def tearDown(self):
+        tracer.enabled = False
+        tracer.events = []
+        super().tearDown()
+
+    def test_exec_spans(self):
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        pod = Pod("busybox")
+        frames = [(STDOUT_CHANNEL, b"hello"), (ERROR_CHANNEL, b'{"status": "Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)):
+            pod.exec("echo hello")
+        events = {event["name"]: event for event in tracer.events}
+        self.assertEqual(events["pod.exec"]["args"]["bytes"], 5)
+        self.assertEqual(events["pod.exec"]["args"]["pod"], pod.name)
+        self.assertEqual(events["pod.exec"]["args"]["command"], "echo hello")
+        self.assertEqual(events["exec.connect"]["args"]["parent"], "pod.exec")
+        self.assertEqual(events["exec.run"]["args"]["parent"], "pod.exec")
+
+    def test_disabled_tracing_skips_masking_of_exec_command(self):
+        tracer.enabled = False
+        self.api.read_namespaced_pod_status.return_value = make_pod_details("Running")
+        frames = [(STDOUT_CHANNEL, b"hello"), (ERROR_CHANNEL, b'{"status": "Success"}')]
+        with patch("k8s.pod.stream_exec", return_value=FakeWSClient(frames)), \
+                patch("k8s.pod.Logger.mask_secret_text", side_effect=lambda text: text) as mask_mock:
+            Pod("busybox").exec("echo hello", silent=True)
+        mask_mock.assert_not_called()
+        self.assertEqual(tracer.events, [])
+
+    def test_startup_phases_from_pod_status(self):
+        pod = Pod("busybox")
+        created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        pod_details = make_pod_details("Running", conditions=[
+            client.V1PodCondition(type="PodScheduled", status="True", last_transition_time=created + timedelta(seconds=2))])
+        pod_details.metadata.creation_timestamp = created
+        state = client.V1ContainerState(running=client.V1ContainerStateRunning(started_at=created + timedelta(seconds=7)))
+        pod_details.status.container_statuses = [
+            client.V1ContainerStatus(name="c", image="i", image_id="", ready=True, restart_count=0, state=state)]
+        pod._trace_startup_phases(pod_details)
+        events = {event["name"]: event for event in tracer.events}
+        self.assertEqual(events["pod.scheduling"]["dur"], 2000000)
+        self.assertEqual(events["pod.image_pull_and_start"]["dur"], 5000000)
+
+
+if __name__ == '__main__':
+    unittest.main()
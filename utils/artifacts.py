@@ -0,0 +1,157 @@
+from utils.common import PipelinesException
+from utils.sync import hash_file
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+
+# Written into the artifacts directory, describes every archived artifact.
+MANIFEST_FILE = "artifacts_manifest.json"
+ARTIFACT_STORE_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python-pipelines", "artifacts")
+ARTIFACT_STORE_MAX_BYTES: int = 2**30
+# Blobs not used by any run for this many seconds are evicted.
+ARTIFACT_STORE_MAX_AGE: float = 14 * 24 * 3600.0
+READ_ONLY_MASK: int = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+_manifest_lock = threading.Lock()
+
+
+def file_entries(artifacts_dir: str, name: str) -> dict:
+    """
+    Returns {path relative to `artifacts_dir`: {"size", "sha256"}} of all files of
+    artifact `name` (file or dir) in `artifacts_dir`.
+    """
+    path = os.path.join(artifacts_dir, name)
+    if not os.path.isdir(path):
+        return {name: {"size": os.path.getsize(path), "sha256": hash_file(path)}} if os.path.isfile(path) else {}
+    entries = {}
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if os.path.isfile(file_path) and not os.path.islink(file_path):
+                entries[os.path.relpath(file_path, artifacts_dir).replace(os.sep, "/")] = \
+                    {"size": os.path.getsize(file_path), "sha256": hash_file(file_path)}
+    return dict(sorted(entries.items()))
+
+
+def artifact_entry(artifacts_dir: str, name: str, source: str, origin: str) -> dict:
+    """
+    Describes artifact `name` archived from `source` path of `origin` (pod name or "local").
+    """
+    files = file_entries(artifacts_dir, name)
+    return {"source": source, "origin": origin, "size": sum(entry["size"] for entry in files.values()), "files": files}
+
+
+def read_manifest(artifacts_dir: str) -> dict:
+    try:
+        with open(os.path.join(artifacts_dir, MANIFEST_FILE), "r") as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {"artifacts": {}}
+
+
+def update_manifest(artifacts_dir: str, artifacts: dict) -> None:
+    """
+    Adds (or replaces) entries of given artifacts in MANIFEST_FILE of `artifacts_dir`.
+    """
+    with _manifest_lock:
+        manifest = read_manifest(artifacts_dir)
+        manifest["artifacts"].update(artifacts)
+        temp_path = os.path.join(artifacts_dir, f".{MANIFEST_FILE}.{os.getpid()}.{threading.get_ident()}")
+        with open(temp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(temp_path, os.path.join(artifacts_dir, MANIFEST_FILE))
+
+
+class ArtifactStore:
+    """
+    Local store of artifact files keyed by their sha256, shared by all runs. Files are
+    materialized into the artifacts directory as hardlinks of read-only blobs, so an
+    output identical to one of an earlier run (or of another branch) is neither
+    downloaded nor stored twice. Blobs not used for `max_age` seconds, and then the
+    least recently used ones above `max_bytes` in total, are evicted by `evict`.
+    """
+
+    def __init__(self, path: str = ARTIFACT_STORE_DEFAULT_PATH, max_bytes: int = ARTIFACT_STORE_MAX_BYTES,
+                 max_age: float = ARTIFACT_STORE_MAX_AGE):
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.max_age: float = max_age
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return os.path.isfile(self.blob_path(digest))
+
+    def add(self, path: str, digest: str = None) -> str:
+        """
+        Stores file at `path` (which is then replaced by a hardlink of the blob) and returns
+        its digest. `digest` is verified when given, a file which doesn't match it is left
+        alone and PipelinesException is raised.
+        """
+        actual_digest = hash_file(path)
+        if digest is not None and actual_digest != digest:
+            raise PipelinesException(f"Checksum of {path} is {actual_digest}, expected {digest}")
+        blob_path = self.blob_path(actual_digest)
+        if not os.path.isfile(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            staging_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}"
+            shutil.copy2(path, staging_path)
+            os.chmod(staging_path, os.stat(staging_path).st_mode & ~READ_ONLY_MASK)
+            os.replace(staging_path, blob_path)
+        self.materialize(actual_digest, path)
+        return actual_digest
+
+    def materialize(self, digest: str, target_path: str) -> None:
+        """
+        Places blob of `digest` at `target_path` as a hardlink, or a copy when the store is
+        on another filesystem, and marks the blob as used.
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+        staging_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.link(blob_path, staging_path)
+        except OSError:
+            shutil.copy2(blob_path, staging_path)
+        os.replace(staging_path, target_path)
+        os.utime(blob_path)
+
+    def ingest(self, artifacts_dir: str) -> dict:
+        """
+        Stores all files of `artifacts_dir`, so identical ones share a single blob.
+        Returns {path relative to `artifacts_dir`: digest}.
+        """
+        digests = {}
+        for dir_path, _, file_names in os.walk(artifacts_dir):
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                if os.path.isfile(file_path) and not os.path.islink(file_path) and file_name != MANIFEST_FILE:
+                    digests[os.path.relpath(file_path, artifacts_dir).replace(os.sep, "/")] = self.add(file_path)
+        return digests
+
+    def evict(self) -> dict:
+        """
+        Removes blobs older than `max_age`, then the least recently used ones until the
+        store fits into `max_bytes`. Returns {"blobs", "bytes"} left and {"evicted"} count.
+        """
+        blobs = []
+        if os.path.isdir(self.path):
+            for prefix in os.scandir(self.path):
+                if prefix.is_dir():
+                    blobs.extend(entry for entry in os.scandir(prefix.path) if entry.is_file() and "." not in entry.name)
+        blobs.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        now = time.time()
+        kept, total, evicted = 0, 0, 0
+        for entry in blobs:
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age or total + stat.st_size > self.max_bytes:
+                os.remove(entry.path)
+                evicted += 1
+            else:
+                kept += 1
+                total += stat.st_size
+        return {"blobs": kept, "bytes": total, "evicted": evicted}
@@ -1,6 +1,7 @@
 import random
 import subprocess
 import base64
+import glob
 import os
 import shutil
 from utils.environment import env
@@ -56,6 +57,34 @@ def archive_artifact(path) -> None:
     else:
         shutil.copytree(path, target_path)
 
+def archive_artifacts(paths: list) -> dict:
+    """
+    Copies local files or dirs matching given paths or globs into the artifacts directory
+    and records their sizes and checksums in the artifacts manifest.
+    """
+    from utils.artifacts import artifact_entry, update_manifest
+    artifacts_dir_path: str = env["general"]["artifacts_path"]
+    matches: list = []
+    for path in paths:
+        found = sorted(glob.glob(path)) if glob.has_magic(path) else [path] if os.path.exists(path) else []
+        if not found:
+            raise ArtifactNotExistsException(
+                f"Attempted to create an artifact from {path} which doesn't exist")
+        matches.extend(match for match in found if match not in matches)
+    if not os.path.exists(artifacts_dir_path):
+        os.mkdir(artifacts_dir_path)
+    artifacts: dict = {}
+    for match in matches:
+        target_name = os.path.basename(os.path.normpath(match))
+        target_path = os.path.join(artifacts_dir_path, target_name)
+        if os.path.isfile(match):
+            shutil.copy(match, target_path)
+        else:
+            shutil.copytree(match, target_path, dirs_exist_ok=True)
+        artifacts[target_name] = artifact_entry(artifacts_dir_path, target_name, os.path.abspath(match), "local")
+    update_manifest(artifacts_dir_path, artifacts)
+    return artifacts
+
 class PipelinesException(Exception):
     pass
 
@@ -1,4 +1,5 @@
 import logging
+import threading
 from utils.environment import env
 
 logging.basicConfig(format='%(asctime)s: %(message)s')
@@ -6,20 +7,40 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 class Logger:
+    _local = threading.local()
+
+    @classmethod
+    def set_prefix(cls, prefix: str) -> None:
+        """
+        Sets prefix added to every line logged from the current thread,
+        used to tell apart output of parallel branches.
+        """
+        cls._local.prefix = prefix
+
+    @classmethod
+    def get_prefix(cls) -> str:
+        return getattr(cls._local, "prefix", "")
+
+    @classmethod
+    def add_prefix(cls, text):
+        prefix = cls.get_prefix()
+        if not prefix:
+            return text
+        return "\n".join(f"{prefix}{line}" for line in str(text).split("\n"))
 
     @classmethod
     def mask_secret_text(cls, text):
+        """
+        Replaces secret values registered in env["general"]["secrets"] (and their
+        encoded forms) with asterisks, see SecretMasker.
+        """
         if "general" in env and "secrets" in env["general"] and len(env["general"]["secrets"]) != 0:
-            length = len(text)
-            masked_text = "*"*length
-            print("Warning! Passed unmasked secret to Logger! Auto-masking it!")
-            return masked_text
+            return env["general"]["secrets"].mask(str(text))
         return text
 
-
     @classmethod
     def debug(cls, text):
-        text = cls.mask_secret_text(text)
+        text = cls.add_prefix(cls.mask_secret_text(text))
         if env["general"]["relocated_env"]:
             print(text, flush=True)
         else:
@@ -27,7 +48,7 @@ class Logger:
 
     @classmethod
     def info(cls, text):
-        text = cls.mask_secret_text(text)
+        text = cls.add_prefix(cls.mask_secret_text(text))
         if env["general"]["relocated_env"]:
             print(text, flush=True)
         else:
@@ -35,7 +56,7 @@ class Logger:
 
     @classmethod
     def warning(cls, text):
-        text = cls.mask_secret_text(text)
+        text = cls.add_prefix(cls.mask_secret_text(text))
         if env["general"]["relocated_env"]:
             print(text, flush=True)
         else:
@@ -43,7 +64,7 @@ class Logger:
 
     @classmethod
     def error(cls, text):
-        text = cls.mask_secret_text(text)
+        text = cls.add_prefix(cls.mask_secret_text(text))
         if env["general"]["relocated_env"]:
             print(text, flush=True)
         else:
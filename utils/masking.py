@@ -0,0 +1,95 @@
+import base64
+import collections
+import re
+import threading
+import urllib.parse
+
+# Encoded forms shorter than this are not masked, they would match too much of unrelated text.
+MIN_ENCODED_LENGTH: int = 4
+
+
+def _base64_forms(value: bytes) -> set:
+    """
+    Returns base64 of value as it appears at each of the three possible offsets
+    in a longer base64 encoded text, each trimmed to characters depending only on value.
+    """
+    forms = set()
+    for shift in range(3):
+        for encode in [base64.b64encode, base64.urlsafe_b64encode]:
+            encoded = encode(b"\0" * shift + value).decode("ascii")
+            start = -(-shift * 8 // 6)
+            end = (shift + len(value)) * 8 // 6
+            forms.add(encoded[start:end])
+    return forms
+
+
+def secret_forms(value: str) -> set:
+    """
+    Returns all strings under which given secret value can show up in logs: value itself,
+    its base64 and URL encoded forms and, for multi-line values, each of their lines,
+    as logs are written line by line.
+    """
+    forms = {value}
+    forms.update(_base64_forms(value.encode("utf-8")))
+    forms.update([urllib.parse.quote(value), urllib.parse.quote(value, safe=""), urllib.parse.quote_plus(value)])
+    forms.update(line for line in value.splitlines() if line.strip())
+    return {form for form in forms if form == value or len(form) >= MIN_ENCODED_LENGTH}
+
+
+class SecretMasker:
+    """
+    Set of secret values registered in env["general"]["secrets"], masking their
+    occurrences in text with asterisks of the same length. All forms of all values
+    are matched with a single combined regex, so masking takes one pass over the
+    text; it is recompiled lazily only after the set of values changes.
+    Values are reference counted, a value added twice stays masked until it is
+    removed twice, so nested or concurrent users don't unregister each other's values.
+    """
+
+    def __init__(self):
+        self._values: collections.Counter = collections.Counter()
+        self._version: int = 0
+        self._pattern = None
+        self._pattern_version: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, value: str) -> None:
+        with self._lock:
+            if not value:
+                return
+            self._values[value] += 1
+            if self._values[value] == 1:
+                self._version += 1
+
+    def remove(self, value: str) -> None:
+        with self._lock:
+            if value not in self._values:
+                return
+            self._values[value] -= 1
+            if self._values[value] == 0:
+                del self._values[value]
+                self._version += 1
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _get_pattern(self):
+        with self._lock:
+            if self._pattern_version != self._version:
+                forms = set()
+                for value in self._values:
+                    forms.update(secret_forms(value))
+                # longest first, so a form containing another one is masked as a whole
+                self._pattern = re.compile("|".join(re.escape(form) for form in sorted(forms, key=len, reverse=True))) \
+                    if forms else None
+                self._pattern_version = self._version
+            return self._pattern
+
+    def mask(self, text: str) -> str:
+        pattern = self._get_pattern()
+        if pattern is None:
+            return text
+        return pattern.sub(lambda match: "*" * len(match.group()), text)
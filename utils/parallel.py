@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_EXCEPTION, wait
+from utils.common import PipelinesException
+from utils.logger import Logger
+import threading
+
+_local = threading.local()
+
+def raise_if_cancelled() -> None:
+    """
+    Raises BranchCancelledException if called from a branch of `parallel` which
+    was cancelled because other branch failed. Pod.exec calls it before every
+    command, so fail-fast stops cancelled branches at the next command.
+    """
+    cancelled: threading.Event = getattr(_local, "cancelled", None)
+    if cancelled is not None and cancelled.is_set():
+        raise BranchCancelledException(f"Branch {_local.name} cancelled as other branch failed")
+
+def run_branch(name: str, branch, cancelled: threading.Event, parent_prefix: str = ""):
+    """
+    Calls `branch` in the current thread as a branch named `name`: its log lines
+    are prefixed with the name and raise_if_cancelled raises once `cancelled` is set.
+    """
+    previous = (getattr(_local, "name", None), getattr(_local, "cancelled", None))
+    _local.name, _local.cancelled = name, cancelled
+    Logger.set_prefix(f"{parent_prefix}[{name}] ")
+    try:
+        raise_if_cancelled()
+        return branch()
+    finally:
+        _local.name, _local.cancelled = previous
+        Logger.set_prefix(parent_prefix)
+
+def parallel(branches: dict, fail_fast: bool = True, max_workers: int = 8) -> dict:
+    """
+    Runs named branches concurrently, similar to Jenkins `parallel` step:
+
+        def build_ubuntu():
+            with Pod("ubuntu2204") as ubuntu:
+                return ubuntu.exec("make")["ret_val"]
+
+        results = parallel({"ubuntu": build_ubuntu, "busybox": build_busybox})
+
+    `branches` maps branch name to a callable taking no arguments, which usually
+    spawns its own Pod. At most `max_workers` branches run at once. Every line
+    logged by a branch is prefixed with its name. With `fail_fast` the first
+    failure cancels branches which haven't started yet and stops running ones
+    at their next Pod.exec, otherwise all branches run to the end. Returns dict
+    of branch names and values returned by them, raises ParallelException when
+    any branch failed.
+    """
+    cancelled = threading.Event()
+    parent_prefix = Logger.get_prefix()
+
+    def _run_branch(name: str, branch):
+        return run_branch(name, branch, cancelled, parent_prefix)
+
+    results: dict = {}
+    failures: dict = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(branches))), thread_name_prefix="parallel") as executor:
+        futures: dict = {executor.submit(_run_branch, name, branch): name for name, branch in branches.items()}
+        pending: set = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future: Future
+                name = futures[future]
+                if future.cancelled():
+                    failures[name] = BranchCancelledException(f"Branch {name} cancelled as other branch failed")
+                    continue
+                exception = future.exception()
+                if exception is None:
+                    results[name] = future.result()
+                    continue
+                failures[name] = exception
+                if isinstance(exception, BranchCancelledException):
+                    continue
+                Logger.error(f"Branch {name} failed: {exception}")
+                if fail_fast and not cancelled.is_set():
+                    cancelled.set()
+                    for pending_future in pending:
+                        pending_future.cancel()
+
+    if failures:
+        raise ParallelException(failures, results)
+    return results
+
+
+class BranchCancelledException(PipelinesException):
+    pass
+
+
+class ParallelException(PipelinesException):
+
+    def __init__(self, failures: dict, results: dict):
+        self.failures: dict = failures
+        self.results: dict = results
+        failed = [name for name, exception in failures.items() if not isinstance(exception, BranchCancelledException)]
+        cancelled = [name for name in failures if name not in failed]
+        message = f"Parallel branches failed: {', '.join(failed)}"
+        if cancelled:
+            message += f" (cancelled: {', '.join(cancelled)})"
+        super().__init__(message)
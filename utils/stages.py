@@ -0,0 +1,270 @@
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from utils.common import PipelinesException
+from utils.logger import Logger
+from utils.parallel import run_branch, BranchCancelledException
+from utils.tracing import span
+import threading
+import time
+
+STAGE_STATUSES = ["succeeded", "failed", "skipped", "cancelled"]
+
+
+class Stage:
+    """
+    Node of Stages graph, created with Stages.stage. After Stages.run `status` is
+    one of STAGE_STATUSES and times are seconds since start of the run.
+    """
+
+    def __init__(self, name: str, function, needs: list, pod: str, pods: int, estimate: float, when, always: bool):
+        self.name: str = name
+        self.function = function
+        self.needs: list = needs
+        self.pod: str = pod
+        self.pods: int = pods
+        self.estimate: float = estimate
+        self.when = when
+        self.always: bool = always
+        # estimated seconds from start of this stage to the end of the pipeline
+        self.priority: float = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self.status: str = None
+        self.reason: str = ""
+        self.result = None
+        self.exception: Exception = None
+        self.ready_at: float = None
+        self.started_at: float = None
+        self.finished_at: float = None
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def run(self):
+        if self.pod is None:
+            return self.function()
+        from k8s.pod import Pod
+        with Pod(self.pod) as pod:
+            return self.function(pod)
+
+
+class Stages:
+    """
+    Pipeline declared as a graph of stages, each running once all stages it needs
+    have succeeded:
+
+        stages = Stages(max_pods=3)
+
+        @stages.stage(pod="ubuntu2204")
+        def build(ubuntu):
+            ubuntu.exec("make")
+
+        @stages.stage(needs=[build], pod="ubuntu2204")
+        def unit(ubuntu):
+            ubuntu.exec("make test")
+
+        @stages.stage(needs=[unit, lint, package], always=True)
+        def publish():
+            ...
+
+        results = stages.run()
+
+    Ready stages run concurrently as long as pods they hold fit into `max_pods`,
+    stages with the longest estimated path to the end of the pipeline first. A
+    stage whose dependency failed or was skipped is skipped too, unless it is
+    declared with `always`. With `fail_fast` the first failure cancels stages
+    which haven't started yet and stops running ones at their next Pod.exec.
+    """
+
+    def __init__(self, max_pods: int = 4, fail_fast: bool = True):
+        self.max_pods: int = max_pods
+        self.fail_fast: bool = fail_fast
+        self.stages: dict = {}
+        self.report: str = ""
+
+    def stage(self, name: str = None, needs: list = (), pod: str = None, pods: int = None, estimate: float = 1.0,
+              when=None, always: bool = False):
+        """
+        Decorator adding function as a stage. `needs` lists stages (names or decorated
+        functions) which must finish first. With `pod` the function is called with
+        a spawned Pod of that template, otherwise without arguments. `pods` is the
+        number of pods the stage holds at once (1 with `pod`, else 0), `estimate`
+        its expected duration in seconds used to find the critical path. `when` is
+        called once the stage is ready, the stage is skipped if it returns False.
+        """
+        def decorator(function):
+            stage_name = name or function.__name__
+            if stage_name in self.stages:
+                raise StageGraphException(f"Stage {stage_name} is already defined")
+            stage_pods = pods if pods is not None else (1 if pod is not None else 0)
+            self.stages[stage_name] = Stage(stage_name, function, [getattr(need, "stage_name", need) for need in needs],
+                                            pod, stage_pods, estimate, when, always)
+            function.stage_name = stage_name
+            return function
+        return decorator
+
+    def _topological_order(self) -> list:
+        for stage in self.stages.values():
+            for need in stage.needs:
+                if need not in self.stages:
+                    raise StageGraphException(f"Stage {stage.name} needs unknown stage {need}")
+        order = []
+        remaining = {name: len(stage.needs) for name, stage in self.stages.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in self.stages.values():
+                if name in dependent.needs:
+                    remaining[dependent.name] -= 1
+                    if remaining[dependent.name] == 0:
+                        ready.append(dependent.name)
+        if len(order) != len(self.stages):
+            cycle = [name for name in self.stages if name not in order]
+            raise StageGraphException(f"Stages form a cycle: {', '.join(cycle)}")
+        return order
+
+    def _compute_priorities(self, order: list) -> None:
+        for name in reversed(order):
+            stage: Stage = self.stages[name]
+            dependents = [dependent.priority for dependent in self.stages.values() if name in dependent.needs]
+            stage.priority = stage.estimate + max(dependents, default=0.0)
+
+    def _resolve(self, stage: Stage, cancelled: threading.Event, now: float) -> bool:
+        """
+        Decides what to do with a stage whose dependencies have finished: marks it as
+        skipped or cancelled, or returns True when it should run.
+        """
+        if cancelled.is_set() and not stage.always:
+            stage.status, stage.reason = "cancelled", "other stage failed"
+        elif stage.ready_at is not None:
+            return True
+        elif not stage.always and any(self.stages[need].status != "succeeded" for need in stage.needs):
+            need = next(need for need in stage.needs if self.stages[need].status != "succeeded")
+            stage.status, stage.reason = "skipped", f"{need} {self.stages[need].status}"
+        elif stage.when is not None and not stage.when():
+            stage.status, stage.reason = "skipped", "condition not met"
+        else:
+            stage.ready_at = now
+            return True
+        stage.finished_at = now
+        Logger.info(f"Stage {stage.name} {stage.status}: {stage.reason}")
+        return False
+
+    def run(self) -> dict:
+        """
+        Runs all stages, logs timing report (also kept in `report`) and returns dict
+        of stage names and values returned by succeeded stages. Raises StagesException
+        when any stage failed.
+        """
+        self._compute_priorities(self._topological_order())
+        for stage in self.stages.values():
+            stage.reset()
+        cancelled = threading.Event()
+        parent_prefix = Logger.get_prefix()
+        start = time.monotonic()
+
+        def _run_stage(stage: Stage):
+            stage.started_at = time.monotonic() - start
+            with span("stage", stage=stage.name, pod_template=stage.pod):
+                return run_branch(stage.name, stage.run, cancelled, parent_prefix)
+
+        waiting: list = list(self.stages.values())
+        running: dict = {}
+        pods_in_use = 0
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stages)), thread_name_prefix="stage") as executor:
+            while waiting or running:
+                now = time.monotonic() - start
+                ready = []
+                resolved = True
+                while resolved:
+                    resolved = False
+                    for stage in list(waiting):
+                        if stage.ready_at is None and \
+                                any(self.stages[need].status is None for need in stage.needs):
+                            continue
+                        if self._resolve(stage, cancelled, now):
+                            if stage not in ready:
+                                ready.append(stage)
+                        else:
+                            waiting.remove(stage)
+                            resolved = True
+                for stage in sorted(ready, key=lambda ready_stage: -ready_stage.priority):
+                    # a stage larger than the whole budget runs alone instead of never
+                    stage_pods = min(stage.pods, self.max_pods)
+                    if pods_in_use + stage_pods > self.max_pods:
+                        continue
+                    pods_in_use += stage_pods
+                    waiting.remove(stage)
+                    running[executor.submit(_run_stage, stage)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future: Future
+                    stage: Stage = running.pop(future)
+                    pods_in_use -= min(stage.pods, self.max_pods)
+                    stage.finished_at = time.monotonic() - start
+                    stage.exception = future.exception()
+                    if stage.exception is None:
+                        stage.status, stage.result = "succeeded", future.result()
+                    elif isinstance(stage.exception, BranchCancelledException):
+                        stage.status, stage.reason = "cancelled", "other stage failed"
+                    else:
+                        stage.status, stage.reason = "failed", str(stage.exception)
+                        Logger.error(f"Stage {stage.name} failed: {stage.exception}")
+                        if self.fail_fast:
+                            cancelled.set()
+
+        self.report = self._report(time.monotonic() - start)
+        Logger.info(f"Stages report:\n{self.report}")
+        results = {name: stage.result for name, stage in self.stages.items() if stage.status == "succeeded"}
+        failures = {name: stage.exception for name, stage in self.stages.items() if stage.status == "failed"}
+        if failures:
+            raise StagesException(failures, results)
+        return results
+
+    def critical_path(self) -> list:
+        """
+        Returns names of stages which determined wall-clock time of the last run:
+        the last finished stage, the dependency which finished last before it, and so on.
+        """
+        ran = [stage for stage in self.stages.values() if stage.started_at is not None]
+        if not ran:
+            return []
+        path = [max(ran, key=lambda stage: stage.finished_at)]
+        while True:
+            needs = [self.stages[need] for need in path[-1].needs if self.stages[need].started_at is not None]
+            if not needs:
+                break
+            path.append(max(needs, key=lambda stage: stage.finished_at))
+        return [stage.name for stage in reversed(path)]
+
+    def _report(self, wall_clock: float) -> str:
+        critical_path = self.critical_path()
+        lines = [f"{'stage':<30} {'status':<10} {'start s':>9} {'waited s':>9} {'took s':>9}  critical"]
+        for stage in sorted(self.stages.values(), key=lambda stage: (stage.started_at is None, stage.started_at or 0)):
+            started = f"{stage.started_at:9.1f}" if stage.started_at is not None else f"{'-':>9}"
+            waited = f"{stage.started_at - stage.ready_at:9.1f}" if stage.started_at is not None else f"{'-':>9}"
+            line = f"{stage.name:<30} {stage.status:<10} {started} {waited} {stage.duration:9.1f}  " + \
+                ("*" if stage.name in critical_path else "")
+            lines.append(line.rstrip() + (f" ({stage.reason})" if stage.status in ["skipped", "cancelled"] else ""))
+        on_path = sum(self.stages[name].duration for name in critical_path)
+        lines.append(f"Wall-clock {wall_clock:.1f}s, critical path {' -> '.join(critical_path) or '-'} "
+                     f"took {on_path:.1f}s, {wall_clock - on_path:.1f}s spent waiting for pods or scheduling")
+        return "\n".join(lines)
+
+
+class StageGraphException(PipelinesException):
+    pass
+
+
+class StagesException(PipelinesException):
+
+    def __init__(self, failures: dict, results: dict):
+        self.failures: dict = failures
+        self.results: dict = results
+        super().__init__(f"Stages failed: {', '.join(failures)}")
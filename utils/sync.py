@@ -0,0 +1,174 @@
+import fnmatch
+import hashlib
+import os
+import posixpath
+import re
+
+# Always left out of synced trees, independently of .gitignore.
+DEFAULT_SYNC_EXCLUDES = [".git/"]
+HASH_CHUNK_SIZE: int = 1024 * 1024
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """
+    Translates a gitignore style glob (without negation and trailing slash) into
+    a regex matched against whole relative paths.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = ""
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+        elif pattern.startswith("**", index):
+            regex += ".*"
+            index += 2
+        elif pattern[index] == "*":
+            regex += "[^/]*"
+            index += 1
+        elif pattern[index] == "?":
+            regex += "[^/]"
+            index += 1
+        elif pattern[index] == "[" and "]" in pattern[index + 1:]:
+            end = pattern.index("]", index + 1)
+            regex += fnmatch.translate(pattern[index:end + 1])[4:-3]
+            index = end + 1
+        else:
+            regex += re.escape(pattern[index])
+            index += 1
+    return regex if anchored else "(?:.*/)?" + regex
+
+
+class _Rule:
+
+    def __init__(self, pattern: str, base: str = ""):
+        self.negate: bool = pattern.startswith("!")
+        pattern = pattern[1:] if self.negate else pattern
+        self.dir_only: bool = pattern.endswith("/")
+        self.base: str = base
+        self.regex = re.compile(_glob_to_regex(pattern.rstrip("/")))
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return False
+            path = path[len(self.base) + 1:]
+        return self.regex.fullmatch(path) is not None
+
+
+class SyncFilter:
+    """
+    Decides which files of a local tree take part in a sync. Rules of .gitignore
+    files found in the tree are applied (when `gitignore` is set), followed by
+    DEFAULT_SYNC_EXCLUDES and `exclude` globs in the same syntax. When `include`
+    globs are given, only files matching one of them are synced. All paths are
+    relative to `root` and use "/" as separator.
+    """
+
+    def __init__(self, root: str, include: list = None, exclude: list = None, gitignore: bool = True):
+        self.root: str = root
+        self.gitignore: bool = gitignore
+        self._gitignore_rules: list = []
+        self._exclude_rules: list = [_Rule(pattern) for pattern in DEFAULT_SYNC_EXCLUDES + list(exclude or [])]
+        self._include_rules: list = [_Rule(pattern) for pattern in include or []]
+
+    def _load_gitignore(self, directory: str) -> None:
+        path = os.path.join(self.root, directory, ".gitignore")
+        if not self.gitignore or not os.path.isfile(path):
+            return
+        with open(path, "r", errors="replace") as gitignore:
+            for line in gitignore.read().splitlines():
+                line = line.rstrip()
+                if line and not line.startswith("#"):
+                    self._gitignore_rules.append(_Rule(line, directory))
+
+    def excluded(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Checks path itself, not the directories above it.
+        """
+        excluded = False
+        for rule in self._gitignore_rules + self._exclude_rules:
+            if rule.matches(path, is_dir):
+                excluded = not rule.negate
+        if not excluded and not is_dir and self._include_rules:
+            excluded = not any(rule.matches(path, False) for rule in self._include_rules)
+        return excluded
+
+    def excluded_path(self, path: str) -> bool:
+        """
+        Same as `excluded` for a file, but also checks all directories above it.
+        """
+        parts = path.split("/")
+        return any(self.excluded("/".join(parts[:depth]), is_dir=True) for depth in range(1, len(parts))) \
+            or self.excluded(path)
+
+    def walk(self):
+        """
+        Yields relative paths of all synced files.
+        """
+        for directory, dirnames, filenames in os.walk(self.root):
+            relative_dir = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            relative_dir = "" if relative_dir == "." else relative_dir
+            self._load_gitignore(relative_dir)
+            prefix = f"{relative_dir}/" if relative_dir else ""
+            dirnames[:] = sorted(name for name in dirnames if not self.excluded(prefix + name, is_dir=True))
+            for name in sorted(filenames):
+                if not self.excluded(prefix + name):
+                    yield prefix + name
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def local_manifest(sync_filter: SyncFilter) -> dict:
+    """
+    Returns {relative path: sha256} of all files synced by given filter.
+    """
+    return {path: hash_file(os.path.join(sync_filter.root, path)) for path in sync_filter.walk()}
+
+
+def parse_sha256sum_output(output: str) -> dict:
+    """
+    Parses `sha256sum` output of files listed with `find .` into a manifest.
+    Names escaped by sha256sum (containing a newline or backslash) are skipped,
+    so such files are always sent again.
+    """
+    manifest = {}
+    for line in output.splitlines():
+        if line.startswith("\\") or "  " not in line:
+            continue
+        digest, path = line.split("  ", 1)
+        manifest[path[2:] if path.startswith("./") else path] = digest
+    return manifest
+
+
+def diff_manifests(local: dict, remote: dict) -> tuple:
+    """
+    Returns (changed, deleted): files to send and remote files missing locally.
+    """
+    changed = sorted(path for path, digest in local.items() if remote.get(path) != digest)
+    deleted = sorted(path for path in remote if path not in local)
+    return changed, deleted
+
+
+def parent_dirs(paths: list) -> list:
+    """
+    Returns all parent dirs of relative `paths`, deepest first, so each of them comes
+    before its own parent.
+    """
+    parents = set()
+    for path in paths:
+        parent = posixpath.dirname(path)
+        while parent and parent not in parents:
+            parents.add(parent)
+            parent = posixpath.dirname(parent)
+    return sorted(parents, key=lambda parent: (-parent.count("/"), parent))
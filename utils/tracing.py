@@ -0,0 +1,170 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_FILE = "trace.json"
+TRACE_SUMMARY_FILE = "trace_summary.txt"
+
+
+class Span:
+    """
+    Timed part of the run. Attributes set with `set` (byte counts, names) end up
+    in the trace next to the span duration.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer: Tracer = tracer
+        self.name: str = name
+        self.attributes: dict = attributes
+        self.parent: Span = None
+        self.start: float = 0.0
+        self._token = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, value: int) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        end = time.time()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.record(self, end)
+
+
+class _NoopSpan:
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def add(self, key: str, value: int) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("pipelines_span", default=None)
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace (Perfetto) complete events. Disabled by default,
+    then `span` returns a shared no-op span, so instrumented code pays only for
+    a single attribute check.
+    """
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.events: list = []
+        self._lock: threading.Lock = threading.Lock()
+        self._pid: int = os.getpid()
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current_span(self):
+        span = _current_span.get() if self.enabled else None
+        return span if span is not None else _NOOP_SPAN
+
+    def record(self, span: Span, end: float) -> None:
+        args = dict(span.attributes)
+        if span.parent is not None:
+            args["parent"] = span.parent.name
+        self.add_event(span.name, span.start, end, args)
+
+    def add_event(self, name: str, start: float, end: float, args: dict = None, thread_id: int = None) -> None:
+        """
+        Records span which timing is known only afterwards, like phases reported by API server.
+        `start` and `end` are epoch seconds.
+        """
+        event = {"name": name, "ph": "X", "ts": int(start * 1e6), "dur": max(0, int((end - start) * 1e6)),
+                 "pid": self._pid, "tid": thread_id if thread_id is not None else threading.get_ident(),
+                 "args": args or {}}
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> list:
+        """
+        Returns rows of (name, count, total seconds, mean seconds, max seconds, bytes), slowest first.
+        """
+        totals: dict = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            count, total, longest, size = totals.get(event["name"], (0, 0, 0, 0))
+            totals[event["name"]] = (count + 1, total + event["dur"], max(longest, event["dur"]),
+                                     size + event["args"].get("bytes", 0))
+        rows = [(name, count, total / 1e6, total / count / 1e6, longest / 1e6, size)
+                for name, (count, total, longest, size) in totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def write(self, directory: str, prefix: str = "") -> None:
+        """
+        Writes TRACE_FILE (open it in chrome://tracing or ui.perfetto.dev) and TRACE_SUMMARY_FILE,
+        with names prefixed by `prefix`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(os.path.join(directory, prefix + TRACE_FILE), "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        lines = [f"{'span':<40} {'count':>7} {'total s':>10} {'mean s':>10} {'max s':>10} {'bytes':>14}"]
+        for name, count, total, mean, longest, size in self.summary():
+            lines.append(f"{name:<40} {count:>7} {total:>10.3f} {mean:>10.3f} {longest:>10.3f} {size:>14}")
+        with open(os.path.join(directory, prefix + TRACE_SUMMARY_FILE), "w") as summary_file:
+            summary_file.write("\n".join(lines) + "\n")
+
+
+tracer = Tracer()
+
+
+def enable_tracing(directory: str, prefix: str = "") -> None:
+    """
+    Starts collecting spans and writes them into `directory` (typically the
+    artifacts directory) at process exit.
+    """
+    if not tracer.enabled:
+        tracer.enabled = True
+        atexit.register(tracer.write, directory, prefix)
+
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    return tracer.current_span()
+
+
+def traced(name: str):
+    """
+    Decorator wrapping pod method in a span tagged with pod and template name.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not tracer.enabled:
+                return method(self, *args, **kwargs)
+            with tracer.span(name, pod=self.name, template=self.pod_template_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator